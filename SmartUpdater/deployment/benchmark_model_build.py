@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import argparse
+import time
+import numpy as np
+import optimization_partition
+from usage_matrix import BitMatrix
+
+
+TYPES = ["uint256", "uint8", "address", "bool", "string", "mapping"]
+
+
+def random_instance(n_states, n_funcs, density, n_relations, rng):
+    S = BitMatrix.from_dense(rng.random((n_funcs, n_states)) < density)
+    T = [TYPES[t] for t in rng.integers(len(TYPES), size=n_states)]
+    pairs = rng.integers(n_states, size=(n_relations, 2))
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    C = BitMatrix.from_pairs(pairs[:, 0], pairs[:, 1], n_states, n_states)
+    return S, T, C
+
+
+def model_signature(m):
+    """
+    Everything that defines the model, with terms merged and sorted so that
+    term order inside a row does not matter.
+    """
+    m.update()
+    variables = [(v.VarName, v.VType, v.LB, v.UB, v.Obj) for v in m.getVars()]
+
+    def linear_terms(expr):
+        terms = {}
+        for k in range(expr.size()):
+            idx = expr.getVar(k).index
+            terms[idx] = terms.get(idx, 0) + expr.getCoeff(k)
+        return sorted((idx, coeff) for idx, coeff in terms.items() if coeff != 0)
+
+    def quad_terms(expr):
+        terms = {}
+        for k in range(expr.size()):
+            pair = tuple(sorted((expr.getVar1(k).index, expr.getVar2(k).index)))
+            terms[pair] = terms.get(pair, 0) + expr.getCoeff(k)
+        return sorted((pair, coeff) for pair, coeff in terms.items() if coeff != 0), linear_terms(expr.getLinExpr())
+
+    constraints = [(c.ConstrName, c.Sense, c.RHS, linear_terms(m.getRow(c))) for c in m.getConstrs()]
+    quadratic = [(q.QCName, q.QCSense, q.QCRHS, quad_terms(m.getQCRow(q))) for q in m.getQConstrs()]
+    objective = linear_terms(m.getObjective())
+    return variables, constraints, quadratic, objective, m.ModelSense
+
+
+def time_builder(builder, S, T, C, N, repeat):
+    best = None
+    model = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model, _, _ = builder(S, T, C, N)
+        model.update()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, model
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the loop and matrix-API builders of the partition model")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10, 25, 50, 75],
+                        help="Numbers of state variables (functions scale with --funcs-ratio)")
+    parser.add_argument("--funcs-ratio", type=float, default=1.0, help="Functions per state variable")
+    parser.add_argument("--density", type=float, default=0.1, help="Probability that a function uses a state variable")
+    parser.add_argument("--relations", type=float, default=0.05, help="Initializer relations per state variable")
+    parser.add_argument("--repeat", type=int, default=3, help="Builds per builder; the fastest is reported")
+    parser.add_argument("--no-check", action="store_true", help="Skip checking that both builders produce the same model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    N = 13
+
+    print(f"{'states':>7} {'funcs':>6} {'vars':>8} {'constrs':>8} {'loop (s)':>10} {'matrix (s)':>11} {'speedup':>8} {'same':>5}")
+    for n_states in args.sizes:
+        n_funcs = max(1, int(round(n_states * args.funcs_ratio)))
+        S, T, C = random_instance(n_states, n_funcs, args.density, int(n_states * args.relations), rng)
+
+        loop_time, loop_model = time_builder(optimization_partition.build_partition_model, S, T, C, N, args.repeat)
+        matrix_time, matrix_model = time_builder(optimization_partition.build_partition_model_matrix, S, T, C, N,
+                                                 args.repeat)
+        same = '-' if args.no_check else str(model_signature(loop_model) == model_signature(matrix_model))
+
+        print(f"{n_states:>7} {n_funcs:>6} {matrix_model.NumVars:>8} {matrix_model.NumConstrs:>8} "
+              f"{loop_time:>10.3f} {matrix_time:>11.3f} {loop_time / matrix_time:>7.1f}x {same:>5}")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import numpy as np
+import optimization_partition
+import solver_backend
+from smartupdater_batch import DEFAULT_CORPUS
+from validate_formulation import corpus_instances, random_instances
+
+
+# slither 导入时会给根 logger 加上 handler，需要 force 才能生效
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s', force=True)
+log = logging.getLogger()
+
+
+def run_backends(instances, backends, N, out=None, profile=None):
+    """
+    Solve every instance with every backend. Returns per backend the solve
+    times and the number of solves whose objective differs from the first
+    backend's.
+    """
+    stats = {name: {'times': [], 'failed': 0, 'different': 0} for name in backends}
+    for source, S, T, C in instances:
+        record = {'source': source, 'n_states': len(T), 'n_funcs': len(S)}
+        reference = None
+        for name in backends:
+            try:
+                result = optimization_partition.solve_partition(S, T, C, N, name, profile=profile)
+            except solver_backend.SolverError as e:
+                record[name] = {'error': str(e)}
+                stats[name]['failed'] += 1
+                continue
+            record[name] = {key: result[key] for key in ('status', 'objective', 'bound', 'gap', 'nodes', 'runtime')}
+            if result['status'] != solver_backend.OPTIMAL:
+                stats[name]['failed'] += 1
+                continue
+            stats[name]['times'].append(result['runtime'])
+            if reference is None:
+                reference = result['objective']
+            elif abs(result['objective'] - reference) > 1e-6 * max(1.0, abs(reference)):
+                stats[name]['different'] += 1
+                log.warning("%s: %s objective %s, expected %s", source, name, result['objective'], reference)
+        if out:
+            out.write(json.dumps(record) + '\n')
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare solve times of the partition model across solver backends")
+    parser.add_argument("corpus", type=str, nargs='?', default=DEFAULT_CORPUS,
+                        help="Directory of Solidity sources (default: data/contract-info)")
+    parser.add_argument("--solvers", type=str, nargs='+', default=sorted(solver_backend.BACKENDS),
+                        choices=sorted(solver_backend.BACKENDS), help="Backends to compare")
+    parser.add_argument("--random", type=int, default=0, help="Use N random contracts instead of the corpus")
+    parser.add_argument("--max-states", type=int, default=20, help="Largest random contract")
+    parser.add_argument("--density", type=float, default=0.1, help="Probability that a function uses a state variable")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N corpus sources")
+    parser.add_argument("-N", type=int, default=13, help="Expected number of keys per mapping")
+    parser.add_argument("--log", type=str, default=None, help="Write one JSON line per contract to this file")
+    parser.add_argument("--time-limit", type=float, default=None, help="Time limit per solve, in seconds")
+    parser.add_argument("--mip-gap", type=float, default=None, help="Relative MIP gap at which a solve may stop")
+    parser.add_argument("--threads", type=int, default=None, help="Solver threads per solve")
+    args = parser.parse_args()
+    profile = solver_backend.SolveProfile(args.time_limit, args.mip_gap, args.threads, iis_path=None)
+
+    if args.random:
+        instances = random_instances(args.random, args.max_states, args.density, args.seed)
+    else:
+        instances = corpus_instances(args.corpus, args.limit)
+
+    out = open(args.log, 'w') if args.log else None
+    stats = run_backends(instances, args.solvers, args.N, out, profile)
+    if out:
+        out.close()
+
+    print(f"{'solver':>8} {'solved':>7} {'failed':>7} {'differ':>7} {'total (s)':>10} {'median (s)':>11} {'max (s)':>9}")
+    for name in args.solvers:
+        times = np.array(stats[name]['times'])
+        if len(times):
+            print(f"{name:>8} {len(times):>7} {stats[name]['failed']:>7} {stats[name]['different']:>7} "
+                  f"{times.sum():>10.3f} {np.median(times):>11.4f} {times.max():>9.3f}")
+        else:
+            print(f"{name:>8} {0:>7} {stats[name]['failed']:>7} {'-':>7} {'-':>10} {'-':>11} {'-':>9}")
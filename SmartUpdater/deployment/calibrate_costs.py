@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import json
+import logging
+import solidityVersion
+import local_evm
+from solidity_syntax import Syntax
+
+# 基础交易的固定开销，不计入迁移成本
+TX_BASE_GAS = 21000
+
+DEFAULT_TYPES = ['uint8', 'uint16', 'uint32', 'uint64', 'uint128', 'uint256', 'int8', 'int128', 'int256',
+                 'address', 'bool', 'bytes1', 'bytes4', 'bytes32', 'string', 'bytes', 'mapping']
+
+MAPPING_TYPE = 'mapping(address => uint256)'
+MAPPING_KEYS = ['0x' + '0' * 39 + str(i) for i in range(1, 4)]
+
+
+def sample_value(t):
+    """
+    A non-zero value of type t, as a Solidity literal and as a Python value.
+    """
+    if t.startswith('uint'):
+        return '1', 1
+    if t.startswith('int'):
+        return '-1', -1
+    if t == 'address':
+        return 'address(1)', '0x' + '0' * 39 + '1'
+    if t == 'bool':
+        return 'true', True
+    if t == 'string':
+        return '"calibration"', 'calibration'
+    if t == 'bytes':
+        return '"calibration"', b'calibration'
+    if t.startswith('bytes'):
+        return '"a"', b'a'.ljust(int(t[len('bytes'):]), b'\0')
+    raise ValueError(f"Cannot calibrate type {t}")
+
+
+def state_contract(syntax, name, t=None):
+    """
+    A State contract as generate_state_contract writes it, holding one
+    initialized variable of type t (or none).
+    """
+    code = f"contract {name} {{\n    address public logicContract;\n"
+    # 被测变量不与 logicContract 共用槽 0，紧凑存储的分摊由 CostModel 计算
+    code += "    uint256 private gap;\n"
+    if t == 'mapping':
+        code += f"    {MAPPING_TYPE} public v;\n"
+    elif t is not None:
+        code += f"    {t} public v = {sample_value(t)[0]};\n"
+    code += f"    {syntax.constructor_header(name, 'address _logicContract')} {{\n"
+    code += "        logicContract = _logicContract;\n    }\n"
+    code += f"    {syntax.fallback} {{\n"
+    code += "        address _impl = logicContract;\n        require(_impl != address(0));\n"
+    code += "        assembly {\n"
+    code += "            let ptr := mload(0x40)\n"
+    code += "            calldatacopy(ptr, 0, calldatasize())\n"
+    code += "            let result := delegatecall(gas(), _impl, ptr, calldatasize(), 0, 0)\n"
+    code += "            let size := returndatasize()\n"
+    code += "            returndatacopy(ptr, 0, size)\n"
+    code += "            switch result\n"
+    code += "            case 0 { revert(ptr, size) }\n"
+    code += "            default { return(ptr, size) }\n"
+    code += "        }\n    }\n"
+    code += "    function upgradeTo(address _newLogic) public {\n        logicContract = _newLogic;\n    }\n}\n"
+    return code
+
+
+def logic_contract(syntax, name, logged_mapping=False):
+    """
+    A Logic contract with no functions, or with the key event and the
+    logging setter generate_logic_contract writes for a mapping.
+    """
+    code = f"contract {name} {{\n    address public logicContract;\n"
+    if logged_mapping:
+        code += f"    {MAPPING_TYPE} public v;\n"
+        code += "    event vEvent (string contractname, address key);\n"
+        code += "    function set(address k, uint256 x) public {\n"
+        code += f"        v[k] = x;\n        {syntax.emit}vEvent(\"{name}\", k);\n    }}\n"
+    code += "}\n"
+    return code
+
+
+def slot_contract(syntax, name, t):
+    # 迁移时往新合约写入一个槽（mapping 为一个键），再从旧合约读出
+    code = f"contract {name} {{\n"
+    if t == 'mapping':
+        code += f"    {MAPPING_TYPE} public v;\n"
+        code += "    function set(address k, uint256 x) public { v[k] = x; }\n"
+    else:
+        code += f"    {t} public v;\n"
+        code += f"    function set({syntax.param(t, 'x')}) public {{ v = x; }}\n"
+    code += "}\n"
+    return code
+
+
+def contract_name(prefix, t):
+    return f"{prefix}_{t}"
+
+
+def calibration_sources(solc_version, types):
+    syntax = Syntax(solc_version)
+    sources = {
+        'Empty.sol': syntax.pragma + "contract CalEmpty {\n}\n",
+        'State.sol': syntax.pragma + state_contract(syntax, 'CalState'),
+        'Logic.sol': syntax.pragma + logic_contract(syntax, 'CalLogic'),
+        'LoggedLogic.sol': syntax.pragma + logic_contract(syntax, 'CalLoggedLogic', logged_mapping=True),
+    }
+    for t in types:
+        sources[f"State_{t}.sol"] = syntax.pragma + state_contract(syntax, contract_name('CalState', t), t)
+        sources[f"Slot_{t}.sol"] = syntax.pragma + slot_contract(syntax, contract_name('CalSlot', t), t)
+    return sources
+
+
+def calibrate(solc_version, types=DEFAULT_TYPES):
+    """
+    Measure the costs of the partition model for one compiler version on a
+    local chain. B_m (the body of the original contract) has no counterpart
+    in the generated contracts and is not measured.
+    """
+    solc_version = solidityVersion.solc_resolver.install(solc_version)
+    contracts = local_evm.compile_contracts(calibration_sources(solc_version, types), solc_version)
+    chain = local_evm.LocalChain()
+
+    def deploy(name, *args):
+        abi, bytecode = contracts[name]
+        return chain.deploy(abi, bytecode, *args)
+
+    _, empty_gas = deploy('CalEmpty')
+    logic, logic_gas = deploy('CalLogic')
+    state, state_gas = deploy('CalState', logic.address)
+    # 重新部署一个子合约的逻辑合约并切换过去
+    new_logic, new_logic_gas = deploy('CalLogic')
+    upgrade_gas = chain.transact(state.functions.upgradeTo(new_logic.address))['gasUsed']
+    _, logged_gas = deploy('CalLoggedLogic')
+
+    costs = {'B1': empty_gas, 'B_p': state_gas + logic_gas, 'B2': new_logic_gas + upgrade_gas,
+             'D1': {}, 'D2': {}, 'R_s': {}}
+    for t in types:
+        _, var_state_gas = deploy(contract_name('CalState', t), logic.address)
+        costs['D1'][t] = var_state_gas - state_gas
+
+        slot, _ = deploy(contract_name('CalSlot', t))
+        if t == 'mapping':
+            key = MAPPING_KEYS[0]
+            write = chain.transact(slot.functions.set(key, 1))['gasUsed']
+            read = chain.call_gas(slot.functions.v(key))
+            # 值类型随子合约重新部署即可；mapping 的键要由逻辑合约记录到事件中才能迁移
+            costs['D2'][t] = logged_gas - logic_gas
+        else:
+            write = chain.transact(slot.functions.set(sample_value(t)[1]))['gasUsed']
+            read = chain.call_gas(slot.functions.v())
+            costs['D2'][t] = 0
+        costs['R_s'][t] = write - TX_BASE_GAS + read - TX_BASE_GAS
+        logging.info("%s %s: D1 %d, D2 %d, R_s %d", solc_version, t, costs['D1'][t], costs['D2'][t], costs['R_s'][t])
+    return str(solc_version), costs
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Measure the gas costs of the partition model on a local EVM")
+    parser.add_argument("versions", type=str, nargs='+', help="solc versions to calibrate, e.g. 0.4.24 0.8.19")
+    parser.add_argument("--types", type=str, nargs='+', default=DEFAULT_TYPES, help="State variable types to measure")
+    parser.add_argument("-o", "--output", type=str, default='cost_model.json',
+                        help="Calibration file; versions already in it are kept unless measured again")
+    args = parser.parse_args()
+
+    calibration = {}
+    if os.path.exists(args.output):
+        with open(args.output, 'r') as f:
+            calibration = json.load(f)
+
+    for v in args.versions:
+        try:
+            solc_version, costs = calibrate(v, args.types)
+        except Exception as e:
+            logging.error("Calibration with solc %s failed: %s", v, e)
+            continue
+        calibration[solc_version] = costs
+        logging.info("solc %s: B1 %d, B_p %d, B2 %d", solc_version, costs['B1'], costs['B_p'], costs['B2'])
+
+    with open(args.output, 'w') as f:
+        json.dump(calibration, f, indent=4, sort_keys=True)
+    logging.info("Calibration written to %s", args.output)
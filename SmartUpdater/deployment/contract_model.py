@@ -0,0 +1,104 @@
+from diskCache import ast_cache, source_key
+from lazyAst import LazyOutput
+import solidityVersion
+
+SOURCE_NAME = "Contract.sol"
+
+OUTPUT_SELECTION = {
+    "*": {
+        "": ["ast"],
+        "*": ["abi", "evm.bytecode.object", "evm.methodIdentifiers"]
+    }
+}
+
+
+class ContractModel(object):
+    """
+    Everything the deployment pipeline needs about one contract, taken from a
+    single solc standard-json run: the AST of the first ContractDefinition,
+    its categorised members, pragmas, ABI/bytecode and the S/T/C matrices.
+    """
+
+    def __init__(self, source, solc_version, output):
+        self.source = source
+        self.solc_version = solc_version
+        self.ast = output['sources'][SOURCE_NAME]['ast']
+
+        self.name = None
+        self.contract_ast = None
+        self.state_vars = []
+        self.mappings = []
+        self.functions = []
+        self.events = []
+        self.modifiers = []
+        self.structs = []
+        self.enums = []
+        self.pragma_statements = []
+
+        # 由 optimization_partition.analyze_contract 填充
+        self.S = None
+        self.T = None
+        self.C = None
+        # 由 identifier_index.build_identifier_index 填充
+        self.identifier_index = None
+
+        for node in self.ast['nodes']:
+            if node['nodeType'] == 'PragmaDirective':
+                # Join literals without extra spaces between version numbers and symbols
+                pragma_version = ''.join(node['literals'][1:])
+                self.pragma_statements.append('pragma {} {};'.format(node['literals'][0], pragma_version))
+            elif node['nodeType'] == 'ContractDefinition' and self.contract_ast is None:
+                self.name = node['name']
+                self.contract_ast = node
+
+        if self.contract_ast is not None:
+            self._collect_members()
+
+        compiled = output.get('contracts', {}).get(SOURCE_NAME, {}).get(self.name, {})
+        self.abi = compiled.get('abi', [])
+        self.bytecode = compiled.get('evm', {}).get('bytecode', {}).get('object', '')
+        self.method_identifiers = compiled.get('evm', {}).get('methodIdentifiers', {})
+
+    def _collect_members(self):
+        for item in self.contract_ast['nodes']:
+            if item['nodeType'] == 'VariableDeclaration':
+                self.state_vars.append(item)
+                if item['typeName']['nodeType'] == 'Mapping':
+                    self.mappings.append(item['name'])
+            elif item['nodeType'] == 'FunctionDefinition':
+                self.functions.append(item)
+            elif item['nodeType'] == 'EventDefinition':
+                self.events.append(item)
+            elif item['nodeType'] == 'ModifierDefinition':
+                self.modifiers.append(item)
+            elif item['nodeType'] == 'StructDefinition':
+                self.structs.append(item)
+            elif item['nodeType'] == 'EnumDefinition':
+                self.enums.append(item)
+
+    @property
+    def pragma_code(self):
+        return '\n'.join(self.pragma_statements) + '\n\n'
+
+
+def compile_contract(content, solc_version):
+    return solidityVersion.compile_standard_json({SOURCE_NAME: content}, solc_version, OUTPUT_SELECTION, lazy=True)
+
+
+def build_contract_model(content, solc_version):
+    """
+    Only the first contract definition and the pragmas are parsed out of the
+    compiler output; libraries and base contracts stay unparsed (RawNode).
+    """
+    cache_key = source_key(content, solc_version, OUTPUT_SELECTION)
+    output = None
+    data = ast_cache.get_raw(cache_key)
+    if data is not None:
+        try:
+            output = LazyOutput(data)
+        except ValueError:
+            output = None
+    if output is None:
+        output = compile_contract(content, solc_version)
+        ast_cache.put_raw(cache_key, output.data)
+    return ContractModel(content, solc_version, output.to_output(SOURCE_NAME))
@@ -0,0 +1,150 @@
+import os
+import json
+import numpy as np
+from packaging.version import Version
+import storage_layout
+
+# calibrate_costs.py 生成的校准文件，按编译器版本给出各项成本
+DEFAULT_COST_MODEL_FILE = os.environ.get('SMARTUPDATER_COST_MODEL')
+
+# 别名按规范类型计价
+TYPE_ALIASES = {'uint': 'uint256', 'int': 'int256', 'byte': 'bytes1', 'address payable': 'address'}
+
+# 新槽首次写入（零值改为非零值）的 SSTORE 开销，紧凑存储时由同槽的变量分摊
+SSTORE_SET_GAS = 20000
+
+
+class CostModel(object):
+    """
+    Gas costs used by the partition model: B_m + B1 to deploy the contract
+    as a whole, B_p per sub-contract, B2 per state to redeploy a
+    sub-contract, B_m + B1 + B_r per state to redeploy the whole contract
+    when it is not split, and per
+    state type D1 (deployment) and D1 + D2 + R_s (migration weight). R_s
+    of a mapping is scaled by its expected number of keys N. With packed,
+    values smaller than a slot pay only their share of the slot's first
+    write (D1) and of its migration (R_s), as the generated contracts pack
+    them with their neighbours. Only values with a neighbour they are sure
+    to be packed with get this discount (see packable).
+    """
+
+    CONSTANTS = ('B1', 'B_m', 'B_p', 'B2', 'B_r')
+    TABLES = ('D1', 'D2', 'R_s')
+
+    def __init__(self, B1, B_m, B_p, B2, B_r, D1, D2, R_s, name='default', packed=False):
+        self.B1 = B1
+        self.B_m = B_m
+        self.B_p = B_p
+        self.B2 = B2
+        self.B_r = B_r
+        self.D1 = dict(D1)
+        self.D2 = dict(D2)
+        self.R_s = dict(R_s)
+        self.name = name
+        self.packed = packed
+
+    def type_key(self, t):
+        """
+        The table entry a state type is priced with.
+        """
+        t = TYPE_ALIASES.get(t, t)
+        if t.startswith('mapping') or t.endswith(']'):
+            # 数组和 mapping 一样逐个元素迁移
+            return 'mapping'
+        if t in self.D1 and t in self.D2 and t in self.R_s:
+            return t
+        if t == 'bytes' and 'string' in self.D1:
+            return 'string'
+        # 未校准的整数、定长字节数组，以及结构体、枚举和合约类型按一个 uint256 槽计价
+        return 'uint256'
+
+    def vectors(self, T, N, group=None):
+        """
+        D1, D2 and R_s of every state; N is the expected number of keys of
+        every mapping (or array), or a list with one per state. group is the
+        group of every state among those that always share a sub-contract
+        (default: one per state), for the packing discount.
+        """
+        N = np.broadcast_to(np.asarray(N, dtype=float), (len(T),))
+        keys = [self.type_key(t) for t in T]
+        d1 = np.array([self.D1[k] for k in keys], dtype=float)
+        d2 = np.array([self.D2[k] for k in keys], dtype=float)
+        r_s = np.array([n * self.R_s[k] if k == "mapping" else self.R_s[k] for k, n in zip(keys, N.tolist())],
+                       dtype=float)
+        if self.packed:
+            share = np.array([storage_layout.value_size(TYPE_ALIASES.get(t, t)) for t in T], dtype=float)
+            share = np.minimum(share / storage_layout.SLOT_SIZE, 1.0)
+            share[~packable(T, np.arange(len(T)) if group is None else group)] = 1.0
+            d1 -= (1 - share) * np.minimum(d1, SSTORE_SET_GAS)
+            r_s *= share
+        return d1, d2, r_s
+
+    def replace(self, name=None, **changes):
+        """
+        A copy with some constants replaced, and some table entries
+        replaced or added (D1={...} updates the D1 table).
+        """
+        values = {field: getattr(self, field) for field in self.CONSTANTS}
+        for field in self.TABLES:
+            values[field] = dict(getattr(self, field))
+            values[field].update(changes.pop(field, {}))
+        values.setdefault('packed', self.packed)
+        values.update(changes)
+        return CostModel(name=name or self.name, **values)
+
+    @classmethod
+    def from_file(cls, path, base):
+        """
+        base with the constants and table entries of a JSON cost file, e.g.
+        {"B_p": 300000, "R_s": {"mapping": 40000}}.
+        """
+        with open(path, 'r') as f:
+            changes = json.load(f)
+        check_entries(path, changes)
+        return base.replace(name=os.path.splitext(os.path.basename(path))[0], **changes)
+
+    @classmethod
+    def calibrated(cls, path, solc_version, base):
+        """
+        base with the costs measured for the closest calibrated compiler
+        version not above solc_version (or the lowest one) in a calibration
+        file, {"0.4.24": {"B1": ..., "D1": {...}}, "0.8.19": {...}}.
+        """
+        with open(path, 'r') as f:
+            calibration = json.load(f)
+        if not calibration:
+            raise ValueError(f"{path}: no calibrated compiler versions")
+        versions = {Version(v): v for v in calibration}
+        solc_version = Version(str(solc_version))
+        chosen = max((v for v in versions if v <= solc_version), default=min(versions))
+        changes = dict(calibration[versions[chosen]])
+        check_entries(f"{path} ({chosen})", changes)
+        name = f"{os.path.splitext(os.path.basename(path))[0]}@{chosen}"
+        return base.replace(name=name, **changes)
+
+
+def packable(T, group):
+    """
+    States smaller than a slot that fit in one slot with another such state
+    of their group. Other states may end up packed too, but the partition
+    alone does not ensure it, so they are priced as whole slots.
+    """
+    size = np.array([storage_layout.value_size(TYPE_ALIASES.get(t, t)) for t in T], dtype=np.int64)
+    group = np.asarray(group, dtype=np.int64)
+    result = np.zeros(len(T), dtype=bool)
+    small = size < storage_layout.SLOT_SIZE
+    for g in np.unique(group[small]).tolist():
+        members = np.flatnonzero(small & (group == g))
+        if len(members) < 2:
+            continue
+        # 每个状态与组内另一个最小的状态比较
+        first, second = np.sort(size[members])[:2]
+        other = np.where(size[members] == first, second, first)
+        result[members] = size[members] + other <= storage_layout.SLOT_SIZE
+    return result
+
+
+def check_entries(source, changes):
+    unknown = set(changes) - set(CostModel.CONSTANTS) - set(CostModel.TABLES)
+    if unknown:
+        raise ValueError(f"{source}: unknown cost entries {', '.join(sorted(unknown))}")
@@ -0,0 +1,87 @@
+import os
+from slither.utils.function import get_function_id
+
+# mapping：选择器 -> 状态合约存在 stateLogicMapping 中（默认）；
+# table：部署时的选择器表编进代码，二分查找；hybrid：table 之外的选择器再查 stateLogicMapping
+DISPATCH_MODES = ('mapping', 'table', 'hybrid')
+DEFAULT_DISPATCH = os.environ.get('SMARTUPDATER_DISPATCH', 'mapping')
+
+# proxy：Solidity 写的转发（默认）；assembly：两跳都用最小的汇编转发，不再经过 require(success)
+CALL_PATHS = ('proxy', 'assembly')
+DEFAULT_CALL_PATH = os.environ.get('SMARTUPDATER_CALL_PATH', 'proxy')
+
+ABI_ALIASES = {'uint': 'uint256', 'int': 'int256', 'byte': 'bytes1', 'address payable': 'address',
+               'fixed': 'fixed128x18', 'ufixed': 'ufixed128x18'}
+
+# 不超过这么多选择器时直接逐个比较，不再二分
+LINEAR_CASES = 3
+
+
+def abi_type(type_node, enums=(), structs=()):
+    """
+    The canonical ABI type of a parameter, or None for the ones not handled
+    (structs).
+    """
+    node_type = type_node['nodeType']
+    if node_type == 'ElementaryTypeName':
+        return ABI_ALIASES.get(type_node['name'], type_node['name'])
+    if node_type == 'ArrayTypeName':
+        base = abi_type(type_node['baseType'], enums, structs)
+        if base is None:
+            return None
+        length = type_node.get('length')
+        if length:
+            return f"{base}[{length.get('value', length.get('number'))}]"
+        return f"{base}[]"
+    if node_type == 'UserDefinedTypeName':
+        name = type_node.get('namePath', type_node.get('name'))
+        if name in enums:
+            return 'uint8'
+        if name in structs:
+            return None
+        return 'address'
+    return None
+
+
+def is_external_function(func):
+    if func.get('isConstructor') or func.get('kind', 'function') != 'function' or not func.get('name'):
+        return False
+    return func.get('visibility', 'public') in ('public', 'external')
+
+
+def function_selector(func, method_identifiers, enums=(), structs=()):
+    """
+    The selector of an external function as an int, from the compiler's
+    method identifiers when it gave them, or None.
+    """
+    types = [abi_type(param['typeName'], enums, structs) for param in func['parameters']['parameters']]
+    if None in types:
+        # 结构体参数：同名函数只有一个时按名字找
+        matches = [selector for signature, selector in method_identifiers.items()
+                   if signature.startswith(func['name'] + '(')]
+        return int(matches[0], 16) if len(matches) == 1 else None
+    signature = f"{func['name']}({','.join(types)})"
+    if signature in method_identifiers:
+        return int(method_identifiers[signature], 16)
+    return get_function_id(signature)
+
+
+def selector_tree(entries, indent):
+    """
+    Assembly that sets route to the value of the selector sig in entries, a
+    list of (selector, value) sorted by selector: a binary search on
+    constants, comparing one by one at the leaves. route is left unchanged
+    when sig is not in entries.
+    """
+    pad = ' ' * indent
+    if len(entries) <= LINEAR_CASES:
+        lines = [f"{pad}switch sig"]
+        lines += [f"{pad}case 0x{selector:08x} {{ route := {value} }}" for selector, value in entries]
+        return lines
+    mid = len(entries) // 2
+    lines = [f"{pad}switch lt(sig, 0x{entries[mid][0]:08x})", f"{pad}case 1 {{"]
+    lines += selector_tree(entries[:mid], indent + 4)
+    lines += [f"{pad}}}", f"{pad}default {{"]
+    lines += selector_tree(entries[mid:], indent + 4)
+    lines += [f"{pad}}}"]
+    return lines
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import re
+import sys
+import json
+import logging
+import statistics
+import solidityVersion
+import local_evm
+from calibrate_costs import sample_value
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+log = logging.getLogger()
+
+HYPERLAYER_NAME = 'Hyperlayer'
+
+
+def function_selector(abi_item):
+    from eth_utils import function_abi_to_4byte_selector
+    return function_abi_to_4byte_selector(abi_item)
+
+
+def sample_argument(abi_type):
+    # 定长数组重复同一个值，动态数组为空；结构体（tuple）不自动生成
+    match = re.match(r'(.*)\[(\d*)\]$', abi_type)
+    if match:
+        if not match.group(2):
+            return []
+        return [sample_argument(match.group(1))] * int(match.group(2))
+    return sample_value(abi_type)[1]
+
+
+def default_workload(abi, repeat=1):
+    """
+    Every function of the contract, called repeat times with sample
+    arguments. Functions taking structs are left out.
+    """
+    workload = []
+    for item in abi:
+        if item.get('type') != 'function':
+            continue
+        try:
+            args = [sample_argument(param['type']) for param in item['inputs']]
+        except ValueError:
+            log.warning("No sample arguments for %s, left out of the workload", item['name'])
+            continue
+        workload.extend([{'function': item['name'], 'args': args}] * repeat)
+    return workload
+
+
+def load_workload(path):
+    """
+    A workload file lists the calls in the order they are replayed,
+    [{"function": "transfer", "args": ["0x...", 5], "value": 0}, ...], or
+    maps function names to lists of argument lists.
+    """
+    with open(path, 'r') as f:
+        workload = json.load(f)
+    if isinstance(workload, dict):
+        workload = [{'function': name, 'args': args} for name, calls in workload.items() for args in calls]
+    return workload
+
+
+def deploy_original(chain, contracts, contract_name, constructor_args=()):
+    abi, bytecode = contracts[contract_name]
+    contract, gas = chain.deploy(abi, bytecode, *constructor_args)
+    return contract, {contract_name: gas}
+
+
+def deploy_partitioned(chain, contracts, contract_name, func_mapping, original_abi, dispatch=None):
+    """
+    Deploy the Logic and State contracts of every sub-contract and the
+    Hyperlayer, and route the selector of every function that uses a single
+    sub-contract to its State contract (unless it is in the Hyperlayer's
+    selector table, see <Name>_dispatch.json). Returns the Hyperlayer, the
+    deployment gas of every contract (and of the routing transactions) and
+    the sub-contract of every routed function.
+    """
+    dispatch = dispatch or {'mode': 'mapping', 'selectors': {}}
+    gas = {}
+    state_addresses = {}
+    i = 0
+    while f"{contract_name}State{i}" in contracts:
+        logic_name = f"{contract_name}Logic{i}"
+        # 没有函数的子合约没有逻辑合约
+        logic_address = '0x' + '0' * 40
+        if logic_name in contracts:
+            logic, gas[logic_name] = chain.deploy(*contracts[logic_name])
+            logic_address = logic.address
+        state_name = f"{contract_name}State{i}"
+        state, gas[state_name] = chain.deploy(*contracts[state_name], logic_address)
+        state_addresses[i] = state.address
+        i += 1
+
+    if dispatch['mode'] == 'mapping':
+        hyperlayer, gas[HYPERLAYER_NAME] = chain.deploy(*contracts[HYPERLAYER_NAME])
+    else:
+        # 选择器表的 Hyperlayer 在构造时拿到各子合约的状态合约地址
+        states = [state_addresses.get(i, '0x' + '0' * 40) for i in range(dispatch['state_contracts'])]
+        hyperlayer, gas[HYPERLAYER_NAME] = chain.deploy(*contracts[HYPERLAYER_NAME], states)
+    routes = {}
+    gas['routing'] = 0
+    for item in original_abi:
+        if item.get('type') != 'function':
+            continue
+        subs = func_mapping.get(item['name'], [])
+        if len(subs) != 1 or subs[0] not in state_addresses:
+            continue
+        routes[item['name']] = subs[0]
+        selector = function_selector(item)
+        if dispatch['mode'] == 'table' or '0x' + selector.hex() in dispatch['selectors']:
+            continue
+        receipt = chain.transact(hyperlayer.functions.setLogicContract(selector, state_addresses[subs[0]]))
+        gas['routing'] += receipt['gasUsed']
+    return hyperlayer, gas, routes
+
+
+def replay(chain, contract, workload):
+    """
+    Send every call of the workload to contract; returns the gas used by
+    each call, or None for the calls that reverted.
+    """
+    gas = []
+    for call in workload:
+        try:
+            function = contract.functions[call['function']](*call.get('args', []))
+            gas.append(chain.transact(function, call.get('value', 0))['gasUsed'])
+        except Exception as e:
+            log.debug("%s reverted: %s", call['function'], e)
+            gas.append(None)
+    return gas
+
+
+def summarize(workload, original_gas, partitioned_gas, routes):
+    """
+    Per function: mean gas of the calls that succeeded on both deployments,
+    and the overhead of the partitioned one.
+    """
+    functions = {}
+    for call, original, partitioned in zip(workload, original_gas, partitioned_gas):
+        entry = functions.setdefault(call['function'], {'sub_contract': routes.get(call['function']), 'calls': 0,
+                                                        'reverted': {'original': 0, 'partitioned': 0},
+                                                        'original': [], 'partitioned': []})
+        entry['calls'] += 1
+        entry['reverted']['original'] += original is None
+        entry['reverted']['partitioned'] += partitioned is None
+        if original is not None and partitioned is not None:
+            entry['original'].append(original)
+            entry['partitioned'].append(partitioned)
+
+    for entry in functions.values():
+        compared = len(entry['original'])
+        entry['compared'] = compared
+        if compared:
+            entry['original'] = statistics.mean(entry['original'])
+            entry['partitioned'] = statistics.mean(entry['partitioned'])
+            entry['overhead'] = entry['partitioned'] - entry['original']
+            entry['overhead_pct'] = entry['overhead'] / entry['original']
+        else:
+            entry['original'] = entry['partitioned'] = entry['overhead'] = entry['overhead_pct'] = None
+    return functions
+
+
+def benchmark(contract_source, output_dir, contract_name=None, workload=None, constructor_args=(), repeat=1):
+    with open(contract_source, 'r') as f:
+        content = f.read()
+    contract_name = contract_name or os.path.splitext(os.path.basename(contract_source))[0]
+    solc_version = solidityVersion.resolve_solc_version(content)
+
+    with open(os.path.join(output_dir, f"{contract_name}_func_mapping.json"), 'r') as f:
+        func_mapping = json.load(f)
+    dispatch = None
+    dispatch_file = os.path.join(output_dir, f"{contract_name}_dispatch.json")
+    if os.path.exists(dispatch_file):
+        with open(dispatch_file, 'r') as f:
+            dispatch = json.load(f)
+    generated = {}
+    for name in os.listdir(output_dir):
+        if name.endswith('.sol'):
+            with open(os.path.join(output_dir, name), 'r') as f:
+                generated[name] = f.read()
+
+    original_contracts = local_evm.compile_contracts({os.path.basename(contract_source): content}, solc_version)
+    generated_contracts = local_evm.compile_contracts(generated, solc_version)
+    original_abi = original_contracts[contract_name][0]
+    if workload is None:
+        workload = default_workload(original_abi, repeat)
+
+    chain = local_evm.LocalChain()
+    original, original_deploy = deploy_original(chain, original_contracts, contract_name, constructor_args)
+    hyperlayer, partitioned_deploy, routes = deploy_partitioned(chain, generated_contracts, contract_name,
+                                                                func_mapping, original_abi, dispatch)
+    # 经 Hyperlayer 调用时使用原合约的 ABI
+    entry = chain.at(hyperlayer.address, original_abi)
+
+    original_gas = replay(chain, original, workload)
+    partitioned_gas = replay(chain, entry, workload)
+
+    original_total = sum(original_deploy.values())
+    partitioned_total = sum(partitioned_deploy.values())
+    return {
+        'contract': contract_name,
+        'solc': str(solc_version),
+        'output_dir': output_dir,
+        'dispatch': (dispatch or {}).get('mode', 'mapping'),
+        'call_path': (dispatch or {}).get('call_path', 'proxy'),
+        'deployment': {'original': original_total, 'partitioned': partitioned_total,
+                       'overhead': partitioned_total - original_total,
+                       'contracts': dict(original_deploy, **partitioned_deploy)},
+        'functions': summarize(workload, original_gas, partitioned_gas, routes),
+    }
+
+
+def find_regressions(result, baseline, tolerance):
+    """
+    Functions whose partitioned gas grew by more than tolerance (a
+    fraction) over a previous result.
+    """
+    regressions = []
+    for name, entry in result['functions'].items():
+        old = baseline.get('functions', {}).get(name)
+        if not old or old.get('partitioned') is None or entry['partitioned'] is None:
+            continue
+        if entry['partitioned'] > old['partitioned'] * (1 + tolerance):
+            regressions.append((name, old['partitioned'], entry['partitioned']))
+    return regressions
+
+
+def dispatch_savings(results):
+    """
+    Gas saved per call of every function by each deployment over the first
+    one (e.g. the Hyperlayer's dispatch modes or call paths, generated into
+    several output directories).
+    """
+    savings = {}
+    first = results[0]['functions']
+    for result in results[1:]:
+        label = f"{variant(result)} ({result['output_dir']})"
+        savings[label] = {}
+        for name, entry in result['functions'].items():
+            if name in first and first[name]['partitioned'] is not None and entry['partitioned'] is not None:
+                savings[label][name] = first[name]['partitioned'] - entry['partitioned']
+    return savings
+
+
+def variant(result):
+    return f"{result['dispatch']}/{result.get('call_path', 'proxy')}"
+
+
+def print_result(result):
+    deployment = result['deployment']
+    print(f"{result['output_dir']} (dispatch: {result['dispatch']}, call path: {result['call_path']})")
+    print(f"{'deployment':<24} {deployment['original']:>12} {deployment['partitioned']:>12} {deployment['overhead']:>+10}")
+    print(f"{'function':<24} {'original':>12} {'partitioned':>12} {'overhead':>10} {'':>8} reverted")
+    for name, entry in result['functions'].items():
+        reverted = f"{entry['reverted']['original']}/{entry['reverted']['partitioned']} of {entry['calls']}"
+        if entry['compared']:
+            print(f"{name:<24} {entry['original']:>12.0f} {entry['partitioned']:>12.0f} {entry['overhead']:>+10.0f} "
+                  f"{entry['overhead_pct']:>+8.1%} {reverted}")
+        else:
+            print(f"{name:<24} {'-':>12} {'-':>12} {'-':>10} {'':>8} {reverted}")
+    print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the gas of the original contract and its partitioned deployment on a local EVM")
+    parser.add_argument("contract_source", type=str, help="Path to the original Solidity contract")
+    parser.add_argument("output_dirs", type=str, nargs='+',
+                        help="Directories with the contracts generated by smartupdater_deploy.py; with several, the "
+                             "savings per call over the first one are reported")
+    parser.add_argument("--name", type=str, default=None, help="Contract name (default: the source file name)")
+    parser.add_argument("--workload", type=str, default=None,
+                        help="JSON file with the calls to replay (default: every function with sample arguments)")
+    parser.add_argument("--repeat", type=int, default=3, help="Calls per function of the default workload")
+    parser.add_argument("--constructor-args", type=str, default='[]', help="JSON list of constructor arguments")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous result to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Allowed gas increase over the baseline")
+    parser.add_argument("-o", "--output", type=str, default='gas_benchmark.json', help="Result file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.contract_source):
+        log.error("Error: The specified contract source file does not exist.")
+        sys.exit(1)
+
+    workload = load_workload(args.workload) if args.workload else None
+    results = [benchmark(args.contract_source, output_dir, args.name, workload, json.loads(args.constructor_args),
+                         args.repeat) for output_dir in args.output_dirs]
+    for result in results:
+        print_result(result)
+
+    if len(results) == 1:
+        output = results[0]
+    else:
+        output = {'variants': results, 'savings': dispatch_savings(results)}
+        for label, savings in output['savings'].items():
+            print(f"Saved per call by {label} over {variant(results[0])} ({results[0]['output_dir']}):")
+            for name, saving in savings.items():
+                print(f"    {name:<24} {saving:>+10.0f}")
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=4)
+    log.info("Benchmark written to %s", args.output)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        # 多个部署的结果按 dispatch 方式和调用路径与基线中的对应结果比较
+        baselines = {variant(dict(old, dispatch=old.get('dispatch', 'mapping'))): old
+                     for old in baseline.get('variants', [baseline])}
+        failed = False
+        for result in results:
+            if variant(result) not in baselines:
+                continue
+            for name, old, new in find_regressions(result, baselines[variant(result)], args.tolerance):
+                log.error("%s (%s): %.0f gas, was %.0f", name, variant(result), new, old)
+                failed = True
+        if failed:
+            sys.exit(1)
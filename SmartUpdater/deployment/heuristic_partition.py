@@ -0,0 +1,148 @@
+import time
+import numpy as np
+import optimization_partition
+import solver_backend
+
+
+def partition_cost(n_states, d1_total, total_weight, sizes, weights, costs=None):
+    """
+    Objective of the partition model for sub-contracts holding sizes states
+    with summed migration weights weights (w = D1 + D2 + R_s per state).
+    """
+    costs = costs or optimization_partition.DEFAULT_COSTS
+    migration = float(np.dot(weights, sizes)) - total_weight
+    if len(sizes) == 1:
+        return costs.B_m + costs.B1 + d1_total + migration + n_states * (costs.B_m + costs.B1 + costs.B_r) + d1_total
+    return len(sizes) * costs.B_p + d1_total + migration + n_states * costs.B2 + d1_total
+
+
+def greedy_merge(sizes, weights, max_subs, B_p=None):
+    """
+    Start from one sub-contract per group and keep merging the pair that
+    lowers the cost most (B_p saved against the migration added), while
+    that pays off or there are more sub-contracts than max_subs.
+    Returns the sub-contract of every group.
+    """
+    if B_p is None:
+        B_p = optimization_partition.B_p
+    n_groups = len(sizes)
+    sub = np.arange(n_groups)
+    sub_sizes = sizes.astype(float).copy()
+    sub_weights = weights.astype(float).copy()
+    alive = np.ones(n_groups, dtype=bool)
+
+    while alive.sum() > 1:
+        # 合并 a、b 后迁移成本增加 W[a] n[b] + W[b] n[a]，同时少部署一个子合约
+        delta = np.outer(sub_weights, sub_sizes)
+        delta = delta + delta.T - B_p
+        delta[~alive, :] = np.inf
+        delta[:, ~alive] = np.inf
+        np.fill_diagonal(delta, np.inf)
+        a, b = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[a, b] >= 0 and alive.sum() <= max_subs:
+            break
+        a, b = min(a, b), max(a, b)
+        sub[sub == b] = a
+        sub_sizes[a] += sub_sizes[b]
+        sub_weights[a] += sub_weights[b]
+        alive[b] = False
+    return sub
+
+
+def local_search(sub, sizes, weights, max_subs, max_passes=100, B_p=None):
+    """
+    Move single groups to another (or a new) sub-contract while that lowers
+    the cost of a split deployment (K * B_p + sum W n). Returns the improved
+    sub-contract of every group.
+    """
+    if B_p is None:
+        B_p = optimization_partition.B_p
+    n_groups = len(sizes)
+    sub = np.unique(sub, return_inverse=True)[1]
+    sub_sizes = np.bincount(sub, weights=sizes, minlength=n_groups)
+    sub_weights = np.bincount(sub, weights=weights, minlength=n_groups)
+
+    for _ in range(max_passes):
+        improved = False
+        for k in range(n_groups):
+            a, s, w = sub[k], sizes[k], weights[k]
+            used = sub_sizes > 0
+            n_used = int(used.sum())
+            # 移出 a 的收益；a 清空时还少部署一个子合约
+            leave = (sub_weights[a] - w) * (sub_sizes[a] - s) - sub_weights[a] * sub_sizes[a]
+            if sub_sizes[a] == s:
+                leave -= B_p
+            join = (sub_weights + w) * (sub_sizes + s) - sub_weights * sub_sizes
+            join[~used] = B_p + w * s
+            join[a] = np.inf
+            if n_used >= max_subs:
+                join[~used] = np.inf
+            else:
+                # 只保留一个空子合约作为候选
+                empty = np.flatnonzero(~used)
+                join[empty[1:]] = np.inf
+            b = int(np.argmin(join))
+            remaining = n_used - (sub_sizes[a] == s) + (not used[b])
+            if remaining >= 2 and leave + join[b] < -1e-9:
+                sub[k] = b
+                sub_sizes[a] -= s
+                sub_weights[a] -= w
+                sub_sizes[b] += s
+                sub_weights[b] += w
+                improved = True
+        if not improved:
+            break
+    return sub
+
+
+def first_occupant_order(sub):
+    """
+    Renumber sub-contracts in order of their first group, the order the
+    partition model's symmetry breaking requires.
+    """
+    _, first = np.unique(sub, return_index=True)
+    order = np.argsort(np.argsort(first))
+    return order[np.unique(sub, return_inverse=True)[1]]
+
+
+def heuristic_partition(S, T, C, N, costs=None):
+    """
+    Greedy merging of the co-location groups followed by local search, on
+    the cost model of the exact partition model. Returns a dict shaped like
+    optimization_partition.solve_partition's, plus the sub-contract of
+    every group (sub_of_group).
+    """
+    costs = costs or optimization_partition.DEFAULT_COSTS
+    start = time.perf_counter()
+    n_states = len(T)
+    n_funcs = len(S)
+    group = optimization_partition.colocation_components(S, C, n_states)
+    d1, d2, r_s = costs.vectors(T, N, group)
+    w = d1 + d2 + r_s
+
+    n_groups = int(group.max()) + 1 if n_states else 0
+    result = {'status': solver_backend.INFEASIBLE, 'objective': None, 'var_names': [], 'sub_of_group': None}
+    if n_groups == 0 or n_funcs == 0:
+        result['runtime'] = time.perf_counter() - start
+        return result
+
+    sizes = np.bincount(group, minlength=n_groups).astype(float)
+    weights = np.bincount(group, weights=w, minlength=n_groups)
+    max_subs = min(n_funcs, n_groups)
+
+    def cost(sub):
+        used = np.unique(sub)
+        return partition_cost(n_states, d1.sum(), w.sum(), np.bincount(sub, weights=sizes)[used],
+                              np.bincount(sub, weights=weights)[used], costs)
+
+    candidates = [np.zeros(n_groups, dtype=np.int64)]
+    if max_subs > 1:
+        candidates.append(local_search(greedy_merge(sizes, weights, max_subs, costs.B_p), sizes, weights, max_subs,
+                                       B_p=costs.B_p))
+    candidate_costs = [cost(sub) for sub in candidates]
+    sub = first_occupant_order(candidates[int(np.argmin(candidate_costs))])
+
+    result.update(status=solver_backend.FEASIBLE, objective=min(candidate_costs), sub_of_group=sub,
+                  var_names=[f"x[{i},{sub[group[i]]}]" for i in range(n_states)])
+    result['runtime'] = time.perf_counter() - start
+    return result
@@ -0,0 +1,136 @@
+from usage_matrix import BitMatrix
+
+# 遍历时跳过的键：类型描述、源码位置等不会包含声明引用
+SKIPPED_KEYS = frozenset(('typeDescriptions', 'src', 'nameLocation', 'overloadedDeclarations', 'documentation'))
+
+FUNCTION = 'function'        # key: index in model.functions, body only
+INVOCATION = 'invocation'    # key: index in model.functions, its modifier list
+MODIFIER = 'modifier'        # key: modifier name, body only
+INITIALIZER = 'initializer'  # key: state variable index, initial value
+EVENT = 'event'              # key: event name, parameter types
+STRUCT = 'struct'            # key: struct name, member types
+
+
+def index_references(node, owner, references):
+    """
+    Record owner under every declaration id referenced below node. Iterative,
+    so deep expression trees cost no recursion.
+    """
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(value for value in item if isinstance(value, (dict, list)))
+            continue
+        ref = item.get('referencedDeclaration')
+        # MemberAccess（如 this.x）引用的是外部 getter，不算对状态变量的直接使用
+        if ref is not None and item.get('nodeType') != 'MemberAccess':
+            owners = references.get(ref)
+            if owners is None:
+                references[ref] = {owner}
+            else:
+                owners.add(owner)
+        for key, value in item.items():
+            if key not in SKIPPED_KEYS and isinstance(value, (dict, list)):
+                stack.append(value)
+
+
+class IdentifierIndex(object):
+    """
+    One pass over a ContractModel mapping each declaration id to the set of
+    (kind, key) owners that reference it: functions, modifier lists,
+    modifiers, state variable initializers, events and structs. S, C and the
+    definition dependencies are read off this index instead of walking the
+    AST again for every question.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.references = {}
+        self.state_var_ids = {var['id']: idx for idx, var in enumerate(model.state_vars)}
+        self.event_ids = {event['id']: event['name'] for event in model.events}
+        self.modifier_ids = {modifier['id']: modifier['name'] for modifier in model.modifiers}
+        self.struct_ids = {struct['id']: struct['name'] for struct in model.structs}
+        self.enum_ids = {enum['id']: enum['name'] for enum in model.enums}
+
+        references = self.references
+        for idx, var in enumerate(model.state_vars):
+            if var.get('value') is not None:
+                index_references(var['value'], (INITIALIZER, idx), references)
+        for idx, func in enumerate(model.functions):
+            if func.get('body'):
+                index_references(func['body'], (FUNCTION, idx), references)
+            if func.get('modifiers'):
+                index_references(func['modifiers'], (INVOCATION, idx), references)
+        for modifier in model.modifiers:
+            if modifier.get('body'):
+                index_references(modifier['body'], (MODIFIER, modifier['name']), references)
+        for event in model.events:
+            index_references(event['parameters']['parameters'], (EVENT, event['name']), references)
+        for struct in model.structs:
+            index_references(struct['members'], (STRUCT, struct['name']), references)
+
+    def owners(self, declaration_id, kind):
+        return [key for owner_kind, key in self.references.get(declaration_id, ()) if owner_kind == kind]
+
+    def usage_matrix(self):
+        """
+        S as a BitMatrix: S[i][j] = 1 if the body of function i references state variable j.
+        """
+        rows, cols = [], []
+        for var_id, var_idx in self.state_var_ids.items():
+            for func_idx in self.owners(var_id, FUNCTION):
+                rows.append(func_idx)
+                cols.append(var_idx)
+        return BitMatrix.from_pairs(rows, cols, len(self.model.functions), len(self.state_var_ids))
+
+    def initializer_relations(self):
+        """
+        C as a BitMatrix: C[i][j] = 1 if the initial value of state variable i references state variable j.
+        """
+        rows, cols = [], []
+        for var_id, var_idx in self.state_var_ids.items():
+            for owner_idx in self.owners(var_id, INITIALIZER):
+                rows.append(owner_idx)
+                cols.append(var_idx)
+        n_states = len(self.state_var_ids)
+        return BitMatrix.from_pairs(rows, cols, n_states, n_states)
+
+    def definitions_dependencies(self):
+        """
+        State variable indices referenced by each event, modifier and struct definition.
+        """
+        kinds = {EVENT: 'events', MODIFIER: 'modifiers', STRUCT: 'structs'}
+        definitions_dependencies = {
+            'events': {name: set() for name in self.event_ids.values()},
+            'modifiers': {name: set() for name in self.modifier_ids.values()},
+            'structs': {name: set() for name in self.struct_ids.values()},
+            'enums': {name: set() for name in self.enum_ids.values()},
+        }
+        for var_id, var_idx in self.state_var_ids.items():
+            for kind, key in self.references.get(var_id, ()):
+                if kind in kinds:
+                    definitions_dependencies[kinds[kind]][key].add(var_idx)
+        return definitions_dependencies
+
+    def function_dependencies(self):
+        """
+        Events, modifiers, structs and enums each function needs next to it in a logic contract.
+        """
+        function_dependencies = [{'events': set(), 'modifiers': set(), 'structs': set(), 'enums': set()}
+                                 for _ in self.model.functions]
+        for names, key, kinds in ((self.event_ids, 'events', (FUNCTION,)),
+                                  (self.modifier_ids, 'modifiers', (INVOCATION,)),
+                                  (self.struct_ids, 'structs', (FUNCTION, INVOCATION)),
+                                  (self.enum_ids, 'enums', (FUNCTION, INVOCATION))):
+            for declaration_id, name in names.items():
+                for kind, func_idx in self.references.get(declaration_id, ()):
+                    if kind in kinds:
+                        function_dependencies[func_idx][key].add(name)
+        return function_dependencies
+
+
+def build_identifier_index(model):
+    if model.identifier_index is None:
+        model.identifier_index = IdentifierIndex(model)
+    return model.identifier_index
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import json
+import logging
+
+# 未提供估计值的 mapping 使用的键数量
+DEFAULT_KEY_COUNT = 13
+DEFAULT_KEY_COUNTS_FILE = os.environ.get('SMARTUPDATER_KEY_COUNTS')
+
+# 事件签名中的类型要写成规范形式
+CANONICAL_TYPES = {'uint': 'uint256', 'int': 'int256', 'byte': 'bytes1'}
+
+
+def load_key_counts(path, contract_name=None):
+    """
+    Expected number of keys per mapping from a JSON stats file, either
+    {"balances": 1000000, "allowed": 20} or the same maps under contract
+    names ({"Token": {...}}).
+    """
+    with open(path, 'r') as f:
+        counts = json.load(f)
+    if contract_name is not None and isinstance(counts.get(contract_name), dict):
+        counts = counts[contract_name]
+    return {name: count for name, count in counts.items() if not isinstance(count, dict)}
+
+
+def key_count_vector(state_vars, key_counts=None, default=DEFAULT_KEY_COUNT):
+    """
+    The N argument of the partition model: the expected number of keys of
+    every state variable (only used for mappings).
+    """
+    key_counts = key_counts or {}
+    return [key_counts.get(var['name'], default) for var in state_vars]
+
+
+def mapping_key_type(type_str):
+    # "mapping(address => uint256)" -> "address"
+    key_type = type_str[len('mapping('):].split('=>')[0].strip()
+    return CANONICAL_TYPES.get(key_type, key_type)
+
+
+def count_event_keys(provider_url, addresses, var_types, from_block=0, to_block='latest'):
+    """
+    Count the distinct keys written to every mapping, from the <var>Event
+    logs the generated Logic contracts emit on each mapping assignment.
+    The logs come from the State contracts at addresses (the Logic code runs
+    in them through delegatecall). var_types is <Name>_var_types.json.
+    """
+    try:
+        from web3 import Web3
+        from eth_abi import decode
+    except ImportError as e:
+        raise RuntimeError("Counting event keys needs web3 (pip install web3)") from e
+
+    w3 = Web3(Web3.HTTPProvider(provider_url))
+    addresses = [Web3.to_checksum_address(address) for address in addresses]
+    counts = {}
+    for var_name, type_str in var_types.items():
+        if not type_str.startswith('mapping'):
+            continue
+        key_type = mapping_key_type(type_str)
+        topic = Web3.to_hex(Web3.keccak(text=f"{var_name}Event(string,{key_type})"))
+        logs = w3.eth.get_logs({'address': addresses, 'topics': [topic], 'fromBlock': from_block,
+                                'toBlock': to_block})
+        keys = set()
+        for entry in logs:
+            _, key = decode(['string', key_type], bytes(entry['data']))
+            keys.add(key)
+        counts[var_name] = len(keys)
+        logging.info("%s: %d distinct keys in %d events", var_name, len(keys), len(logs))
+    return counts
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Estimate the number of keys of every mapping from the events of deployed sub-contracts")
+    parser.add_argument("contract_name", type=str, help="Name of the partitioned contract")
+    parser.add_argument("addresses", type=str, nargs='+', help="Addresses of the deployed State contracts")
+    parser.add_argument("--rpc", type=str, default="http://127.0.0.1:8545", help="JSON-RPC endpoint of the node")
+    parser.add_argument("--dir", type=str, default='.', help="Directory with <Name>_var_types.json")
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Stats file to write (default: <Name>_key_counts.json)")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.dir, f"{args.contract_name}_var_types.json"), 'r') as f:
+        var_types = json.load(f)
+    counts = count_event_keys(args.rpc, args.addresses, var_types, args.from_block)
+
+    output = args.output or f"{args.contract_name}_key_counts.json"
+    with open(output, 'w') as f:
+        json.dump(counts, f, indent=4)
+    logging.info("Key counts written to %s", output)
@@ -1,111 +1,79 @@
 
-from solidity_parser import parser
-import gurobipy as gp
-from gurobipy import GRB
+import os
+import numpy as np
+import scipy.sparse as sp
+import identifier_index
+import solver_backend
+import heuristic_partition
+import storage_layout
+from cost_model import CostModel
+from solver_backend import get_env
+from diskCache import DiskCache, DEFAULT_CACHE_DIR
 
-def analyze_contract(input_file):
+# gurobipy 只有原始的二次模型需要；线性模型可以交给其他求解器后端
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = None
+    GRB = None
 
-    with open(input_file, 'r') as f:
-        content = f.read()
+M = 100
+M5 = 10000000000000
 
-    ast = parser.parse(content)
+B1 = 66854  
+B_m = 353824 
+B_p = B1 + 256083  
+B2 = 442835  
+# 不拆分时每个状态重新部署整个合约的额外开销
+B_r = 47292
 
-    contracts = {}
-    for node in ast['children']:
-        if node['type'] == 'ContractDefinition':
-            contracts[node['name']] = node
+# uint/int 等别名和未列出的类型由 CostModel.type_key 归到下列类型
+D1_dict = {"uint256": 21679, "uint8": 26809, "address": 37578, "bool": 24663, "string": 98739,
+           "mapping": 60465, "int256": 21679}
 
-    if not contracts:
-        print("No contract definition found.")
-        return
-
-    original_contract_name = list(contracts.keys())[0]
-    contract_ast = contracts[original_contract_name]
+D2_dict = {"uint256": 0, "uint8": 0, "address": 0, "bool": 0, "string": 0, "mapping": 76322, "int256": 0}
 
-    state_vars = []
-    for item in contract_ast['subNodes']:
-        if item['type'] == 'StateVariableDeclaration':
-            state_vars.append(item)
+# exact：精确求解；heuristic：只用启发式划分；warm：启发式划分作为精确求解的初始解
+DEFAULT_METHOD = os.environ.get('SMARTUPDATER_PARTITION', 'exact')
 
-    state_var_indices = {var['variables'][0]['name']: idx for idx, var in enumerate(state_vars)}
+# 同构实例（状态、函数顺序或名字不同）的划分结果
+partition_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, 'partitions'))
 
-    T = [get_type_description(var['variables'][0]['typeName']) for var in state_vars]
+R_s_dict = {"uint256": 11828, "uint8": 12421, "address": 13537, "bool": 12226, "string": 18545, "mapping": 31818,
+            "int256": 11828}
 
+DEFAULT_COSTS = CostModel(B1, B_m, B_p, B2, B_r, D1_dict, D2_dict, R_s_dict, packed=storage_layout.PACK_SLOTS)
 
-    S = []
 
-    functions = []
-    for item in contract_ast['subNodes']:
-        if item['type'] == 'FunctionDefinition':
-            functions.append(item)
+def analyze_contract(model):
 
+    if model.S is not None:
+        return model.S, model.T, model.C
 
-    for func in functions:
-
-        func_state_usage = [0] * len(state_vars)
+    if model.contract_ast is None:
+        print("No contract definition found.")
+        return
 
-        if func.get('body'):
-            collect_state_usage(func['body'], state_var_indices, func_state_usage)
-        S.append(func_state_usage)
+    index = identifier_index.build_identifier_index(model)
 
-    C = detect_state_variable_references(state_vars, state_var_indices)
+    T = [get_type_description(var['typeName']) for var in model.state_vars]
+    S = index.usage_matrix()
+    C = index.initializer_relations()
 
+    model.S, model.T, model.C = S, T, C
     return S, T, C
 
-def collect_state_usage(node, state_var_indices, func_state_usage):
-    if isinstance(node, dict):
-        if node['type'] == 'Identifier' and node['name'] in state_var_indices:
-            idx = state_var_indices[node['name']]
-            func_state_usage[idx] = 1
-        else:
-            for key, value in node.items():
-                collect_state_usage(value, state_var_indices, func_state_usage)
-    elif isinstance(node, list):
-        for item in node:
-            collect_state_usage(item, state_var_indices, func_state_usage)
-
-def detect_state_variable_references(state_vars, state_var_indices):
-    C = []
-
-    for var in state_vars:
-        var_name = var['variables'][0]['name']
-        if 'initialValue' in var:
-            initial_value = var['initialValue']
-            references = collect_state_references(initial_value, state_var_indices)
-            for ref in references:
-                C.append([state_var_indices[var_name] + 1, ref + 1])
-
-    C = [list(x) for x in set(tuple(x) for x in C)]
-    return C
-
-def collect_state_references(node, state_var_indices):
-
-    references = []
-
-    if isinstance(node, dict):
-        if node['type'] == 'Identifier' and node['name'] in state_var_indices:
-            references.append(state_var_indices[node['name']])
-        else:
-            for key, value in node.items():
-                references.extend(collect_state_references(value, state_var_indices))
-    elif isinstance(node, list):
-        for item in node:
-            references.extend(collect_state_references(item, state_var_indices))
-
-    return references
-
 
 def get_type_description(type_node):
-    if type_node['type'] == 'ElementaryTypeName':
+    if type_node['nodeType'] == 'ElementaryTypeName':
         return type_node['name']
-    elif type_node['type'] == 'UserDefinedTypeName':
-        return type_node['namePath']
-    elif type_node['type'] == 'Mapping':
-        from_type = get_type_description(type_node['keyType'])
-        to_type = get_type_description(type_node['valueType'])
+    elif type_node['nodeType'] == 'UserDefinedTypeName':
+        return type_node.get('namePath', type_node.get('name'))
+    elif type_node['nodeType'] == 'Mapping':
         return 'mapping'
-    elif type_node['type'] == 'ArrayTypeName':
-        base_type = get_type_description(type_node['baseTypeName'])
+    elif type_node['nodeType'] == 'ArrayTypeName':
+        base_type = get_type_description(type_node['baseType'])
         length = type_node.get('length')
         if length:
             return '{}[{}]'.format(base_type, length['value'])
@@ -115,160 +83,726 @@ def get_type_description(type_node):
         return 'unknown'
 
 
-def optimize_contract(S, T, C,N):  
-    min_val = None
-    obj_val = None
+def build_partition_model(S, T, C, N):
+    """
+    Build the partition model element by element. Returns the model, x as a
+    list of rows of Vars and the (Sub_deploy, redeployment, migration) terms.
+    """
+    m = gp.Model("mip1", env=get_env())
 
-    M = 100
-    M5 = 10000000000000  
-    try:
-        m = gp.Model("mip1")
+    m.Params.OutputFlag = 0
 
-        m.Params.OutputFlag = 0
+    n_states = len(T)  
+    n_funcs = len(S)
+    x = m.addVars(n_states, n_funcs, vtype=GRB.BINARY, name="x")  # x[i,j] = 1,说明第i个状态被放在第j个sub-contract中
+    y = m.addVars(n_funcs, vtype=GRB.BINARY, name="y")
 
-        n_states = len(T)  
-        n_funcs = len(S)
-        x = m.addVars(n_states, n_funcs, vtype=GRB.BINARY, name="x")  # x[i,j] = 1,说明第i个状态被放在第j个sub-contract中
-        y = m.addVars(n_funcs, vtype=GRB.BINARY, name="y")
+    h = m.addVars(n_funcs, vtype=GRB.BINARY, name="h")
+    h_deploy = m.addVars(n_funcs, vtype=GRB.CONTINUOUS, name="h_d")
+    z = m.addVars(n_funcs, vtype=GRB.BINARY, name="z")
+    all_deploy = m.addVars(n_funcs,vtype=GRB.CONTINUOUS, name="all_deploy")
 
-        h = m.addVars(n_funcs, vtype=GRB.BINARY, name="h")
-        h_deploy = m.addVars(n_funcs, vtype=GRB.CONTINUOUS, name="h_d")
-        z = m.addVars(n_funcs, vtype=GRB.BINARY, name="z")
-        all_deploy = m.addVars(n_funcs,vtype=GRB.CONTINUOUS, name="all_deploy")
+    all_in_one = m.addVar(vtype=GRB.BINARY, name="all_in_one")
+    Sub_deploy = m.addVar(n_states, vtype=GRB.CONTINUOUS, name="Sub_deploy")
+    redeployment = m.addVar(vtype=GRB.CONTINUOUS, name="redeployment")
+    migration = m.addVar(vtype=GRB.CONTINUOUS, name="migration")
+    num = m.addVar(vtype=GRB.CONTINUOUS, name="num")
 
-        all_in_one = m.addVar(vtype=GRB.BINARY, name="all_in_one")
-        Sub_deploy = m.addVar(n_states, vtype=GRB.CONTINUOUS, name="Sub_deploy")
-        redeployment = m.addVar(vtype=GRB.CONTINUOUS, name="redeployment")
-        migration = m.addVar(vtype=GRB.CONTINUOUS, name="migration")
-        num = m.addVar(vtype=GRB.CONTINUOUS, name="num")
+    d1, d2, r_s = (v.tolist() for v in cost_vectors(T, N, group=colocation_components(S, C, n_states)))
 
-        B1 = 66854  
-        B_m = 353824 
-        B_p = B1 + 256083  
-        B2 = 442835  
 
-        D1_dict = {"uint256": 21679, "uint8": 26809, "address": 37578, "bool": 24663, "string": 98739,
-                   "mapping": 60465, "int": 21679, "int256": 21679,"uint": 21679}  
+    for i in range(n_funcs):
+        states_in_function = S.row_indices(i)
 
-        D2_dict = {"uint256": 0, "uint8": 0, "address": 0, "bool": 0, "string": 0, "mapping": 76322, "int": 0,
-                   "int256": 0,"uint": 21679,"uint": 21679}
+        all_in_k = m.addVars(n_funcs, vtype=GRB.BINARY, name="all_in_k")
+        for k in range(n_funcs):
 
-        R_s = {"uint256": 11828, "uint8": 12421, "address": 13537, "bool": 12226, "string": 18545, "mapping": 31818,
-               "int": 11828, "int256": 11828,"uint": 21679}
+            for j in states_in_function:
+                m.addConstr(x[j, k] >= all_in_k[k], f"c_func_{i}_state_{j}_sub_{k}")
 
-        R_s["mapping"] = N * R_s["mapping"]
 
+            m.addConstr(sum(x[j, k] for j in states_in_function) >= all_in_k[k] * len(states_in_function),
+                        f"c_func_{i}_sub_{k}_all_in")
 
-        for i in range(len(S)):
-            states_in_function = [j for j in range(n_states) if S[i][j] == 1]
-            
-            all_in_k = m.addVars(n_funcs, vtype=GRB.BINARY, name="all_in_k")
-            for k in range(n_funcs):
-            
-                for j in states_in_function:
-                    m.addConstr(x[j, k] >= all_in_k[k], f"c_func_{i}_state_{j}_sub_{k}")
 
-            
-                m.addConstr(sum(x[j, k] for j in states_in_function) >= all_in_k[k] * len(states_in_function),
-                            f"c_func_{i}_sub_{k}_all_in")
+        m.addConstr(sum(all_in_k[k] for k in range(n_funcs)) >= 1, f"c_func_{i}_at_least_one_sub")
 
-        
-            m.addConstr(sum(all_in_k[k] for k in range(n_funcs)) >= 1, f"c_func_{i}_at_least_one_sub")
+    for i in range(n_states):
+        m.addConstr(sum(x[i, j] for j in range(n_funcs)) == 1, "c1")
 
-        for i in range(n_states):
-            m.addConstr(sum(x[i, j] for j in range(n_funcs)) == 1, "c1")
-
-        flag = m.addVars(n_funcs, n_states, vtype=GRB.BINARY, name="flag")
-
-        for i in range(n_states):
-            for j in range(n_funcs):
-                m.addConstr(flag[j, i] >= x[i, j], f"flag1_{j}_{i}")
-
-        for i in range(n_states):
-            for j in range(1, n_funcs):  
-                m.addConstr(flag[j, i] <= sum(x[t, j - 1] for t in range(n_states)), f"flag2_{j}_{i}")
-
-
-        for relation in C:
-            state1, state2 = relation[0] - 1, relation[1] - 1  
-            for j in range(n_funcs):
-                m.addConstr(x[state1, j] == x[state2, j], f"c_state_relation_{state1}_{state2}_sub_{j}")
+    flag = m.addVars(n_funcs, n_states, vtype=GRB.BINARY, name="flag")
 
+    for i in range(n_states):
         for j in range(n_funcs):
-            m.addConstr((y[j] <= sum(x[i, j] for i in range(n_states))), "c5")
-            m.addConstr((sum(x[i, j] for i in range(n_states)) <= y[j] * M), "c6")
-
-        m.addConstr(num == sum(y[j] for j in range(n_funcs)))  
-
-        m.addConstr((1 - all_in_one) <= M * (num - 1), "c7")
-        m.addConstr((num - 1) <= M * (1 - all_in_one), "c8")
-
-
-        m.addConstr(Sub_deploy <= B_m + B1 + sum(D1_dict[T[i]] for i in range(n_states)) + M5 * (1 - all_in_one),
-                    "c8")
-        m.addConstr(Sub_deploy >= B_m + B1 + sum(D1_dict[T[i]] for i in range(n_states)) - M5 * (1 - all_in_one),
-                    "c9")
+            m.addConstr(flag[j, i] >= x[i, j], f"flag1_{j}_{i}")
 
-        m.addConstr(Sub_deploy <= num * B_p + sum(
-            x[i, j] * D1_dict[T[i]] for i in range(n_states) for j in range(n_funcs)) + M5 * all_in_one,
-                    "c10")
-        m.addConstr(Sub_deploy >= num * B_p + sum(
-            x[i, j] * D1_dict[T[i]] for i in range(n_states) for j in range(n_funcs)) - M5 * all_in_one,
-                    "c11")
+    for i in range(n_states):
+        for j in range(1, n_funcs):  
+            m.addConstr(flag[j, i] <= sum(x[t, j - 1] for t in range(n_states)), f"flag2_{j}_{i}")
 
 
-        mig = [0]*n_states
-        for st in range(n_states):
-            mig[st] = sum(x[st, j] * x[index, j] * (D1_dict[T[index]] + D2_dict[T[index]]+R_s[T[index]])  for j in range(n_funcs) for index in range(n_states) if index != st)
-        m.addConstr(migration == sum(mig[i] for i in range(n_states)))
-
+    for state1, state2 in C.pairs():
+        for j in range(n_funcs):
+            m.addConstr(x[state1, j] == x[state2, j], f"c_state_relation_{state1}_{state2}_sub_{j}")
 
-        redeploy = [0] * n_states
+    for j in range(n_funcs):
+        m.addConstr((y[j] <= sum(x[i, j] for i in range(n_states))), "c5")
+        m.addConstr((sum(x[i, j] for i in range(n_states)) <= y[j] * M), "c6")
 
-        for st in range(n_states):
-            redeploy[st] = sum(x[st, j] * (B2 + D1_dict[T[st]]) for j in range(n_funcs))
-        # m.addConstr(redeployment <= sum(redeploy[i] for i in range(n_states)) + M5 * all_in_one)
-        # m.addConstr(redeployment >= sum(redeploy[i] for i in range(n_states)) - M5 * all_in_one)
-        m.addConstr(redeployment <= sum(x[i, j] * (B2 + D1_dict[T[i]]) for j in range(n_funcs) for i in range(n_states)) + M5 * all_in_one)
-        m.addConstr(redeployment >= sum(x[i, j] * (B2 + D1_dict[T[i]]) for j in range(n_funcs) for i in range(n_states)) - M5 * all_in_one)
+    m.addConstr(num == sum(y[j] for j in range(n_funcs)))  
 
+    m.addConstr((1 - all_in_one) <= M * (num - 1), "c7")
+    m.addConstr((num - 1) <= M * (1 - all_in_one), "c8")
 
-        m.addConstr(redeployment <= sum(B_m + B1 + 47292 + D1_dict[T[i]] for i in range(n_states)) + M5 * (1 - all_in_one), "c14_")
-        m.addConstr(redeployment >= sum(B_m + B1 + 47292 + D1_dict[T[i]] for i in range(n_states)) - M5 * (1 - all_in_one), "c15_")
 
+    m.addConstr(Sub_deploy <= B_m + B1 + sum(d1) + M5 * (1 - all_in_one),
+                "c8")
+    m.addConstr(Sub_deploy >= B_m + B1 + sum(d1) - M5 * (1 - all_in_one),
+                "c9")
 
-        objective = gp.LinExpr()
-        objective += Sub_deploy + migration + redeployment
+    m.addConstr(Sub_deploy <= num * B_p + sum(
+        x[i, j] * d1[i] for i in range(n_states) for j in range(n_funcs)) + M5 * all_in_one,
+                "c10")
+    m.addConstr(Sub_deploy >= num * B_p + sum(
+        x[i, j] * d1[i] for i in range(n_states) for j in range(n_funcs)) - M5 * all_in_one,
+                "c11")
 
-        m.setObjective(objective, GRB.MINIMIZE)
-        m.Params.NonConvex = 2
 
-        m.optimize()
+    mig = [0]*n_states
+    for st in range(n_states):
+        mig[st] = sum(x[st, j] * x[index, j] * (d1[index] + d2[index] + r_s[index])  for j in range(n_funcs) for index in range(n_states) if index != st)
+    m.addConstr(migration == sum(mig[i] for i in range(n_states)))
 
-        var_names = []
 
-        if m.status == GRB.Status.OPTIMAL:
-            for i in range(n_states):
-                for j in range(n_funcs):
-                    
-                    var = x[i, j]
-                    if var.X == 1:
-                        var_names.append(var.VarName)
-                        
-            obj_val = m.ObjVal
+    redeploy = [0] * n_states
 
-            Sub_total_value = Sub_deploy.X + redeployment.X + migration.X
+    for st in range(n_states):
+        redeploy[st] = sum(x[st, j] * (B2 + d1[st]) for j in range(n_funcs))
+    # m.addConstr(redeployment <= sum(redeploy[i] for i in range(n_states)) + M5 * all_in_one)
+    # m.addConstr(redeployment >= sum(redeploy[i] for i in range(n_states)) - M5 * all_in_one)
+    m.addConstr(redeployment <= sum(x[i, j] * (B2 + d1[i]) for j in range(n_funcs) for i in range(n_states)) + M5 * all_in_one)
+    m.addConstr(redeployment >= sum(x[i, j] * (B2 + d1[i]) for j in range(n_funcs) for i in range(n_states)) - M5 * all_in_one)
 
-        elif m.status == GRB.Status.INFEASIBLE:
-            print('The model is infeasible. Calculating IIS...')
-            m.computeIIS()
-            m.write('infeasible.ilp')
 
+    m.addConstr(redeployment <= sum(B_m + B1 + B_r + d1[i] for i in range(n_states)) + M5 * (1 - all_in_one), "c14_")
+    m.addConstr(redeployment >= sum(B_m + B1 + B_r + d1[i] for i in range(n_states)) - M5 * (1 - all_in_one), "c15_")
+
+
+    objective = gp.LinExpr()
+    objective += Sub_deploy + migration + redeployment
+
+    m.setObjective(objective, GRB.MINIMIZE)
+    m.Params.NonConvex = 2
+
+    return m, [[x[i, j] for j in range(n_funcs)] for i in range(n_states)], (Sub_deploy, redeployment, migration)
+
+
+def cost_vectors(T, N, costs=None, group=None):
+    return (costs or DEFAULT_COSTS).vectors(T, N, group)
+
+
+class _SparseRows(object):
+    """
+    Accumulates constraint rows as COO triplets for a single addMConstr call.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.senses = []
+        self.rhs = []
+        self.names = []
+
+    def add_block(self, cols, vals, sense, rhs, names):
+        """
+        Add one row per entry of names. cols is a (rows, terms) array of
+        column indices; vals broadcasts against it.
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        first = len(self.names)
+        self.rows.append(np.repeat(np.arange(first, first + cols.shape[0], dtype=np.int64), cols.shape[1]))
+        self.cols.append(cols.ravel())
+        self.vals.append(np.broadcast_to(np.asarray(vals, dtype=float), cols.shape).ravel())
+        self.senses += [sense] * cols.shape[0]
+        self.rhs += [rhs] * cols.shape[0]
+        self.names += names
+
+    def matrix(self, n_cols):
+        if not self.names:
+            return sp.csr_matrix((0, n_cols))
+        return sp.csr_matrix((np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))),
+                             shape=(len(self.names), n_cols))
+
+    def add_to(self, m, columns):
+        if not self.names:
+            return
+        constrs = m.addMConstr(self.matrix(columns.shape[0]), columns, np.array(self.senses),
+                               np.array(self.rhs, dtype=float))
+        m.setAttr("ConstrName", constrs.tolist(), self.names)
+
+
+def build_partition_model_matrix(S, T, C, N):
+    """
+    The model of build_partition_model, with the same variables, constraints,
+    names and order, built from NumPy/SciPy coefficient matrices with
+    addMConstr/addMQConstr instead of one addConstr call per element.
+    """
+    n_states = len(T)
+    n_funcs = len(S)
+    if n_states == 0 or n_funcs == 0:
+        # 逐个构建时空求和会化为常数，这种退化情况直接沿用逐个构建的模型
+        return build_partition_model(S, T, C, N)
+    d1, d2, r_s = cost_vectors(T, N, group=colocation_components(S, C, n_states))
+
+    m = gp.Model("mip1", env=get_env())
+
+    m.Params.OutputFlag = 0
+
+    x = m.addMVar((n_states, n_funcs), vtype=GRB.BINARY, name="x")
+    y = m.addMVar(n_funcs, vtype=GRB.BINARY, name="y")
+
+    m.addMVar(n_funcs, vtype=GRB.BINARY, name="h")
+    m.addMVar(n_funcs, vtype=GRB.CONTINUOUS, name="h_d")
+    m.addMVar(n_funcs, vtype=GRB.BINARY, name="z")
+    m.addMVar(n_funcs, vtype=GRB.CONTINUOUS, name="all_deploy")
+
+    all_in_one = m.addVar(vtype=GRB.BINARY, name="all_in_one")
+    Sub_deploy = m.addVar(n_states, vtype=GRB.CONTINUOUS, name="Sub_deploy")
+    redeployment = m.addVar(vtype=GRB.CONTINUOUS, name="redeployment")
+    migration = m.addVar(vtype=GRB.CONTINUOUS, name="migration")
+    num = m.addVar(vtype=GRB.CONTINUOUS, name="num")
+
+    all_in_k = [m.addMVar(n_funcs, vtype=GRB.BINARY, name="all_in_k") for _ in range(n_funcs)]
+    flag = m.addMVar((n_funcs, n_states), vtype=GRB.BINARY, name="flag")
+
+    # 约束矩阵的列：x[i,j]、每个函数的 all_in_k[k]、flag[j,i]、y[j]
+    columns = gp.hstack([x.reshape(-1)] + all_in_k + [flag.reshape(-1), y])
+    X = np.arange(n_states * n_funcs).reshape(n_states, n_funcs)
+    A = n_states * n_funcs + np.arange(n_funcs * n_funcs).reshape(n_funcs, n_funcs)
+    FL = A.size + X.size + np.arange(n_funcs * n_states).reshape(n_funcs, n_states)
+    Y = A.size + X.size + FL.size + np.arange(n_funcs)
+
+    rows = _SparseRows()
+    for i in range(n_funcs):
+        states_in_function = S.row_indices(i)
+        n_used = len(states_in_function)
+        if n_used:
+            # 对每个 k：n_used 行 x[j,k] - all_in_k[k] >= 0，再一行 sum_j x[j,k] - n_used * all_in_k[k] >= 0；
+            # 行宽补齐为 n_used + 1（重复 all_in_k[k] 列，系数为 0）
+            used = X[states_in_function, :].T
+            state_cols = np.concatenate((used[:, :, None], np.repeat(A[i][:, None, None], n_used, axis=1)
+                                         .repeat(n_used, axis=2)), axis=2)
+            all_in_cols = np.concatenate((used, A[i][:, None]), axis=1)[:, None, :]
+            cols = np.concatenate((state_cols, all_in_cols), axis=1).reshape(-1, n_used + 1)
+            state_vals = np.zeros((n_used, n_used + 1))
+            state_vals[:, :2] = [1.0, -1.0]
+            all_in_vals = np.append(np.ones(n_used), -n_used)[None, :]
+            vals = np.tile(np.concatenate((state_vals, all_in_vals)), (n_funcs, 1))
+            names = []
+            for k in range(n_funcs):
+                names += [f"c_func_{i}_state_{j}_sub_{k}" for j in states_in_function]
+                names.append(f"c_func_{i}_sub_{k}_all_in")
+            rows.add_block(cols, vals, GRB.GREATER_EQUAL, 0.0, names)
         else:
-            print('The model has not been optimized or no solution was found.')
-
-        return var_names
+            rows.add_block(A[i][:, None], 0.0, GRB.LESS_EQUAL, 0.0,
+                           [f"c_func_{i}_sub_{k}_all_in" for k in range(n_funcs)])
+        rows.add_block(A[i][None, :], 1.0, GRB.GREATER_EQUAL, 1.0, [f"c_func_{i}_at_least_one_sub"])
+
+    rows.add_block(X, 1.0, GRB.EQUAL, 1.0, ["c1"] * n_states)
+
+    rows.add_block(np.stack((FL.T, X), axis=2).reshape(-1, 2), [1.0, -1.0], GRB.GREATER_EQUAL, 0.0,
+                   [f"flag1_{j}_{i}" for i in range(n_states) for j in range(n_funcs)])
+
+    if n_funcs > 1:
+        # flag[j,i] <= sum_t x[t,j-1]
+        prev_sub = np.broadcast_to(X.T[None, :-1, :], (n_states, n_funcs - 1, n_states))
+        cols = np.concatenate((FL.T[:, 1:, None], prev_sub), axis=2).reshape(-1, n_states + 1)
+        rows.add_block(cols, np.concatenate(([1.0], -np.ones(n_states))), GRB.LESS_EQUAL, 0.0,
+                       [f"flag2_{j}_{i}" for i in range(n_states) for j in range(1, n_funcs)])
+
+    relations = C.pairs()
+    if relations:
+        state1, state2 = (np.array(states) for states in zip(*relations))
+        rows.add_block(np.stack((X[state1], X[state2]), axis=2).reshape(-1, 2), [1.0, -1.0], GRB.EQUAL, 0.0,
+                       [f"c_state_relation_{s1}_{s2}_sub_{j}" for s1, s2 in relations for j in range(n_funcs)])
+
+    # c5: y[j] <= sum_i x[i,j]；c6: sum_i x[i,j] <= M * y[j]
+    c5 = np.concatenate((Y[:, None], X.T), axis=1)
+    c6 = np.concatenate((X.T, Y[:, None]), axis=1)
+    c5_vals = np.append(1.0, -np.ones(n_states))
+    c6_vals = np.append(np.ones(n_states), -M)
+    rows.add_block(np.stack((c5, c6), axis=1).reshape(2 * n_funcs, n_states + 1), np.tile((c5_vals, c6_vals), (n_funcs, 1)),
+                   GRB.LESS_EQUAL, 0.0, ["c5", "c6"] * n_funcs)
+
+    rows.add_to(m, columns)
+
+    m.addConstr(num == gp.quicksum(y.tolist()))
+
+    m.addConstr((1 - all_in_one) <= M * (num - 1), "c7")
+    m.addConstr((num - 1) <= M * (1 - all_in_one), "c8")
+
+    single_deploy = B_m + B1 + d1.sum()
+    m.addConstr(Sub_deploy <= single_deploy + M5 * (1 - all_in_one), "c8")
+    m.addConstr(Sub_deploy >= single_deploy - M5 * (1 - all_in_one), "c9")
+
+    x_vars = [var for row in x.tolist() for var in row]
+    split_deploy = num * B_p + gp.LinExpr(np.repeat(d1, n_funcs).tolist(), x_vars)
+    m.addConstr(Sub_deploy <= split_deploy + M5 * all_in_one, "c10")
+    m.addConstr(Sub_deploy >= split_deploy - M5 * all_in_one, "c11")
+
+    if n_states > 1:
+        # migration == sum_j sum_{st != index} x[st,j] * x[index,j] * w[index]
+        w = d1 + d2 + r_s
+        st, index, j = np.nonzero(np.broadcast_to(~np.eye(n_states, dtype=bool)[:, :, None],
+                                                  (n_states, n_states, n_funcs)))
+        Q = sp.coo_matrix((-w[index], (X[st, j], X[index, j])), shape=(X.size, X.size))
+        x_flat = x.reshape(-1)
+        m.addMQConstr(Q, np.array([1.0]), GRB.EQUAL, 0.0, x_flat, x_flat, gp.MVar.fromlist([migration]))
+    else:
+        m.addConstr(migration == 0)
+
+    redeploy = gp.LinExpr(np.repeat(B2 + d1, n_funcs).tolist(), x_vars)
+    m.addConstr(redeployment <= redeploy + M5 * all_in_one)
+    m.addConstr(redeployment >= redeploy - M5 * all_in_one)
+
+    full_redeploy = n_states * (B_m + B1 + B_r) + d1.sum()
+    m.addConstr(redeployment <= full_redeploy + M5 * (1 - all_in_one), "c14_")
+    m.addConstr(redeployment >= full_redeploy - M5 * (1 - all_in_one), "c15_")
+
+    objective = gp.LinExpr()
+    objective += Sub_deploy + migration + redeployment
+
+    m.setObjective(objective, GRB.MINIMIZE)
+    m.Params.NonConvex = 2
+
+    return m, x.tolist(), (Sub_deploy, redeployment, migration)
+
+
+class UnionFind(object):
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        # 以较小的下标为根，每个集合的根就是其中第一个元素
+        if root_i < root_j:
+            self.parent[root_j] = root_i
+        elif root_j < root_i:
+            self.parent[root_i] = root_j
+
+
+def colocation_components(S, C, n_states):
+    """
+    Presolve: groups of states that must share a sub-contract, i.e. the
+    states one function uses and the states linked by an initializer
+    relation in C. Returns the group of every state, with groups numbered
+    in order of their first state.
+    """
+    groups = UnionFind(n_states)
+
+    # 使用签名（S 中的一列）相同且非空的状态总被同一组函数使用，先按签名合并，
+    # 之后每个函数只需连接其中签名不同的状态
+    signature_first = {}
+    representative = np.arange(n_states)
+    if len(S) and n_states:
+        signatures = np.packbits(S.dense().T, axis=1)
+        used = signatures.any(axis=1)
+        for i in np.flatnonzero(used).tolist():
+            first = signature_first.setdefault(signatures[i].tobytes(), i)
+            if first != i:
+                groups.union(first, i)
+                representative[i] = first
+
+    for i in range(len(S)):
+        states_in_function = np.unique(representative[S.row_indices(i)]).tolist()
+        for j in states_in_function[1:]:
+            groups.union(states_in_function[0], j)
+    for state1, state2 in C.pairs():
+        groups.union(state1, state2)
+
+    roots = [groups.find(i) for i in range(n_states)]
+    firsts = sorted(set(roots))
+    rank = {root: k for k, root in enumerate(firsts)}
+    return np.array([rank[root] for root in roots], dtype=np.int64)
+
+
+class PartitionMILP(object):
+    """
+    The linear partition model in solver-neutral matrix form: minimize
+    obj @ v subject to A v (sense) rhs and lb <= v <= ub, with v[binary]
+    in {0, 1}. x_columns[i, j] is the column standing for x[i,j].
+    """
+
+    def __init__(self, n_states, n_subs):
+        self.n_states = n_states
+        self.n_subs = n_subs
+        self.col_names = []
+        self.lb = []
+        self.ub = []
+        self.binary = []
+        self.obj = []
+        self.x_columns = None
+        self.group_columns = None
+        self.pair_groups = None
+        self.pair_columns = None
+        self.sub_columns = None
+        self.all_in_one = None
+        self.num = None
+        self.terms = None
+        self.A = None
+        self.sense = None
+        self.rhs = None
+        self.row_names = None
+
+    @property
+    def n_cols(self):
+        return len(self.col_names)
+
+    def add_columns(self, names, lb=0.0, ub=np.inf, binary=False, obj=0.0):
+        first = len(self.col_names)
+        self.col_names += names
+        self.lb = np.append(self.lb, np.broadcast_to(lb, len(names)))
+        self.ub = np.append(self.ub, np.broadcast_to(ub, len(names)))
+        self.binary = np.append(self.binary, np.broadcast_to(binary, len(names))).astype(bool)
+        self.obj = np.append(self.obj, np.broadcast_to(obj, len(names)))
+        return first + np.arange(len(names))
+
+    def set_rows(self, rows):
+        self.A = rows.matrix(self.n_cols)
+        self.sense = np.array(rows.senses, dtype='<U1')
+        self.rhs = np.array(rows.rhs, dtype=float)
+        self.row_names = rows.names
+
+    def start_values(self, sub_of_group):
+        """
+        Column values of the partition that puts group k in sub-contract
+        sub_of_group[k] (numbered in first-occupant order).
+        """
+        values = np.zeros(self.n_cols)
+        n_used = int(sub_of_group.max()) + 1
+        values[self.group_columns[np.arange(len(sub_of_group)), sub_of_group]] = 1.0
+        group1, group2 = self.pair_groups
+        values[self.pair_columns] = sub_of_group[group1] == sub_of_group[group2]
+        values[self.sub_columns[:n_used]] = 1.0
+        values[self.all_in_one] = n_used == 1
+        values[self.num] = n_used
+        # Sub_deploy、redeployment、migration 由各自的等式行算出
+        for col, name in zip(self.terms, ("c9", "c11", "c10")):
+            row = self.row_names.index(name)
+            values[col] = self.rhs[row] - (self.A[row] @ values)[0]
+        return values
+
+    def var_names(self, values):
+        """
+        Names x[i,j] of the state placements set in a solution.
+        """
+        placed = np.asarray(values)[self.x_columns] > 0.5
+        return [f"x[{i},{j}]" for i, j in zip(*np.nonzero(placed))]
+
+
+def partition_milp(S, T, C, N, costs=None):
+    """
+    The partition model as a plain MILP, with the same optimum as
+    build_partition_model, solved over groups of states
+    (colocation_components) instead of single states:
+
+    - each group is one super-variable g[k,j] in place of the x rows of its
+      states, which replaces the all_in_k block of every function;
+    - migration only depends on which groups share a sub-contract, so each
+      pair of groups gets one variable p >= g[k,j] + g[l,j] - 1 (for every
+      j), instead of the x * x products. With w summed per group (W) and
+      group sizes n, migration = sum_k W[k] (n[k] - 1) + sum_{k<l} p (W[k] n[l] + W[l] n[k]);
+    - all_in_one is tied to num == 1 directly, so Sub_deploy and
+      redeployment are linear in num and all_in_one without big-M rows.
+
+    A group never spans two sub-contracts, so only min(n_funcs, groups)
+    sub-contracts are modelled. Sub-contracts are ordered by the first group
+    they hold (group k may only open sub-contract j if a group before k is
+    in sub-contract j-1), so every partition has exactly one solution.
+    costs is a CostModel (default: DEFAULT_COSTS).
+    """
+    costs = costs or DEFAULT_COSTS
+    n_states = len(T)
+    group = colocation_components(S, C, n_states)
+    d1, d2, r_s = costs.vectors(T, N, group)
+    w = d1 + d2 + r_s
+
+    n_groups = int(group.max()) + 1 if n_states else 0
+    n_subs = min(len(S), n_groups)
+    sizes = np.bincount(group, minlength=n_groups).astype(float)
+    weights = np.bincount(group, weights=w, minlength=n_groups)
+    group1, group2 = np.triu_indices(n_groups, 1)
+
+    milp = PartitionMILP(n_states, n_subs)
+
+    # g[k,j] = 1,说明第k组状态被放在第j个sub-contract中；第 k 组只能放在前 k+1 个sub-contract中
+    g_ub = (np.arange(n_subs)[None, :] <= np.arange(n_groups)[:, None]).astype(float)
+    G = milp.add_columns([f"g[{k},{j}]" for k in range(n_groups) for j in range(n_subs)], ub=g_ub.ravel(),
+                         binary=True).reshape(n_groups, n_subs)
+    # p = 1：这两组状态在同一个sub-contract中
+    P = milp.add_columns([f"p[{k},{l}]" for k, l in zip(group1, group2)], ub=1.0)
+    Y = milp.add_columns([f"y[{j}]" for j in range(n_subs)], ub=1.0, binary=True)
+    ALL_IN_ONE, = milp.add_columns(["all_in_one"], ub=1.0, binary=True)
+    NUM, = milp.add_columns(["num"])
+    SUB_DEPLOY, REDEPLOYMENT, MIGRATION = milp.add_columns(["Sub_deploy", "redeployment", "migration"], obj=1.0)
+    milp.x_columns = G[group]
+    milp.group_columns = G
+    milp.pair_groups = (group1, group2)
+    milp.pair_columns = P
+    milp.sub_columns = Y
+    milp.all_in_one = ALL_IN_ONE
+    milp.num = NUM
+    milp.terms = (SUB_DEPLOY, REDEPLOYMENT, MIGRATION)
+
+    rows = _SparseRows()
+    rows.add_block(G, 1.0, '=', 1.0, ["c1"] * n_groups)
+
+    # 对称性：第 k 组放在第 j 个sub-contract时，前面某一组必须在第 j-1 个中
+    for k in range(1, n_groups):
+        subs = np.arange(1, min(k + 1, n_subs))
+        if len(subs):
+            cols = np.concatenate((G[k, subs][:, None], G[:k, subs - 1].T), axis=1)
+            rows.add_block(cols, np.append(1.0, -np.ones(k)), '<', 0.0, [f"first_{k}_sub_{j}" for j in subs])
+
+    if len(group1) and n_subs:
+        # p >= g[k,j] + g[l,j] - 1
+        rows.add_block(np.stack((np.repeat(P[:, None], n_subs, axis=1), G[group1], G[group2]), axis=2)
+                       .reshape(-1, 3), [1.0, -1.0, -1.0], '>', -1.0,
+                       [f"pair_{k}_{l}_sub_{j}" for k, l in zip(group1, group2) for j in range(n_subs)])
+
+    if n_subs:
+        # c5: y[j] <= sum_k g[k,j]；c6: sum_k g[k,j] <= n_groups * y[j]
+        rows.add_block(np.concatenate((Y[:, None], G.T), axis=1), np.append(1.0, -np.ones(n_groups)), '<', 0.0,
+                       ["c5"] * n_subs)
+        rows.add_block(np.concatenate((G.T, Y[:, None]), axis=1), np.append(np.ones(n_groups), -n_groups), '<', 0.0,
+                       ["c6"] * n_subs)
+        # 与 flag 约束等价：第 j 个sub-contract非空时第 j-1 个也非空
+        rows.add_block(np.stack((Y[1:], Y[:-1]), axis=1), [1.0, -1.0], '<', 0.0,
+                       [f"order_{j}" for j in range(1, n_subs)])
+    rows.add_block(np.append(NUM, Y)[None, :], np.append(1.0, -np.ones(n_subs)), '=', 0.0, ["num"])
+
+    # all_in_one = 1 <=> num == 1
+    rows.add_block([[NUM, ALL_IN_ONE]], [1.0, max(n_subs - 1, 0)], '<', max(n_subs, 1), ["c7"])
+    rows.add_block([[NUM, ALL_IN_ONE]], [1.0, 1.0], '>', 2.0, ["c8"])
+
+    rows.add_block([[SUB_DEPLOY, NUM, ALL_IN_ONE]], [1.0, -costs.B_p, -(costs.B_m + costs.B1 - costs.B_p)], '=',
+                   d1.sum(), ["c9"])
+    pair_weights = weights[group1] * sizes[group2] + weights[group2] * sizes[group1]
+    rows.add_block(np.append(MIGRATION, P)[None, :], np.append(1.0, -pair_weights), '=', weights @ (sizes - 1),
+                   ["c10"])
+    rows.add_block([[REDEPLOYMENT, ALL_IN_ONE]], [1.0, -n_states * (costs.B_m + costs.B1 + costs.B_r - costs.B2)], '=',
+                   n_states * costs.B2 + d1.sum(), ["c11"])
+
+    milp.set_rows(rows)
+    return milp
+
+
+def build_partition_model_linear(S, T, C, N):
+    """
+    partition_milp loaded into Gurobi. The returned x has one row per state:
+    the g row of its group.
+    """
+    milp = partition_milp(S, T, C, N)
+    m, columns = solver_backend.GurobiBackend().build(milp)
+    columns = columns.tolist()
+    x = [[columns[col] for col in row] for row in milp.x_columns.tolist()]
+    return m, x, tuple(columns[col] for col in milp.terms)
+
+
+def solve_partition(S, T, C, N, backend=None, warm_start=False, profile=None, costs=None):
+    """
+    Build the linear partition model and solve it with a solver backend
+    (solver_backend.get_backend), within the budgets of profile (a
+    solver_backend.SolveProfile) if given. With warm_start the heuristic
+    partition is the starting solution, and is returned as is if the solver
+    finds nothing better in time. Returns the backend's result dict
+    (status, objective, bound, gap, nodes, timings) with the names of the
+    x[i,j] set to 1 and the sub-contract of every group.
+    """
+    milp = partition_milp(S, T, C, N, costs)
+    start = None
+    heuristic = None
+    if warm_start:
+        heuristic = heuristic_partition.heuristic_partition(S, T, C, N, costs)
+        if heuristic['sub_of_group'] is not None:
+            start = milp.start_values(heuristic['sub_of_group'])
+
+    result = solver_backend.get_backend(backend).solve(milp, start, profile)
+    values = result.pop('values')
+    if values is None and start is not None:
+        # 限定时间内没有解时退回启发式划分
+        heuristic.update(bound=result['bound'], gap=solver_backend.relative_gap(heuristic['objective'], result['bound']),
+                         nodes=result['nodes'], build_time=result.get('build_time'))
+        heuristic['runtime'] += result['runtime']
+        return heuristic
+    result['var_names'] = milp.var_names(values) if values is not None else []
+    result['sub_of_group'] = np.argmax(values[milp.group_columns], axis=1) if values is not None else None
+    return result
+
+
+def canonical_instance(S, T, C, N, costs=None):
+    """
+    Canonical form of a partition instance. The model only depends on the
+    groups of colocation_components, through their sizes and summed
+    migration weights, so sorting the groups by (size, weight) gives the
+    same form to instances that differ in the order or names of their
+    states and functions. Returns the cache key, the group of every state
+    and the canonical position of every group.
+    """
+    costs = costs or DEFAULT_COSTS
+    n_states = len(T)
+    group = colocation_components(S, C, n_states)
+    d1, d2, r_s = costs.vectors(T, N, group)
+    w = d1 + d2 + r_s
+
+    n_groups = int(group.max()) + 1 if n_states else 0
+    sizes = np.bincount(group, minlength=n_groups)
+    weights = np.bincount(group, weights=w, minlength=n_groups)
+    order = np.lexsort((weights, sizes))
+    position = np.empty(n_groups, dtype=np.int64)
+    position[order] = np.arange(n_groups)
+
+    key = DiskCache.make_key('partition', n_states, min(len(S), n_groups), float(d1.sum()),
+                             sizes[order].tolist(), weights[order].tolist(),
+                             [costs.B1, costs.B_m, costs.B_p, costs.B2, costs.B_r])
+    return key, group, position
+
+
+def solve_contract(S, T, C, N, backend=None, method=None, profile=None, costs=None):
+    """
+    Partition a contract: look the instance up in partition_cache by
+    canonical_instance, or else solve it by method, 'exact', 'heuristic' or
+    'warm' (default: $SMARTUPDATER_PARTITION or exact), within the budgets
+    of profile (default: SolveProfile.from_env()) and with the gas costs of
+    costs (default: DEFAULT_COSTS). Returns a result dict
+    like solve_partition's, with cached set on a cache hit. Raises
+    solver_backend.SolverError if the solver failed.
+    """
+    method = method or DEFAULT_METHOD
+    profile = profile or solver_backend.SolveProfile.from_env()
+    key, group, position = canonical_instance(S, T, C, N, costs)
+    # exact 和 warm 的最优解可以共用
+    key = DiskCache.make_key(key, 'heuristic' if method == 'heuristic' else 'exact')
+
+    cached = partition_cache.get(key)
+    if cached is not None:
+        sub = heuristic_partition.first_occupant_order(np.array(cached['sub_of_canonical'], dtype=np.int64)[position])
+        return {'status': cached.get('status', solver_backend.OPTIMAL), 'objective': cached['objective'],
+                'bound': cached.get('bound'), 'gap': cached.get('gap'), 'nodes': 0, 'runtime': 0.0,
+                'cached': True, 'sub_of_group': sub, 'var_names': [f"x[{i},{sub[group[i]]}]" for i in range(len(T))]}
+
+    if method == 'heuristic':
+        result = heuristic_partition.heuristic_partition(S, T, C, N, costs)
+    else:
+        result = solve_partition(S, T, C, N, backend, method == 'warm', profile, costs)
+    result['cached'] = False
+
+    # 超时或按 MIPGap 提前停止得到的解不缓存，下次可能解得更好
+    if (result['status'] == solver_backend.OPTIMAL and profile.mip_gap is None) or \
+            (method == 'heuristic' and result['sub_of_group'] is not None):
+        partition_cache.put(key, {'status': result['status'], 'objective': result['objective'],
+                                  'bound': result.get('bound'), 'gap': result.get('gap'),
+                                  'sub_of_canonical': result['sub_of_group'][np.argsort(position)].tolist()})
+    return result
+
+
+def optimize_contract(S, T, C, N, backend=None, method=None, profile=None, costs=None):
+    """
+    Names x[i,j] of the state placements (see solve_contract), or None if
+    the solver failed.
+    """
+    try:
+        return solve_contract(S, T, C, N, backend, method, profile, costs)['var_names']
+
+    except solver_backend.SolverError as e:
+        print(e)
+        return None
+
+
+def insertion_milp(T, layout, N, costs=None):
+    """
+    Placement of new states into an existing partition. layout[i] is the
+    sub-contract (0..n_subs-1) state i is deployed in, or -1 for the new
+    states; the deployed states keep their sub-contract, so Sub_deploy and
+    redeployment do not change and only migration is minimized. With W and
+    n summed per sub-contract, putting new state i in sub-contract j costs
+    W[j] + w[i] n[j], and two new states in one sub-contract cost
+    w[i] + w[l] more (one pair variable each, as in partition_milp).
+    """
+    layout = np.asarray(layout, dtype=np.int64)
+    # 已部署的状态按所在子合约成组，新状态各自一组
+    d1, d2, r_s = cost_vectors(T, N, costs, np.where(layout < 0, len(layout) + np.arange(len(layout)), layout))
+    w = d1 + d2 + r_s
+
+    new = np.flatnonzero(layout < 0)
+    old = np.flatnonzero(layout >= 0)
+    n_subs = int(layout.max()) + 1 if len(old) else 0
+    sizes = np.bincount(layout[old], minlength=n_subs).astype(float)
+    weights = np.bincount(layout[old], weights=w[old], minlength=n_subs)
+    new1, new2 = np.triu_indices(len(new), 1)
+
+    milp = PartitionMILP(len(new), n_subs)
+    cost = weights[None, :] + np.outer(w[new], sizes)
+    G = milp.add_columns([f"g[{k},{j}]" for k in range(len(new)) for j in range(n_subs)], ub=1.0,
+                         binary=True).reshape(len(new), n_subs)
+    P = milp.add_columns([f"p[{k},{l}]" for k, l in zip(new1, new2)], ub=1.0)
+    MIGRATION, = milp.add_columns(["migration"], obj=1.0)
+    milp.x_columns = G
+    milp.group_columns = G
+    milp.pair_groups = (new1, new2)
+    milp.pair_columns = P
+    milp.terms = (MIGRATION,)
+    milp.new_states = new
+
+    rows = _SparseRows()
+    rows.add_block(G, 1.0, '=', 1.0, ["c1"] * len(new))
+    if len(new1) and n_subs:
+        rows.add_block(np.stack((np.repeat(P[:, None], n_subs, axis=1), G[new1], G[new2]), axis=2)
+                       .reshape(-1, 3), [1.0, -1.0, -1.0], '>', -1.0,
+                       [f"pair_{k}_{l}_sub_{j}" for k, l in zip(new1, new2) for j in range(n_subs)])
+    pair_weights = w[new][new1] + w[new][new2]
+    rows.add_block(np.concatenate(([MIGRATION], G.ravel(), P))[None, :],
+                   np.concatenate(([1.0], -cost.ravel(), -pair_weights)), '=', weights @ (sizes - 1), ["migration"])
+    milp.set_rows(rows)
+    return milp
+
+
+def place_new_states(T, layout, N, backend=None, profile=None, costs=None):
+    """
+    Sub-contract of every new state (layout[i] == -1) that adds the least
+    migration cost to the deployed partition, solved from the placement
+    that puts them all in sub-contract 0. Returns a dict with the status,
+    the objective, the solve time and the sub-contract of each new state
+    (sub_of_new, in order of the new states), or None if the solver failed.
+    """
+    profile = profile or solver_backend.SolveProfile.from_env()
+    milp = insertion_milp(T, layout, N, costs)
+    if milp.n_subs == 0 or len(milp.new_states) == 0:
+        return None
+
+    start = np.zeros(milp.n_cols)
+    start[milp.group_columns[:, 0]] = 1.0
+    start[milp.pair_columns] = 1.0
+    row = milp.row_names.index("migration")
+    start[milp.terms[0]] = milp.rhs[row] - (milp.A[row] @ start)[0]
 
-    except gp.GurobiError as e:
-        print('Error code ' + str(e.errno) + ': ' + str(e))
-        return None, None
\ No newline at end of file
+    try:
+        result = solver_backend.get_backend(backend).solve(milp, start, profile)
+    except solver_backend.SolverError as e:
+        print(e)
+        return None
+    values = result.pop('values')
+    if values is None:
+        return None
+    result['sub_of_new'] = np.argmax(values[milp.group_columns], axis=1)
+    return result
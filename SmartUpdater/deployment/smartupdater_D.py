@@ -2,122 +2,131 @@ import sys
 import os
 import re
 import json
+import time
 import optimization_partition
+import solver_backend
+import key_counts
+import cost_model
+import storage_layout
+import dispatch_table
+from solidity_syntax import Syntax
+import contract_model
+import identifier_index
+from usage_matrix import BitMatrix
 import solidityVersion
 import slither
 from packaging import version
-from solcx import compile_standard, install_solc,get_installed_solc_versions
-from solcx.exceptions import SolcNotInstalled
 
-state_vars = []
-mappings = []
-functions = []
-events = []
-modifiers = []
-structs = []
-enums = []
-
-pragma_statements = []
+class SplitSession(object):
+    """
+    Per-contract state of one split_contract run. Each run gets its own
+    session, so contracts can be split repeatedly or concurrently in one
+    process; generated files go to output_dir. Stage timings (seconds) and
+    the final variable -> sub-contract assignment are kept for reporting,
+    with the partition solve summary (status, objective, gap, nodes).
+    """
 
-def split_contract(input_file, logic_contract_name, proxy_contract_name, hyperlayer_contract_name):
+    __slots__ = ('model', 'state_vars', 'mappings', 'functions', 'events', 'modifiers', 'structs', 'enums',
+                 'pragma_statements', 'output_dir', 'timings', 'var_partition', 'partition_result')
+
+    def __init__(self, model, output_dir='.', timings=None):
+        self.model = model
+        self.state_vars = model.state_vars
+        self.mappings = model.mappings
+        self.functions = model.functions
+        self.events = model.events
+        self.modifiers = model.modifiers
+        self.structs = model.structs
+        self.enums = model.enums
+        self.pragma_statements = model.pragma_statements
+        self.output_dir = output_dir
+        self.timings = timings if timings is not None else {}
+        self.var_partition = {}
+        self.partition_result = None
+
+    def output_path(self, file_name):
+        return os.path.join(self.output_dir, file_name)
+
+def record_stage(timings, stage, stage_start):
+    now = time.perf_counter()
+    timings[stage] = now - stage_start
+    return now
+
+def split_contract(input_file, logic_contract_name, proxy_contract_name, hyperlayer_contract_name, output_dir='.',
+                   mapping_key_counts=None, cost_model_file=None, dispatch='mapping', call_path='proxy',
+                   solver_log=None, on_progress=None):
     with open(input_file, 'r') as f:
         content = f.read()
 
-    # 提取 Solidity 版本号并安装对应的 solc 版本
+    timings = {}
+    stage_start = time.perf_counter()
+
+    # 解析 pragma 并选择（必要时安装）对应的 solc 版本
     try:
-        solc_version = extract_solidity_version(content)
-        install_solc_version(solc_version)
+        solc_version = solidityVersion.resolve_solc_version(content)
     except Exception as e:
-        print(f"Error installing solc version: {e}")
-        sys.exit(1)
+        raise RuntimeError(f"Error installing solc version: {e}") from e
+    stage_start = record_stage(timings, 'resolve', stage_start)
 
     try:
-        compiled_sol = compile_standard({
-            "language": "Solidity",
-            "sources": {
-                "Contract.sol": {
-                    "content": content
-                }
-            },
-            "settings": {
-                "outputSelection": {
-                    "*": {
-                        "*": [
-                            "ast",
-                            "evm.bytecode",
-                            "abi"
-                        ]
-                    }
-                }
-            }
-        }, solc_version=solc_version)
+        model = contract_model.build_contract_model(content, solc_version)
     except Exception as e:
-        print(f"Error compiling the Solidity contract: {e}")
-        sys.exit(1)
-
+        raise RuntimeError(f"Error compiling the Solidity contract: {e}") from e
+    stage_start = record_stage(timings, 'compile', stage_start)
 
-    ast = solidityVersion.parse_solidity_code_with_solc(content)
-
-
-    # 找到合约定义
-    contracts = {}
-    for node in ast['nodes']:
-        if node['nodeType'] == 'ContractDefinition':
-            contracts[node['name']] = node
-
-    if not contracts:
+    if model.contract_ast is None:
         print("No contract definition found.")
         return
 
-    original_contract_name = list(contracts.keys())[0]
-    contract_ast = contracts[original_contract_name]
-
-    # 遍历合约节点，提取信息
-    for item in contract_ast['nodes']:
-        if item['nodeType'] == 'VariableDeclaration':
-            state_vars.append(item)
-            if item['typeName']['nodeType'] == 'Mapping':
-                mappings.append(item['name'])
-        elif item['nodeType'] == 'FunctionDefinition':
-            functions.append(item)
-        elif item['nodeType'] == 'EventDefinition':
-            events.append(item)
-        elif item['nodeType'] == 'ModifierDefinition':
-            modifiers.append(item)
-        elif item['nodeType'] == 'StructDefinition':
-            structs.append(item)
-        elif item['nodeType'] == 'EnumDefinition':
-            enums.append(item)
-
-
-    struct_names = set()
-    enum_names = set()
-    for struct in structs:
-        struct_names.add(struct['name'])
-    for enum in enums:
-        enum_names.add(enum['name'])
-
-    for node in ast['nodes']:
-        if node['nodeType'] == 'PragmaDirective':
-            # Join literals without extra spaces between version numbers and symbols
-            pragma_version = ''.join(node['literals'][1:])
-            pragma_statements.append('pragma {} {};'.format(node['literals'][0], pragma_version))
-
-    pragma_code = '\n'.join(pragma_statements) + '\n\n'
-
-
-    solidity_version_str = get_solidity_version(pragma_statements)
-    is_solidity_0_6_or_above = version_compare(solidity_version_str, '0.6.0')
-
-    S, T, C = optimization_partition.analyze_contract(input_file)
-    N = 13
-
-    var_names = optimization_partition.optimize_contract(S, T, C, N)
-
-
-    partition_generate_contracts(var_names, S, pragma_code, is_solidity_0_6_or_above, logic_contract_name, proxy_contract_name, hyperlayer_contract_name, original_contract_name)
+    os.makedirs(output_dir, exist_ok=True)
+    session = SplitSession(model, output_dir, timings)
+
+    is_solidity_0_6_or_above = version_compare(str(solc_version), '0.6.0')
+
+    S, T, C = optimization_partition.analyze_contract(model)
+    # 每个 mapping 的预计键数量，没有估计值时为 13
+    N = key_counts.key_count_vector(model.state_vars, mapping_key_counts)
+    # 按编译器版本选用校准过的成本
+    costs = None
+    if cost_model_file:
+        try:
+            costs = cost_model.CostModel.calibrated(cost_model_file, solc_version, optimization_partition.DEFAULT_COSTS)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Error loading the cost model: {e}") from e
+    stage_start = record_stage(timings, 'analyze', stage_start)
+
+    # IIS 写到输出目录，并发运行时不会互相覆盖；solver_log 和 on_progress 为 None 时按环境变量
+    options = {'iis_path': session.output_path(solver_backend.DEFAULT_IIS_PATH)}
+    if solver_log is not None:
+        options.update(verbose=solver_log, on_progress=solver_backend.print_progress if solver_log else None)
+    if on_progress is not None:
+        options['on_progress'] = on_progress
+    profile = solver_backend.SolveProfile.from_env(**options)
+    try:
+        result = optimization_partition.solve_contract(S, T, C, N, profile=profile, costs=costs)
+    except solver_backend.SolverError as e:
+        print(e)
+        raise RuntimeError("The partition optimization failed.") from e
+    stage_start = record_stage(timings, 'optimize', stage_start)
+    session.partition_result = {name: result.get(name) for name in
+                                ('status', 'objective', 'bound', 'gap', 'nodes', 'runtime', 'cached')}
+    var_names = result['var_names']
+
+
+    partition_generate_contracts(session, var_names, is_solidity_0_6_or_above, logic_contract_name, proxy_contract_name, hyperlayer_contract_name,
+                                 dispatch, call_path)
+    record_stage(timings, 'generate', stage_start)
+    return session
+
+def partition_generate_contracts(session, var_names, is_solidity_0_6_or_above, logic_contract_name, proxy_contract_name, hyperlayer_contract_name,
+                                 dispatch='mapping', call_path='proxy'):
+    model = session.model
+    state_vars = session.state_vars
+    functions = session.functions
+    S = model.S
+    pragma_code = model.pragma_code
+    contract_name = model.name
 
-def partition_generate_contracts(var_names, S, pragma_code, is_solidity_0_6_or_above, logic_contract_name, proxy_contract_name, hyperlayer_contract_name, contract_name):
     var_partition = {}  
     for var_name in var_names:
         match = re.match(r'x\[(\d+),(\d+)\]', var_name)
@@ -127,6 +136,7 @@ def partition_generate_contracts(var_names, S, pragma_code, is_solidity_0_6_or_a
             var_partition[var_idx] = sub_state_idx
         else:
             print(f"Invalid var_name format: {var_name}")
+    session.var_partition = var_partition
 
     # 构建子状态合约的状态变量列表
     sub_state_vars = {}  
@@ -136,46 +146,23 @@ def partition_generate_contracts(var_names, S, pragma_code, is_solidity_0_6_or_a
             sub_state_vars[sub_state_idx] = []
         sub_state_vars[sub_state_idx].append(var)
 
-    definitions_dependencies = collect_definitions_dependencies()
+    # 重排各子合约的变量使小类型共用存储槽，状态合约和逻辑合约使用同一顺序
+    enums = {enum['name'] for enum in session.enums}
+    structs = {struct['name'] for struct in session.structs}
+    source_order_vars = dict(sub_state_vars)
+    if storage_layout.PACK_SLOTS:
+        for sub_state_idx, vars_in_contract in sub_state_vars.items():
+            sub_state_vars[sub_state_idx] = storage_layout.pack_state_vars(vars_in_contract, enums, structs)
 
-    sub_logic_definitions = partition_definitions(definitions_dependencies, var_partition)
+    definitions_dependencies = identifier_index.build_identifier_index(model).definitions_dependencies()
 
- 
-    function_var_usage = []  
-    for func_usage in S:
-        var_indices = set()
-        for var_idx, usage in enumerate(func_usage):
-            if usage == 1:
-                var_indices.add(var_idx)
-        function_var_usage.append(var_indices)
-
-    function_sub_state_contracts = []
-    for var_indices in function_var_usage:
-        sub_state_indices = set()
-        for var_idx in var_indices:
-            sub_state_idx = var_partition.get(var_idx)
-            if sub_state_idx is not None:
-                sub_state_indices.add(sub_state_idx)
-        function_sub_state_contracts.append(sub_state_indices)
-
-    function_dependencies = []  
+    sub_logic_definitions = partition_definitions(definitions_dependencies, var_partition, len(state_vars))
 
-    for func in functions:
-        deps = {
-            'events': set(),
-            'modifiers': set(),
-            'structs': set(),
-            'enums': set()
-        }
-
-        if 'modifiers' in func and func['modifiers']:
-            for modifier in func['modifiers']:
-                deps['modifiers'].add(modifier['modifierName']['name'])
-
-        if func.get('body'):
-            collect_function_dependencies(func['body'], deps)
-        function_dependencies.append(deps)
+ 
+    # 每个函数用到的状态变量分布在哪些子状态合约中
+    function_sub_state_contracts = S.sub_contract_sets(var_partition)
 
+    function_dependencies = identifier_index.build_identifier_index(model).function_dependencies()
 
     sub_logic_functions = {}  
     other_functions = []  
@@ -196,7 +183,8 @@ def partition_generate_contracts(var_names, S, pragma_code, is_solidity_0_6_or_a
 
     # 生成子状态合约
     for sub_state_idx, vars_in_contract in sub_state_vars.items():
-        generate_state_contract(sub_state_idx, vars_in_contract, pragma_code, is_solidity_0_6_or_above, proxy_contract_name)
+        generate_state_contract(session, sub_state_idx, vars_in_contract, pragma_code, is_solidity_0_6_or_above, proxy_contract_name,
+                                call_path)
 
     # 生成子逻辑合约
     for sub_state_idx, (funcs_in_contract, deps) in sub_logic_functions.items():
@@ -207,24 +195,33 @@ def partition_generate_contracts(var_names, S, pragma_code, is_solidity_0_6_or_a
         
         for key in definitions:
             definitions[key].update(deps[key])
-        generate_logic_contract(sub_state_idx, funcs_in_contract, vars_in_contract, pragma_code, definitions, logic_contract_name)
+        generate_logic_contract(session, sub_state_idx, funcs_in_contract, vars_in_contract, pragma_code, definitions, logic_contract_name)
 
     # 生成 Hyperlayer
-    generate_hyperlayer_contract(pragma_code, is_solidity_0_6_or_above, hyperlayer_contract_name)
+    routes = hyperlayer_routes(session, sub_logic_functions, enums, structs)
+    if dispatch == 'mapping':
+        generate_hyperlayer_contract(session, pragma_code, is_solidity_0_6_or_above, hyperlayer_contract_name, call_path)
+    else:
+        generate_table_hyperlayer_contract(session, pragma_code, hyperlayer_contract_name, routes, sorted(sub_state_vars),
+                                           hybrid=(dispatch == 'hybrid'), call_path=call_path)
+    save_dispatch(session, routes, dispatch, sorted(sub_state_vars), contract_name, call_path)
 
     
-    save_sub_state_vars_info(sub_state_vars, contract_name)
-    generate_var_types_json(contract_name)
-    save_mappings(var_partition, function_sub_state_contracts, contract_name)
-
-def save_mappings(var_partition, function_sub_state_contracts, contract_name):
+    save_sub_state_vars_info(session, sub_state_vars, contract_name)
+    save_storage_layout(session, sub_state_vars, source_order_vars, contract_name, enums, structs)
+    generate_var_types_json(session, contract_name)
+    save_mappings(session, var_partition, function_sub_state_contracts, contract_name)
+
+def save_mappings(session, var_partition, function_sub_state_contracts, contract_name):
+    state_vars = session.state_vars
+    functions = session.functions
     
     var_mapping = {}
     for var_idx, sub_state_idx in var_partition.items():
         var_name = state_vars[var_idx]['name']
         var_mapping[var_name] = sub_state_idx
 
-    with open(f"{contract_name}_var_mapping.json", 'w') as f:
+    with open(session.output_path(f"{contract_name}_var_mapping.json"), 'w') as f:
         json.dump(var_mapping, f)
 
     func_mapping = {}
@@ -232,126 +229,56 @@ def save_mappings(var_partition, function_sub_state_contracts, contract_name):
         func_name = functions[func_idx]['name']
         func_mapping[func_name] = list(sub_state_indices)
 
-    with open(f"{contract_name}_func_mapping.json", 'w') as f:
+    with open(session.output_path(f"{contract_name}_func_mapping.json"), 'w') as f:
         json.dump(func_mapping, f)
 
-def collect_function_dependencies(node, deps):
-    if isinstance(node, dict):
-        node_type = node.get('nodeType')
-        if node_type == 'EmitStatement':
-            event_name = node['eventCall']['expression']['name']
-            deps['events'].add(event_name)
-        elif node_type == 'VariableDeclarationStatement':
-            var_type = node['declarations'][0]['typeName']
-            if var_type['nodeType'] == 'UserDefinedTypeName':
-                type_name = var_type['namePath']
-                
-        # 递归遍历子节点
-        for key, value in node.items():
-            if isinstance(value, dict) or isinstance(value, list):
-                collect_function_dependencies(value, deps)
-    elif isinstance(node, list):
-        for item in node:
-            collect_function_dependencies(item, deps)
-
-def collect_definitions_dependencies():
-    
-    state_var_indices = {var['name']: idx for idx, var in enumerate(state_vars)}
-
-    definitions_dependencies = {
-        'events': {},    # key: event name, value: set of state variable indices
-        'modifiers': {},
-        'structs': {},
-        'enums': {}
-    }
-
-    for event in events:
-        deps = set()
-        for param in event['parameters']['parameters']:
-            collect_type_dependencies(param['typeName'], deps, state_var_indices)
-        definitions_dependencies['events'][event['name']] = deps
-
-    for modifier in modifiers:
-        deps = set()
-        if modifier.get('body'):
-            collect_node_dependencies(modifier['body'], deps, state_var_indices)
-        definitions_dependencies['modifiers'][modifier['name']] = deps
-
-    for struct in structs:
-        deps = set()
-        for member in struct['members']:
-            collect_type_dependencies(member['typeName'], deps, state_var_indices)
-        definitions_dependencies['structs'][struct['name']] = deps
-
-    for enum in enums:
-        definitions_dependencies['enums'][enum['name']] = set()
-
-    return definitions_dependencies
-
-def collect_type_dependencies(type_node, deps, state_var_indices):
-    if type_node['nodeType'] == 'UserDefinedTypeName':
-        type_name = type_node['namePath']
-        if type_name in state_var_indices:
-            deps.add(state_var_indices[type_name])
-    elif type_node['nodeType'] == 'Mapping':
-        collect_type_dependencies(type_node['keyType'], deps, state_var_indices)
-        collect_type_dependencies(type_node['valueType'], deps, state_var_indices)
-    elif type_node['nodeType'] == 'ArrayTypeName':
-        collect_type_dependencies(type_node['baseType'], deps, state_var_indices)
-
-def collect_node_dependencies(node, deps, state_var_indices):
-    if isinstance(node, dict):
-        if node['nodeType'] == 'Identifier':
-            name = node['name']
-            if name in state_var_indices:
-                deps.add(state_var_indices[name])
-        else:
-            for key, value in node.items():
-                if isinstance(value, dict) or isinstance(value, list):
-                    collect_node_dependencies(value, deps, state_var_indices)
-    elif isinstance(node, list):
-        for item in node:
-            collect_node_dependencies(item, deps, state_var_indices)
-
-def partition_definitions(definitions_dependencies, var_partition):
+def partition_definitions(definitions_dependencies, var_partition, n_states):
     sub_logic_definitions = {}  
 
     for def_type in definitions_dependencies:
-        for def_name, deps in definitions_dependencies[def_type].items():
-            
-            sub_state_indices = set()
-            for var_idx in deps:
-                sub_state_idx = var_partition.get(var_idx)
-                if sub_state_idx is not None:
-                    sub_state_indices.add(sub_state_idx)
-            
+        def_names = list(definitions_dependencies[def_type])
+        deps = BitMatrix.from_sets([definitions_dependencies[def_type][name] for name in def_names], n_states)
+        for def_name, sub_state_indices in zip(def_names, deps.sub_contract_sets(var_partition)):
             for sub_state_idx in sub_state_indices:
                 if sub_state_idx not in sub_logic_definitions:
                     sub_logic_definitions[sub_state_idx] = {'events': set(), 'modifiers': set(), 'structs': set(), 'enums': set()}
                 sub_logic_definitions[sub_state_idx][def_type].add(def_name)
     return sub_logic_definitions
 
-def save_sub_state_vars_info(sub_state_vars, contract_name):
+def save_sub_state_vars_info(session, sub_state_vars, contract_name):
     info = {}
     for sub_state_idx, vars_in_contract in sub_state_vars.items():
         var_names = [var['name'] for var in vars_in_contract]
         info[sub_state_idx] = var_names
 
-    with open(f"{contract_name}_sub_state_vars_old.json", 'w') as f:
+    with open(session.output_path(f"{contract_name}_sub_state_vars_old.json"), 'w') as f:
         json.dump(info, f)
 
-def generate_var_types_json(contract_name):
+def save_storage_layout(session, sub_state_vars, source_order_vars, contract_name, enums=(), structs=()):
+    report = {}
+    for sub_state_idx, vars_in_contract in sub_state_vars.items():
+        layout, n_slots = storage_layout.slot_layout(vars_in_contract, enums, structs)
+        report[sub_state_idx] = {
+            'slots': n_slots,
+            'source_order_slots': storage_layout.slot_layout(source_order_vars[sub_state_idx], enums, structs)[1],
+            'variables': layout,
+        }
+
+    with open(session.output_path(f"{contract_name}_storage_layout.json"), 'w') as f:
+        json.dump(report, f, indent=4)
+
+def generate_var_types_json(session, contract_name):
     var_types = {}
-    for var in state_vars:
+    for var in session.state_vars:
         var_name = var['name']
         var_type = get_type_description(var['typeName'])
         var_types[var_name] = var_type
 
-    with open(f"{contract_name}_var_types.json", 'w') as f:
+    with open(session.output_path(f"{contract_name}_var_types.json"), 'w') as f:
         json.dump(var_types, f, indent=4)
     print(f"Generated '{contract_name}_var_types.json'")
 
-def generate_logic_contract(sub_state_idx, functions, state_vars, pragma_code, definitions, logic_contract_name):
+def generate_logic_contract(session, sub_state_idx, functions, state_vars, pragma_code, definitions, logic_contract_name):
     contract_name = f"{logic_contract_name}{sub_state_idx}"  # 例如：MyContractLogic0
 
     # 构建逻辑合约
@@ -366,7 +293,7 @@ def generate_logic_contract(sub_state_idx, functions, state_vars, pragma_code, d
 
     for var in state_vars:
         var_name = var['name']
-        if var_name in mappings:
+        if var_name in session.mappings:
             # print("var-------------------")
             # print(var_name)
             # print(var['typeName']['keyType']['name'])
@@ -380,7 +307,7 @@ def generate_logic_contract(sub_state_idx, functions, state_vars, pragma_code, d
 
     if definitions['events']:
         logic_contract += '\n    // 事件\n'
-        for event in events:
+        for event in session.events:
             if event['name'] in definitions['events']:
                 event_code = get_event_declaration(event)
                 logic_contract += '    ' + event_code + '\n'
@@ -388,33 +315,33 @@ def generate_logic_contract(sub_state_idx, functions, state_vars, pragma_code, d
 
     if definitions['modifiers']:
         logic_contract += '\n    // 修饰符\n'
-        for modifier in modifiers:
+        for modifier in session.modifiers:
             if modifier['name'] in definitions['modifiers']:
-                modifier_code = get_modifier_declaration(modifier)
+                modifier_code = get_modifier_declaration(modifier, session.mappings)
                 logic_contract += '    ' + modifier_code + '\n'
 
     if definitions['structs']:
         logic_contract += '\n    // 结构体\n'
-        for struct in structs:
+        for struct in session.structs:
             if struct['name'] in definitions['structs']:
                 struct_code = get_struct_declaration(struct)
                 logic_contract += '    ' + struct_code + '\n'
 
     if definitions['enums']:
         logic_contract += '\n    // 枚举\n'
-        for enum in enums:
+        for enum in session.enums:
             if enum['name'] in definitions['enums']:
                 enum_code = get_enum_declaration(enum)
                 logic_contract += '    ' + enum_code + '\n'
 
     for func in functions:
-        func_code = get_function_definition(func)
+        func_code = get_function_definition(func, session.mappings)
         logic_contract += func_code + '\n'
 
     logic_contract += '}\n'
 
     # 写入输出文件
-    with open(contract_name + '.sol', 'w') as f:
+    with open(session.output_path(contract_name + '.sol'), 'w') as f:
         f.write(logic_contract)
 
     print('Sub-logic contract is written to ' + contract_name + '.sol')
@@ -448,7 +375,8 @@ def get_mapping_value_type(type_node):
     return 'unknown'
 
 
-def generate_state_contract(sub_state_idx, state_vars, pragma_code, is_solidity_0_6_or_above, proxy_contract_name):
+def generate_state_contract(session, sub_state_idx, state_vars, pragma_code, is_solidity_0_6_or_above, proxy_contract_name,
+                            call_path='proxy'):
     contract_name = f"{proxy_contract_name}{sub_state_idx}"
     state_code = pragma_code
     state_code += 'contract ' + contract_name + ' {\n'
@@ -468,7 +396,16 @@ def generate_state_contract(sub_state_idx, state_vars, pragma_code, is_solidity_
     state_code += '    }\n'
 
     # 回退函数
-    if is_solidity_0_6_or_above:
+    if call_path == 'assembly':
+        state_code += f'    {Syntax(session.model.solc_version).fallback} {{\n'
+        state_code += '        assembly {\n'
+        state_code += '            // logicContract 是槽 0 的低 20 字节，同一槽中可能还有紧凑存储的变量\n'
+        state_code += '            let impl := and(sload(0), 0xffffffffffffffffffffffffffffffffffffffff)\n'
+        state_code += '            if iszero(impl) { revert(0, 0) }\n'
+        state_code += get_forwarder_code('delegatecall(gas(), impl, 0, calldatasize(), 0, 0)', '            ')
+        state_code += '        }\n'
+        state_code += '    }\n'
+    elif is_solidity_0_6_or_above:
         state_code += '    fallback() external payable {\n'
         state_code += '        address _impl = logicContract;\n'
         state_code += '        require(_impl != address(0));\n\n'
@@ -506,12 +443,12 @@ def generate_state_contract(sub_state_idx, state_vars, pragma_code, is_solidity_
 
     state_code += '}\n'
 
-    with open(contract_name + '.sol', 'w') as f:
+    with open(session.output_path(contract_name + '.sol'), 'w') as f:
         f.write(state_code)
 
     print('Sub-state contract is written to ' + contract_name + '.sol')
 
-def generate_hyperlayer_contract(pragma_code, is_solidity_0_6_or_above, hyperlayer_contract_name):
+def generate_hyperlayer_contract(session, pragma_code, is_solidity_0_6_or_above, hyperlayer_contract_name, call_path='proxy'):
 
     hyperlayer_contract = pragma_code
     hyperlayer_contract += 'contract ' + hyperlayer_contract_name + ' {\n'
@@ -524,7 +461,16 @@ def generate_hyperlayer_contract(pragma_code, is_solidity_0_6_or_above, hyperlay
     hyperlayer_contract += '        stateLogicMapping[funcSelector] = logicAddress;\n'
     hyperlayer_contract += '    }\n'
 
-    if is_solidity_0_6_or_above:
+    if call_path == 'assembly':
+        hyperlayer_contract += '\n    // 回退函数\n'
+        hyperlayer_contract += f'    {Syntax(session.model.solc_version).fallback} {{\n'
+        hyperlayer_contract += '        address target = stateLogicMapping[msg.sig];\n'
+        hyperlayer_contract += '        require(target != address(0), "Logic contract not found");\n'
+        hyperlayer_contract += '        assembly {\n'
+        hyperlayer_contract += get_forwarder_code('call(gas(), target, callvalue(), 0, calldatasize(), 0, 0)', '            ')
+        hyperlayer_contract += '        }\n'
+        hyperlayer_contract += '    }\n'
+    elif is_solidity_0_6_or_above:
         hyperlayer_contract += '\n    // 回退函数\n'
         hyperlayer_contract += '    fallback() external payable {\n'
         hyperlayer_contract += '        address target = stateLogicMapping[msg.sig];\n'
@@ -543,44 +489,135 @@ def generate_hyperlayer_contract(pragma_code, is_solidity_0_6_or_above, hyperlay
 
     hyperlayer_contract += '}\n'
 
-    with open(hyperlayer_contract_name + '.sol', 'w') as f:
+    with open(session.output_path(hyperlayer_contract_name + '.sol'), 'w') as f:
         f.write(hyperlayer_contract)
 
     print('Hyperlayer contract is written to ' + hyperlayer_contract_name + '.sol')
 
-def extract_solidity_version(code):
+def get_forwarder_code(call, indent):
     """
-    提取 Solidity 版本号。
+    Assembly that forwards the calldata with call (a call or delegatecall
+    expression reading its input from memory 0) and returns or reverts with
+    the callee's return data. Memory from 0 is scratch space here: the block
+    never returns to Solidity code.
     """
-    pragma_regex = r'pragma\s+solidity\s+([^;]+);'
-    match = re.search(pragma_regex, code)
-    if match:
-        version_spec = match.group(1).strip()
-        # 提取版本号，例如 '^0.8.0' 或 '>=0.7.0 <0.9.0'
-        version_number = version_spec.lstrip('^').split(' ')[0]
-        # print(f"Detected Solidity version specification: {version_number}")
-        return version_number
-    else:
-        raise ValueError("Pragma statement not found in the Solidity code.")
+    code = f'{indent}calldatacopy(0, 0, calldatasize())\n'
+    code += f'{indent}let result := {call}\n'
+    code += f'{indent}returndatacopy(0, 0, returndatasize())\n'
+    code += f'{indent}switch result\n'
+    code += f'{indent}case 0 {{ revert(0, returndatasize()) }}\n'
+    code += f'{indent}default {{ return(0, returndatasize()) }}\n'
+    return code
+
+def hyperlayer_routes(session, sub_logic_functions, enums=(), structs=()):
+    """
+    Selector -> sub-contract of every external function that has its own
+    logic contract.
+    """
+    routes = {}
+    conflicts = set()
+    for sub_state_idx, (funcs_in_contract, _) in sub_logic_functions.items():
+        for func in funcs_in_contract:
+            if not dispatch_table.is_external_function(func):
+                continue
+            selector = dispatch_table.function_selector(func, session.model.method_identifiers, enums, structs)
+            if selector is None:
+                print(f"No selector for {func['name']}, it is left out of the dispatch table.")
+            elif routes.get(selector, sub_state_idx) != sub_state_idx:
+                conflicts.add(selector)
+            else:
+                routes[selector] = sub_state_idx
+    for selector in conflicts:
+        print(f"Selector 0x{selector:08x} is in several sub-contracts, it is left out of the dispatch table.")
+        routes.pop(selector)
+    return routes
+
+def save_dispatch(session, routes, dispatch, state_subs, contract_name, call_path='proxy'):
+    info = {
+        'mode': dispatch,
+        'call_path': call_path,
+        'selectors': {f"0x{selector:08x}": sub_state_idx for selector, sub_state_idx in sorted(routes.items())},
+        # table/hybrid 的 Hyperlayer 构造函数参数：下标为子合约编号的状态合约地址数组的长度
+        'state_contracts': max(state_subs) + 1 if state_subs else 0,
+    }
+    with open(session.output_path(f"{contract_name}_dispatch.json"), 'w') as f:
+        json.dump(info, f, indent=4)
+
+def generate_table_hyperlayer_contract(session, pragma_code, hyperlayer_contract_name, routes, state_subs, hybrid=False,
+                                       call_path='proxy'):
+    syntax = Syntax(session.model.solc_version)
+    entries = sorted((selector, sub_state_idx + 1) for selector, sub_state_idx in routes.items())
+
+    hyperlayer_contract = pragma_code
+    hyperlayer_contract += 'contract ' + hyperlayer_contract_name + ' {\n'
 
-def install_solc_version(solc_version):
-    installed_versions = get_installed_solc_versions()
-    if solc_version not in installed_versions:
-        # print(f"Installing solc version {solc_version}...")
-        install_solc(solc_version)
+    # immutable 编在代码中，读取时没有 SLOAD；旧版本编译器只能存在定长数组中
+    if syntax.immutable:
+        hyperlayer_contract += '    // 各子合约的状态合约地址\n'
+        for sub_state_idx in state_subs:
+            hyperlayer_contract += f'    address private immutable state{sub_state_idx};\n'
+    elif state_subs:
+        hyperlayer_contract += '    // 各子合约的状态合约地址，下标为子合约编号\n'
+        hyperlayer_contract += f'    address[{max(state_subs) + 1}] private stateContracts;\n'
+
+    if hybrid:
+        hyperlayer_contract += '\n    // 部署后新增的选择器，不在选择器表中\n'
+        hyperlayer_contract += '    mapping(bytes4 => address) public stateLogicMapping;\n'
+
+    hyperlayer_contract += '\n    // 构造函数\n'
+    hyperlayer_contract += f"    {syntax.constructor_header(hyperlayer_contract_name, syntax.param('address[]', 'states'))} {{\n"
+    for sub_state_idx in state_subs:
+        if syntax.immutable:
+            hyperlayer_contract += f'        state{sub_state_idx} = states[{sub_state_idx}];\n'
+        else:
+            hyperlayer_contract += f'        stateContracts[{sub_state_idx}] = states[{sub_state_idx}];\n'
+    hyperlayer_contract += '    }\n'
+
+    if hybrid:
+        hyperlayer_contract += '\n    // 设置逻辑合约地址的方法\n'
+        hyperlayer_contract += '    function setLogicContract(bytes4 funcSelector, address logicAddress) public {\n'
+        hyperlayer_contract += '        stateLogicMapping[funcSelector] = logicAddress;\n'
+        hyperlayer_contract += '    }\n'
+
+    hyperlayer_contract += '\n    // 回退函数：在选择器表中二分查找子合约编号（加 1，0 表示不在表中）\n'
+    hyperlayer_contract += f'    {syntax.fallback} {{\n'
+    hyperlayer_contract += '        uint256 route = 0;\n'
+    if entries:
+        hyperlayer_contract += '        assembly {\n'
+        hyperlayer_contract += '            let sig := div(calldataload(0), 0x100000000000000000000000000000000000000000000000000000000)\n'
+        hyperlayer_contract += '\n'.join(dispatch_table.selector_tree(entries, 12)) + '\n'
+        hyperlayer_contract += '        }\n'
+    hyperlayer_contract += '        address target;\n'
+    if syntax.immutable:
+        for i, sub_state_idx in enumerate(sorted(set(routes.values()))):
+            keyword = 'if' if i == 0 else 'else if'
+            hyperlayer_contract += f'        {keyword} (route == {sub_state_idx + 1}) {{ target = state{sub_state_idx}; }}\n'
+    elif state_subs:
+        # 没有状态子合约时选择器表为空，route 总为 0
+        hyperlayer_contract += '        if (route != 0) { target = stateContracts[route - 1]; }\n'
+    if hybrid:
+        hyperlayer_contract += '        if (route == 0) { target = stateLogicMapping[msg.sig]; }\n'
+    hyperlayer_contract += '        require(target != address(0), "Logic contract not found");\n'
+    hyperlayer_contract += '        assembly {\n'
+    if call_path == 'assembly':
+        hyperlayer_contract += get_forwarder_code('call(gas(), target, callvalue(), 0, calldatasize(), 0, 0)', '            ')
     else:
-        print(f"solc version {solc_version} is already installed.")
-
-def get_solidity_version(pragma_statements):
-    for pragma in pragma_statements:
-        if 'solidity' in pragma:
-            version_part = pragma.split('solidity')[1].strip(' ;')
-            # 提取主版本号
-            import re
-            match = re.search(r'(\d+\.\d+\.\d+)', version_part)
-            if match:
-                return match.group(1)
-    return '0.4.21'  
+        hyperlayer_contract += '            let ptr := mload(0x40)\n'
+        hyperlayer_contract += '            calldatacopy(ptr, 0, calldatasize())\n'
+        hyperlayer_contract += '            let result := call(gas(), target, callvalue(), ptr, calldatasize(), 0, 0)\n'
+        hyperlayer_contract += '            let size := returndatasize()\n'
+        hyperlayer_contract += '            returndatacopy(ptr, 0, size)\n'
+        hyperlayer_contract += '            switch result\n'
+        hyperlayer_contract += '            case 0 { revert(ptr, size) }\n'
+        hyperlayer_contract += '            default { return(ptr, size) }\n'
+    hyperlayer_contract += '        }\n'
+    hyperlayer_contract += '    }\n'
+    hyperlayer_contract += '}\n'
+
+    with open(session.output_path(hyperlayer_contract_name + '.sol'), 'w') as f:
+        f.write(hyperlayer_contract)
+
+    print('Hyperlayer contract is written to ' + hyperlayer_contract_name + '.sol')
 
 def version_compare(v1, v2):
     from packaging import version
@@ -628,9 +665,9 @@ def get_event_declaration(event):
     event_code = 'event {}({});'.format(event['name'], params)
     return event_code
 
-def get_modifier_declaration(modifier):
+def get_modifier_declaration(modifier, mappings=()):
     params = get_parameter_list(modifier.get('parameters'))
-    body = get_block_code(modifier['body'])
+    body = get_block_code(modifier['body'], mappings)
     modifier_code = 'modifier {}({}) {}'.format(modifier['name'], params, body)
     return modifier_code
 
@@ -644,7 +681,7 @@ def get_enum_declaration(enum):
     enum_code = 'enum {} {{ {} }}'.format(enum['name'], members)
     return enum_code
 
-def get_function_definition(func):
+def get_function_definition(func, mappings=()):
     name = func['name'] if func['name'] else ''
     params = get_parameter_list(func.get('parameters'))
     visibility = func.get('visibility', '')
@@ -652,7 +689,7 @@ def get_function_definition(func):
     state_mutability = func.get('stateMutability', '')
     returns = get_return_parameters(func.get('returnParameters'))
 
-    body = get_block_code(func['body']) if func.get('body') else ';'
+    body = get_block_code(func['body'], mappings) if func.get('body') else ';'
 
     function_code = '    function {}({}) {} {} {}'.format(
         name,
@@ -685,20 +722,20 @@ def get_return_parameters(returns):
     return_params = get_parameter_list(returns)
     return 'returns ({})'.format(return_params)
 
-def get_block_code(block):
+def get_block_code(block, mappings=()):
     if not block:
         return '{}'
     if block['nodeType'] != 'Block':
-        stmt_code = get_statement_code(block)
+        stmt_code = get_statement_code(block, mappings)
         return '{\n' + stmt_code + '\n    }'
     else:
         statements = []
         for stmt in block['statements']:
-            stmt_code = get_statement_code(stmt)
+            stmt_code = get_statement_code(stmt, mappings)
             statements.append(stmt_code)
         return '{\n' + '\n'.join(statements) + '\n    }'
 
-def get_statement_code(stmt):
+def get_statement_code(stmt, mappings=()):
 
     if stmt['nodeType'] == 'ExpressionStatement':
         expr_code = get_expression_code(stmt['expression'])
@@ -736,17 +773,17 @@ def get_statement_code(stmt):
             return f'        {var_code};'
     elif stmt['nodeType'] == 'IfStatement':
         condition = get_expression_code(stmt['condition'])
-        true_body = get_block_code(stmt['trueBody'])
-        false_body = get_block_code(stmt['falseBody']) if stmt.get('falseBody') else ''
+        true_body = get_block_code(stmt['trueBody'], mappings)
+        false_body = get_block_code(stmt['falseBody'], mappings) if stmt.get('falseBody') else ''
         code = f'        if ({condition}) {true_body}\n'
         if false_body:
             code += f'        else {false_body}\n'
         return code
     elif stmt['nodeType'] == 'ForStatement':
-        init_stmt = get_statement_code(stmt['initializationExpression']) if stmt.get('initializationExpression') else ''
+        init_stmt = get_statement_code(stmt['initializationExpression'], mappings) if stmt.get('initializationExpression') else ''
         condition = get_expression_code(stmt['condition']) if stmt.get('condition') else ''
         loop_expr = get_expression_code(stmt['loopExpression']) if stmt.get('loopExpression') else ''
-        body = get_block_code(stmt['body'])
+        body = get_block_code(stmt['body'], mappings)
         code = f'        for ({init_stmt.strip(";")}; {condition}; {loop_expr}) {body}\n'
         return code
     elif stmt['nodeType'] == 'EmitStatement':
@@ -816,7 +853,9 @@ def get_expression_code(expr):
     else:
         return '/* 未实现的表达式类型：{} */'.format(expr['nodeType'])
 
-def mainfunc(input_file,path):
+def mainfunc(input_file,path,output_dir='.',key_counts_file=key_counts.DEFAULT_KEY_COUNTS_FILE,
+             cost_model_file=cost_model.DEFAULT_COST_MODEL_FILE, dispatch=dispatch_table.DEFAULT_DISPATCH,
+             call_path=dispatch_table.DEFAULT_CALL_PATH, solver_log=None, on_progress=None):
         contract_name = path
         logic_contract_name = contract_name + "Logic"
         proxy_contract_name = contract_name + "State"
@@ -824,4 +863,7 @@ def mainfunc(input_file,path):
 
         # print("Converting...")
 
-        split_contract(input_file, logic_contract_name, proxy_contract_name, hyperlayer_contract_name)
+        mapping_key_counts = key_counts.load_key_counts(key_counts_file, contract_name) if key_counts_file else None
+
+        return split_contract(input_file, logic_contract_name, proxy_contract_name, hyperlayer_contract_name, output_dir,
+                              mapping_key_counts, cost_model_file, dispatch, call_path, solver_log, on_progress)
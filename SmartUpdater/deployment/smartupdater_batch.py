@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+import json
+import time
+import logging
+import traceback
+import multiprocessing
+import multiprocessing.connection
+import smartupdater_D
+import solver_backend
+from diskCache import ast_cache
+from optimization_partition import partition_cache
+
+
+# slither 导入时会给根 logger 加上 handler，需要 force 才能生效
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s', force=True)
+log = logging.getLogger()
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'contract-info')
+
+
+def find_sources(corpus_dir):
+    sources = []
+    for root, _, files in os.walk(corpus_dir):
+        for name in files:
+            if name.endswith('.sol'):
+                sources.append(os.path.relpath(os.path.join(root, name), corpus_dir))
+    return sorted(sources)
+
+
+def load_checkpoint(result_log, retry_failed):
+    done = set()
+    if not os.path.exists(result_log):
+        return done
+    with open(result_log, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'ok' or not retry_failed:
+                done.add(record['source'])
+    return done
+
+
+def deploy_one(corpus_dir, source, output_dir, conn, solver_log=None):
+    """
+    Runs in a forked child: split one contract into its own output directory
+    and send a result record back through conn.
+    """
+    record = {'source': source, 'contract': os.path.dirname(source) or os.path.splitext(source)[0]}
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 子进程的输出写入各自目录下的日志，避免多个进程的输出交错
+    log_fd = os.open(os.path.join(output_dir, 'run.log'), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+
+    try:
+        name = os.path.splitext(os.path.basename(source))[0]
+        # 求解进度总是写入 run.log，solver_log 另外打开求解器自己的日志
+        session = smartupdater_D.mainfunc(os.path.join(corpus_dir, source), name, output_dir, solver_log=solver_log,
+                                          on_progress=solver_backend.print_progress)
+        if session is None:
+            record['status'] = 'no_contract'
+        else:
+            sizes = {}
+            for sub_state_idx in session.var_partition.values():
+                sizes[sub_state_idx] = sizes.get(sub_state_idx, 0) + 1
+            record.update({
+                'status': 'ok',
+                'contract_name': session.model.name,
+                'solc_version': str(session.model.solc_version),
+                'n_state_vars': len(session.state_vars),
+                'n_functions': len(session.functions),
+                'n_sub_contracts': len(sizes),
+                'partition_sizes': [sizes[idx] for idx in sorted(sizes)],
+                'partition': session.partition_result,
+                'timings': session.timings,
+            })
+    except BaseException as e:
+        traceback.print_exc()
+        record.update({'status': 'failed', 'error': f"{type(e).__name__}: {e}"})
+
+    record['elapsed'] = time.perf_counter() - start
+    record['ast_cache'] = {'hits': ast_cache.hits, 'misses': ast_cache.misses}
+    record['partition_cache'] = {'hits': partition_cache.hits, 'misses': partition_cache.misses}
+    sys.stdout.flush()
+    conn.send(record)
+    conn.close()
+
+
+def run_batch(corpus_dir, output_root, result_log, jobs, timeout, retry_failed=False, limit=None, solver_log=None):
+    sources = find_sources(corpus_dir)
+    done = load_checkpoint(result_log, retry_failed)
+    pending = [source for source in sources if source not in done]
+    if limit is not None:
+        pending = pending[:limit]
+    log.info("%d sources found, %d already recorded, %d to run with %d workers",
+             len(sources), len(sources) - len(pending), len(pending), jobs)
+
+    # fork 方式启动子进程：gurobipy/solcx 只在父进程导入一次，超时的子进程可以直接终止
+    ctx = multiprocessing.get_context('fork')
+    running = {}
+    counts = {}
+    batch_start = time.perf_counter()
+
+    os.makedirs(os.path.dirname(os.path.abspath(result_log)), exist_ok=True)
+    with open(result_log, 'a') as out:
+
+        def finish(source, record):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+            finished = sum(counts.values())
+            if finished % 50 == 0 or finished == len(pending):
+                log.info("%d/%d done (%s), %.1fs elapsed", finished, len(pending),
+                         ', '.join(f"{k}: {v}" for k, v in sorted(counts.items())), time.perf_counter() - batch_start)
+
+        queue = list(reversed(pending))
+        while queue or running:
+            while queue and len(running) < jobs:
+                source = queue.pop()
+                output_dir = os.path.join(output_root, os.path.splitext(source)[0])
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=deploy_one, args=(corpus_dir, source, output_dir, child_conn, solver_log))
+                proc.start()
+                child_conn.close()
+                running[source] = (proc, parent_conn, time.monotonic(), time.monotonic() + timeout)
+
+            multiprocessing.connection.wait([conn for _, conn, _, _ in running.values()], timeout=0.5)
+
+            now = time.monotonic()
+            for source, (proc, conn, started, deadline) in list(running.items()):
+                record = None
+                if conn.poll():
+                    try:
+                        record = conn.recv()
+                    except EOFError:
+                        record = None
+                    proc.join()
+                elif not proc.is_alive():
+                    proc.join()
+                    record = {'source': source, 'status': 'failed', 'error': f"worker exited with code {proc.exitcode}"}
+                elif now > deadline:
+                    proc.kill()
+                    proc.join()
+                    record = {'source': source, 'status': 'timeout', 'error': f"exceeded {timeout}s"}
+                else:
+                    continue
+                if record is None:
+                    record = {'source': source, 'status': 'failed', 'error': f"worker exited with code {proc.exitcode}"}
+                # 父进程生成的记录（超时、子进程崩溃）用父进程计时
+                record.setdefault('elapsed', time.monotonic() - started)
+                conn.close()
+                del running[source]
+                finish(source, record)
+
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SmartUpdater batch deployment over a contract corpus")
+    parser.add_argument("corpus", type=str, nargs='?', default=DEFAULT_CORPUS,
+                        help="Directory of Solidity sources (default: data/contract-info)")
+    parser.add_argument("-o", "--output", type=str, default="batch_output",
+                        help="Root directory for the per-contract outputs")
+    parser.add_argument("--log", type=str, default=None,
+                        help="JSONL result log, also used as the resume checkpoint (default: <output>/results.jsonl)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of parallel workers")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-contract timeout in seconds")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-run sources that failed or timed out")
+    parser.add_argument("--limit", type=int, default=None, help="Only run the first N pending sources")
+    parser.add_argument("--solver-log", action="store_true", default=None,
+                        help="Write the solver log to each run.log (default: $SMARTUPDATER_SOLVER_LOG)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.corpus):
+        log.error("Error: The specified corpus directory does not exist.")
+        sys.exit(1)
+
+    result_log = args.log or os.path.join(args.output, 'results.jsonl')
+    counts = run_batch(os.path.abspath(args.corpus), os.path.abspath(args.output), result_log, max(1, args.jobs),
+                       args.timeout, args.retry_failed, args.limit, args.solver_log)
+
+    log.info("Results: %s", ', '.join(f"{k}: {v}" for k, v in sorted(counts.items())) or 'nothing to do')
+    log.info("Result log written to %s", result_log)
@@ -5,6 +5,11 @@ import os
 import logging
 import sys
 import smartupdater_D
+import key_counts
+import cost_model
+import dispatch_table
+from diskCache import ast_cache
+from optimization_partition import partition_cache
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
@@ -12,6 +17,17 @@ log = logging.getLogger()
 
 parser = argparse.ArgumentParser(description="SmartUpdater Command Line Interface for Contract Conversion")
 parser.add_argument("contract_source", type=str, help="Path to the Solidity contract source file")
+parser.add_argument("--key-counts", type=str, default=key_counts.DEFAULT_KEY_COUNTS_FILE,
+                    help="JSON file with the expected number of keys of each mapping (default: $SMARTUPDATER_KEY_COUNTS)")
+parser.add_argument("--cost-model", type=str, default=cost_model.DEFAULT_COST_MODEL_FILE,
+                    help="Calibration file from calibrate_costs.py (default: $SMARTUPDATER_COST_MODEL)")
+parser.add_argument("--output-dir", type=str, default='.', help="Directory to write the generated contracts to")
+parser.add_argument("--dispatch", type=str, default=dispatch_table.DEFAULT_DISPATCH, choices=dispatch_table.DISPATCH_MODES,
+                    help="How the Hyperlayer finds the sub-contract of a call (default: $SMARTUPDATER_DISPATCH or mapping)")
+parser.add_argument("--call-path", type=str, default=dispatch_table.DEFAULT_CALL_PATH, choices=dispatch_table.CALL_PATHS,
+                    help="How the Hyperlayer and State contracts forward calls (default: $SMARTUPDATER_CALL_PATH or proxy)")
+parser.add_argument("--solver-log", action="store_true", default=None,
+                    help="Show the solver log and its progress (default: $SMARTUPDATER_SOLVER_LOG)")
 args = parser.parse_args()
 
 input_file = args.contract_source
@@ -22,8 +38,16 @@ if not os.path.exists(input_file):
 log.info("Starting Maintenance!")
 log.info("Compiling Solidity code %s", args.contract_source)
 name = os.path.splitext(os.path.basename(input_file))[0]
-smartupdater_D.mainfunc(input_file, name)
+try:
+    smartupdater_D.mainfunc(input_file, name, args.output_dir, key_counts_file=args.key_counts,
+                            cost_model_file=args.cost_model, dispatch=args.dispatch, call_path=args.call_path,
+                            solver_log=args.solver_log)
+except RuntimeError as e:
+    log.error("%s", e)
+    sys.exit(1)
 
 
+log.info("AST cache: %d hits, %d misses", ast_cache.hits, ast_cache.misses)
+log.info("Partition cache: %d hits, %d misses", partition_cache.hits, partition_cache.misses)
 log.info("Accomplish！")
 log.info("Exit！")
\ No newline at end of file
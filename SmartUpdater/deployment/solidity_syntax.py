@@ -0,0 +1,33 @@
+from packaging.version import Version
+
+
+class Syntax(object):
+    """
+    The constructs of the generated contracts that differ between compiler
+    versions.
+    """
+
+    def __init__(self, solc_version):
+        v = Version(str(solc_version))
+        self.pragma = f"pragma solidity {v};\n\n"
+        self.constructor = 'constructor' if v >= Version('0.4.22') else None
+        # 0.7 起构造函数不再写可见性
+        self.constructor_visibility = '' if v >= Version('0.7.0') else ' public'
+        if v >= Version('0.6.0'):
+            self.fallback = 'fallback() external payable'
+        elif v >= Version('0.5.0'):
+            self.fallback = 'function () external payable'
+        else:
+            self.fallback = 'function () public payable'
+        self.memory = ' memory' if v >= Version('0.5.0') else ''
+        self.emit = 'emit ' if v >= Version('0.4.21') else ''
+        # immutable 从 0.6.5 起可用，读取时不需要 SLOAD
+        self.immutable = v >= Version('0.6.5')
+
+    def param(self, t, name):
+        reference = t in ('string', 'bytes') or t.endswith(']')
+        return f"{t}{self.memory if reference else ''} {name}"
+
+    def constructor_header(self, contract_name, params):
+        constructor = self.constructor or f"function {contract_name}"
+        return f"{constructor}({params}){self.constructor_visibility}"
@@ -0,0 +1,373 @@
+import os
+import time
+import threading
+import numpy as np
+
+OPTIMAL = 'optimal'
+FEASIBLE = 'feasible'  # 达到时间限制，但已有可行解
+INFEASIBLE = 'infeasible'
+NO_SOLUTION = 'no_solution'
+
+DEFAULT_SOLVER = os.environ.get('SMARTUPDATER_SOLVER', 'gurobi')
+DEFAULT_IIS_PATH = os.environ.get('SMARTUPDATER_IIS_PATH', 'infeasible.ilp')
+
+_thread_local = threading.local()
+
+
+class SolverError(Exception):
+    pass
+
+
+def get_env():
+    import gurobipy as gp
+    # Gurobi 环境不能跨线程共享，每个线程各建一个并复用
+    env = getattr(_thread_local, 'env', None)
+    if env is None:
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+        _thread_local.env = env
+    return env
+
+
+def _env_number(name, cast):
+    value = os.environ.get(name)
+    return cast(value) if value else None
+
+
+def relative_gap(objective, bound):
+    """
+    |objective - bound| / |objective| as Gurobi reports MIPGap (0 when both
+    are 0, None without an incumbent or bound).
+    """
+    if objective is None or bound is None:
+        return None
+    if objective == bound:
+        return 0.0
+    return abs(objective - bound) / max(abs(objective), 1e-10)
+
+
+def print_progress(progress):
+    """
+    An on_progress that prints a line per event, to stdout (the run.log of
+    a batch worker).
+    """
+    def number(value):
+        return '-' if value is None else f"{value:.6g}"
+    gap = '-' if progress['gap'] is None else f"{progress['gap']:.2%}"
+    print(f"Solver progress: {progress['runtime']:.2f}s, objective {number(progress['objective'])}, "
+          f"bound {number(progress['bound'])}, gap {gap}, {progress['nodes']} nodes", flush=True)
+
+
+class SolveProfile(object):
+    """
+    Budgets and reporting of one solve: time_limit (seconds), mip_gap
+    (relative gap at which the solver may stop), threads, verbose (show the
+    solver log), on_progress, a callable given a progress dict (runtime,
+    objective, bound, gap, nodes) whenever the incumbent or the bound
+    improves, and iis_path, where Gurobi writes the IIS of an infeasible
+    model (None: no IIS). Budgets left at None use the solver's defaults.
+    """
+
+    def __init__(self, time_limit=None, mip_gap=None, threads=None, verbose=False, on_progress=None,
+                 iis_path=DEFAULT_IIS_PATH):
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
+        self.threads = threads
+        self.verbose = verbose
+        self.on_progress = on_progress
+        self.iis_path = iis_path
+        self._last = None
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """
+        A profile with budgets from SMARTUPDATER_TIME_LIMIT,
+        SMARTUPDATER_MIP_GAP and SMARTUPDATER_THREADS; SMARTUPDATER_SOLVER_LOG=1
+        shows the solver log and prints the progress. Keyword arguments
+        override them.
+        """
+        solver_log = os.environ.get('SMARTUPDATER_SOLVER_LOG', '0') != '0'
+        options = {'time_limit': _env_number('SMARTUPDATER_TIME_LIMIT', float),
+                   'mip_gap': _env_number('SMARTUPDATER_MIP_GAP', float),
+                   'threads': _env_number('SMARTUPDATER_THREADS', int),
+                   'verbose': solver_log,
+                   'on_progress': print_progress if solver_log else None}
+        options.update(kwargs)
+        return cls(**options)
+
+    def report(self, runtime, objective, bound, nodes):
+        if self.on_progress is None or (objective, bound) == self._last:
+            return
+        self._last = (objective, bound)
+        self.on_progress({'runtime': runtime, 'objective': objective, 'bound': bound,
+                          'gap': relative_gap(objective, bound), 'nodes': nodes})
+
+
+class SolverBackend(object):
+    """
+    Solves a linear partition model given in matrix form (see
+    optimization_partition.PartitionMILP): minimize obj @ v subject to
+    A v (sense) rhs, lb <= v <= ub, v[binary] in {0, 1}. Senses are '<',
+    '>' and '='.
+    """
+
+    name = None
+
+    def solve(self, milp, start=None, profile=None):
+        """
+        Solve, optionally from a start vector (a feasible solution to warm
+        start from) and within the budgets of a SolveProfile. Returns a dict
+        with status (OPTIMAL, FEASIBLE, INFEASIBLE or NO_SOLUTION), the
+        objective value and best bound (None if unknown), the relative gap,
+        the number of branch-and-bound nodes, the build and solve times and
+        the column values (None without a solution).
+        """
+        raise NotImplementedError
+
+
+class GurobiBackend(SolverBackend):
+
+    name = 'gurobi'
+
+    def build(self, milp):
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        m = gp.Model("mip1", env=get_env())
+        m.Params.OutputFlag = 0
+        vtype = np.where(milp.binary, GRB.BINARY, GRB.CONTINUOUS)
+        columns = m.addMVar(milp.n_cols, lb=milp.lb, ub=milp.ub, obj=milp.obj, vtype=vtype,
+                            name=np.array(milp.col_names))
+        if milp.A.shape[0]:
+            constrs = m.addMConstr(milp.A, columns, milp.sense, milp.rhs)
+            m.setAttr("ConstrName", constrs.tolist(), milp.row_names)
+        m.ModelSense = GRB.MINIMIZE
+        return m, columns
+
+    def solve_model(self, m, profile=None):
+        """
+        Optimize a model already built in Gurobi (the quadratic reference
+        models too).
+        """
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        profile = profile or SolveProfile()
+
+        def finite(value):
+            # 还没有解或界时 Gurobi 报告 ±GRB.INFINITY
+            return value if abs(value) < GRB.INFINITY else None
+
+        def callback(model, where):
+            if where == GRB.Callback.MIPSOL:
+                # MIPSOL_OBJBST 是找到这个解之前的最优值，新解的目标值是 MIPSOL_OBJ
+                profile.report(model.cbGet(GRB.Callback.RUNTIME), finite(model.cbGet(GRB.Callback.MIPSOL_OBJ)),
+                               finite(model.cbGet(GRB.Callback.MIPSOL_OBJBND)),
+                               int(model.cbGet(GRB.Callback.MIPSOL_NODCNT)))
+            elif where == GRB.Callback.MIP:
+                profile.report(model.cbGet(GRB.Callback.RUNTIME), finite(model.cbGet(GRB.Callback.MIP_OBJBST)),
+                               finite(model.cbGet(GRB.Callback.MIP_OBJBND)), int(model.cbGet(GRB.Callback.MIP_NODCNT)))
+
+        try:
+            m.Params.OutputFlag = int(profile.verbose)
+            if profile.time_limit is not None:
+                m.Params.TimeLimit = profile.time_limit
+            if profile.mip_gap is not None:
+                m.Params.MIPGap = profile.mip_gap
+            if profile.threads is not None:
+                m.Params.Threads = profile.threads
+            m.optimize(callback if profile.on_progress is not None else None)
+        except gp.GurobiError as e:
+            raise SolverError('Error code ' + str(e.errno) + ': ' + str(e)) from e
+
+        result = {'status': NO_SOLUTION, 'objective': None, 'bound': None, 'gap': None, 'nodes': 0,
+                  'runtime': m.Runtime}
+        if m.IsMIP:
+            result['nodes'] = int(m.NodeCount)
+        if m.status == GRB.Status.OPTIMAL:
+            result.update(status=OPTIMAL, objective=m.ObjVal)
+
+        elif m.SolCount > 0:
+            result.update(status=FEASIBLE, objective=m.ObjVal)
+
+        elif m.status == GRB.Status.INFEASIBLE:
+            result['status'] = INFEASIBLE
+            if profile.iis_path:
+                print('The model is infeasible. Calculating IIS...')
+                m.computeIIS()
+                m.write(profile.iis_path)
+            else:
+                print('The model is infeasible.')
+
+        else:
+            print('The model has not been optimized or no solution was found.')
+
+        if result['objective'] is not None:
+            result['bound'] = m.ObjBound if m.IsMIP else result['objective']
+            result['gap'] = relative_gap(result['objective'], result['bound'])
+        return result
+
+    def solve(self, milp, start=None, profile=None):
+        import gurobipy as gp
+
+        build_start = time.perf_counter()
+        try:
+            m, columns = self.build(milp)
+            if start is not None:
+                columns.Start = start
+        except gp.GurobiError as e:
+            raise SolverError('Error code ' + str(e.errno) + ': ' + str(e)) from e
+        build_time = time.perf_counter() - build_start
+        result = self.solve_model(m, profile)
+        result['build_time'] = build_time
+        result['values'] = columns.X if result['status'] in (OPTIMAL, FEASIBLE) else None
+        return result
+
+
+class HighsBackend(SolverBackend):
+
+    name = 'highs'
+
+    def solve(self, milp, start=None, profile=None):
+        try:
+            import highspy
+        except ImportError as e:
+            raise SolverError("The HiGHS backend needs highspy (pip install highspy)") from e
+
+        profile = profile or SolveProfile()
+        build_start = time.perf_counter()
+        h = highspy.Highs()
+        h.setOptionValue('output_flag', bool(profile.verbose))
+        if profile.time_limit is not None:
+            h.setOptionValue('time_limit', float(profile.time_limit))
+        if profile.mip_gap is not None:
+            h.setOptionValue('mip_rel_gap', float(profile.mip_gap))
+        if profile.threads is not None:
+            h.setOptionValue('threads', int(profile.threads))
+        if profile.on_progress is not None:
+            def progress(event):
+                data = event.data_out
+                objective = data.mip_primal_bound
+                profile.report(data.running_time, objective if abs(objective) < highspy.kHighsInf else None,
+                               data.mip_dual_bound, int(data.mip_node_count))
+            h.cbMipImprovingSolution.subscribe(progress)
+            h.cbMipLogging.subscribe(progress)
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = milp.n_cols
+        lp.num_row_ = milp.A.shape[0]
+        lp.col_cost_ = milp.obj
+        lp.col_lower_ = milp.lb
+        lp.col_upper_ = np.where(np.isinf(milp.ub), highspy.kHighsInf, milp.ub)
+        lp.row_lower_ = np.where(milp.sense == '<', -highspy.kHighsInf, milp.rhs)
+        lp.row_upper_ = np.where(milp.sense == '>', highspy.kHighsInf, milp.rhs)
+        A = milp.A.tocsc()
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        lp.integrality_ = [highspy.HighsVarType.kInteger if binary else highspy.HighsVarType.kContinuous
+                           for binary in milp.binary]
+
+        if h.passModel(lp) == highspy.HighsStatus.kError:
+            raise SolverError("HiGHS rejected the partition model")
+        if start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = np.asarray(start, dtype=float)
+            solution.value_valid = True
+            h.setSolution(solution)
+        solve_start = time.perf_counter()
+        h.run()
+        status = h.getModelStatus()
+        info = h.getInfo()
+
+        result = {'status': NO_SOLUTION, 'objective': None, 'bound': None, 'gap': None,
+                  'nodes': max(int(info.mip_node_count), 0), 'runtime': time.perf_counter() - solve_start,
+                  'build_time': solve_start - build_start, 'values': None}
+        if status == highspy.HighsModelStatus.kOptimal:
+            result.update(status=OPTIMAL, objective=info.objective_function_value,
+                          values=np.array(h.getSolution().col_value))
+        elif info.primal_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible:
+            result.update(status=FEASIBLE, objective=info.objective_function_value,
+                          values=np.array(h.getSolution().col_value))
+        elif status == highspy.HighsModelStatus.kInfeasible:
+            result['status'] = INFEASIBLE
+            print('The model is infeasible.')
+        else:
+            print('The model has not been optimized or no solution was found.')
+
+        if result['objective'] is not None:
+            # 没有整数变量时 HiGHS 只解 LP，不报告 MIP 界
+            result['bound'] = info.mip_dual_bound if milp.binary.any() else result['objective']
+            result['gap'] = relative_gap(result['objective'], result['bound'])
+        return result
+
+
+class CbcBackend(SolverBackend):
+
+    name = 'cbc'
+
+    def solve(self, milp, start=None, profile=None):
+        try:
+            import pulp
+        except ImportError as e:
+            raise SolverError("The CBC backend needs PuLP (pip install pulp)") from e
+
+        profile = profile or SolveProfile()
+        time_limit = profile.time_limit
+        build_start = time.perf_counter()
+        problem = pulp.LpProblem("mip1", pulp.LpMinimize)
+        columns = [pulp.LpVariable(f"v{k}", lowBound=milp.lb[k], upBound=None if np.isinf(milp.ub[k]) else milp.ub[k],
+                                   cat=pulp.LpInteger if milp.binary[k] else pulp.LpContinuous)
+                   for k in range(milp.n_cols)]
+        if start is not None:
+            for column, value in zip(columns, np.asarray(start).tolist()):
+                column.setInitialValue(value)
+        problem += pulp.lpSum(coeff * columns[k] for k, coeff in enumerate(milp.obj.tolist()) if coeff)
+
+        A = milp.A.tocsr()
+        senses = {'<': pulp.LpConstraintLE, '>': pulp.LpConstraintGE, '=': pulp.LpConstraintEQ}
+        for row in range(A.shape[0]):
+            lo, hi = A.indptr[row], A.indptr[row + 1]
+            expr = pulp.LpAffineExpression(zip((columns[k] for k in A.indices[lo:hi]), A.data[lo:hi].tolist()))
+            problem += pulp.LpConstraint(expr, senses[milp.sense[row]], f"r{row}", float(milp.rhs[row]))
+
+        solve_start = time.perf_counter()
+        problem.solve(pulp.PULP_CBC_CMD(msg=bool(profile.verbose), warmStart=start is not None, timeLimit=time_limit,
+                                        gapRel=profile.mip_gap, threads=profile.threads))
+
+        # PuLP 不提供回调和节点数、界，只能在求解结束后报告一次
+        result = {'status': NO_SOLUTION, 'objective': None, 'bound': None, 'gap': None, 'nodes': None,
+                  'runtime': time.perf_counter() - solve_start, 'build_time': solve_start - build_start,
+                  'values': None}
+        if problem.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            result.update(status=OPTIMAL if problem.sol_status == pulp.LpSolutionOptimal else FEASIBLE,
+                          objective=pulp.value(problem.objective) or 0.0,
+                          values=np.array([column.varValue or 0.0 for column in columns]))
+            if result['status'] == OPTIMAL and profile.mip_gap is None:
+                result.update(bound=result['objective'], gap=0.0)
+            profile.report(result['runtime'], result['objective'], result['bound'], None)
+        elif problem.status == pulp.LpStatusInfeasible and (time_limit is None or result['runtime'] < time_limit):
+            # 超时且没有解时 CBC 同样报告 Infeasible
+            result['status'] = INFEASIBLE
+            print('The model is infeasible.')
+        else:
+            print('The model has not been optimized or no solution was found.')
+        return result
+
+
+BACKENDS = {backend.name: backend for backend in (GurobiBackend, HighsBackend, CbcBackend)}
+
+
+def get_backend(backend=None):
+    """
+    A SolverBackend instance from a backend, a name in BACKENDS, or None
+    for SMARTUPDATER_SOLVER (default gurobi).
+    """
+    if isinstance(backend, SolverBackend):
+        return backend
+    name = backend or DEFAULT_SOLVER
+    if name not in BACKENDS:
+        raise SolverError(f"Unknown solver backend: {name} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
@@ -0,0 +1,136 @@
+import os
+import re
+
+SLOT_SIZE = 32
+# 每个子合约的第一个变量都是 address public logicContract，占槽 0 的前 20 字节
+LOGIC_CONTRACT_BYTES = 20
+
+# 生成合约时是否重排变量以紧凑存储
+PACK_SLOTS = os.environ.get('SMARTUPDATER_PACK_SLOTS', '1') != '0'
+
+
+def value_size(type_name):
+    """
+    Bytes a value of an elementary type takes in storage, or SLOT_SIZE for
+    the types that always take whole slots (and the unknown ones).
+    """
+    if type_name in ('bool', 'byte'):
+        return 1
+    if type_name in ('address', 'address payable'):
+        return 20
+    match = re.fullmatch(r'u?int(\d+)|bytes(\d+)', type_name)
+    if match:
+        if match.group(1):
+            return int(match.group(1)) // 8
+        return int(match.group(2))
+    return SLOT_SIZE
+
+
+def is_storage_var(var):
+    # 常量和 immutable 不占存储槽
+    return not var.get('constant', False) and var.get('mutability', 'mutable') == 'mutable'
+
+
+def var_storage(type_node, enums=(), structs=()):
+    """
+    (bytes, slots) of a state variable type: bytes < SLOT_SIZE for the
+    types that can share a slot, and the number of slots of the others.
+    """
+    node_type = type_node['nodeType']
+    if node_type == 'ElementaryTypeName':
+        return value_size(type_node['name']), 1
+    if node_type == 'UserDefinedTypeName':
+        name = type_node.get('namePath', type_node.get('name'))
+        if name in enums:
+            return 1, 1
+        if name in structs:
+            return SLOT_SIZE, 1
+        # 其余用户定义类型是合约或接口，存为地址
+        return 20, 1
+    if node_type == 'ArrayTypeName' and type_node.get('length'):
+        try:
+            length = int(type_node['length'].get('value', type_node['length'].get('number')))
+        except (TypeError, ValueError):
+            return SLOT_SIZE, 1
+        size, slots = var_storage(type_node['baseType'], enums, structs)
+        if size < SLOT_SIZE:
+            per_slot = SLOT_SIZE // size
+            return SLOT_SIZE, -(-length // per_slot)
+        return SLOT_SIZE, length * slots
+    # mapping、动态数组、string 和 bytes 各占一个槽
+    return SLOT_SIZE, 1
+
+
+def slot_layout(state_vars, enums=(), structs=()):
+    """
+    Slot and offset of every state variable of a sub-contract, after
+    logicContract, as solc assigns them: a value goes into the current slot
+    if it fits, and types of a whole slot or more start a new slot and end
+    it. Returns (layout, number of slots).
+    """
+    layout = [{'name': 'logicContract', 'type': 'address', 'slot': 0, 'offset': 0, 'bytes': LOGIC_CONTRACT_BYTES}]
+    slot, used = 0, LOGIC_CONTRACT_BYTES
+    for var in state_vars:
+        if not is_storage_var(var):
+            continue
+        size, slots = var_storage(var['typeName'], enums, structs)
+        if size < SLOT_SIZE and used + size <= SLOT_SIZE:
+            offset = used
+        else:
+            slot, offset = slot + (used > 0), 0
+        layout.append({'name': var['name'], 'type': type_label(var['typeName']), 'slot': slot, 'offset': offset,
+                       'bytes': size if size < SLOT_SIZE else slots * SLOT_SIZE})
+        if size < SLOT_SIZE:
+            used = offset + size
+        else:
+            slot, used = slot + slots, 0
+    return layout, slot + (used > 0)
+
+
+def type_label(type_node):
+    if type_node['nodeType'] == 'ElementaryTypeName':
+        return type_node['name']
+    if type_node['nodeType'] == 'UserDefinedTypeName':
+        return type_node.get('namePath', type_node.get('name'))
+    if type_node['nodeType'] == 'Mapping':
+        return 'mapping'
+    return type_node['nodeType']
+
+
+def pack_state_vars(state_vars, enums=(), structs=()):
+    """
+    Reorder the state variables of a sub-contract so that small values
+    share slots: fill the current slot with the largest value that still
+    fits, and start a new slot only when none does. Variables with an
+    initial value keep their relative order, since later initializers may
+    read earlier ones. The source order is kept unless this saves a slot.
+    """
+    sizes = [var_storage(var['typeName'], enums, structs)[0] if is_storage_var(var) else 0 for var in state_vars]
+    initialized = {i for i, var in enumerate(state_vars) if var.get('value') is not None and is_storage_var(var)}
+    pending = list(range(len(state_vars)))
+    order = []
+    free = SLOT_SIZE - LOGIC_CONTRACT_BYTES
+    while pending:
+        # 有初值的变量只有在之前的有初值变量都放好后才能放
+        first_initialized = next((i for i in pending if i in initialized), None)
+        ready = [i for i in pending if i not in initialized or i == first_initialized]
+        fitting = [i for i in ready if sizes[i] < SLOT_SIZE and sizes[i] <= free]
+        if fitting:
+            chosen = max(fitting, key=lambda i: sizes[i])
+            free -= sizes[chosen]
+        else:
+            whole = [i for i in ready if sizes[i] >= SLOT_SIZE]
+            if whole:
+                # 当前槽已放不下任何就绪的变量，先放占整槽的
+                chosen = whole[0]
+                free = 0
+            else:
+                chosen = max(ready, key=lambda i: sizes[i])
+                free = SLOT_SIZE - sizes[chosen]
+        order.append(chosen)
+        pending.remove(chosen)
+
+    packed = [state_vars[i] for i in order]
+    if slot_layout(packed, enums, structs)[1] < slot_layout(state_vars, enums, structs)[1]:
+        return packed
+    return list(state_vars)
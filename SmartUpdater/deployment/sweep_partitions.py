@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+import json
+import logging
+import multiprocessing
+import numpy as np
+import contract_model
+import solidityVersion
+import optimization_partition
+import solver_backend
+import heuristic_partition
+from cost_model import CostModel
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+log = logging.getLogger()
+
+# 由父进程在 fork 之前设置，子进程直接继承，不必序列化
+_instance = None
+
+
+def load_instance(input_file):
+    with open(input_file, 'r') as f:
+        content = f.read()
+    model = contract_model.build_contract_model(content, solidityVersion.resolve_solc_version(content))
+    if model.contract_ast is None:
+        return None
+    S, T, C = optimization_partition.analyze_contract(model)
+    return S, T, C, [var['name'] for var in model.state_vars]
+
+
+def make_scenarios(N_values, cost_models, backends):
+    scenarios = []
+    for costs in cost_models:
+        for N in N_values:
+            for backend in backends:
+                scenarios.append({'name': f"{costs.name}/N={N}/{backend}", 'N': N, 'costs': costs, 'backend': backend})
+    return scenarios
+
+
+def solve_scenario(scenario):
+    """
+    Runs in a pool worker: solve the partition of _instance for one
+    scenario.
+    """
+    S, T, C = _instance
+    profile = solver_backend.SolveProfile.from_env(iis_path=None)
+    record = {'scenario': scenario['name']}
+    try:
+        result = optimization_partition.solve_partition(S, T, C, scenario['N'], scenario['backend'], profile=profile,
+                                                        costs=scenario['costs'])
+    except solver_backend.SolverError as e:
+        record['error'] = str(e)
+        return record
+    record.update({key: result.get(key) for key in ('status', 'objective', 'gap', 'runtime')})
+    if result['sub_of_group'] is not None:
+        record['sub_of_group'] = np.asarray(result['sub_of_group']).tolist()
+    return record
+
+
+def partition_cost(S, T, C, sub_of_group, N, costs):
+    """
+    Objective of a partition (sub-contract of every co-location group)
+    under the costs of another scenario.
+    """
+    milp = optimization_partition.partition_milp(S, T, C, N, costs)
+    sub = heuristic_partition.first_occupant_order(np.asarray(sub_of_group, dtype=np.int64))
+    return float(milp.start_values(sub) @ milp.obj)
+
+
+def sweep(S, T, C, scenarios, jobs):
+    """
+    Solve every scenario in a pool of forked workers. Returns one record
+    per scenario, plus the cost of every partition found under every
+    scenario (costs[k][s]: partition k under scenario s).
+    """
+    global _instance
+    _instance = (S, T, C)
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(max(1, min(jobs, len(scenarios)))) as pool:
+        records = pool.map(solve_scenario, scenarios)
+
+    partitions = []
+    for record in records:
+        if 'sub_of_group' not in record:
+            continue
+        if record['sub_of_group'] not in partitions:
+            partitions.append(record['sub_of_group'])
+        record['partition'] = partitions.index(record['sub_of_group'])
+    costs = [[partition_cost(S, T, C, sub, scenario['N'], scenario['costs']) for scenario in scenarios]
+             for sub in partitions]
+    return records, partitions, costs
+
+
+def describe_partition(sub_of_group, group, names):
+    subs = {}
+    for i, name in enumerate(names):
+        subs.setdefault(sub_of_group[group[i]], []).append(name)
+    return ' | '.join(', '.join(subs[j]) for j in sorted(subs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve the partition of a contract for several mapping sizes and cost tables")
+    parser.add_argument("contract_source", type=str, help="Path to the Solidity contract source file")
+    parser.add_argument("-N", type=int, nargs='+', default=[13], help="Expected numbers of keys per mapping")
+    parser.add_argument("--costs", type=str, nargs='*', default=[],
+                        help="JSON cost files, each overriding some constants or table entries of the default costs")
+    parser.add_argument("--solvers", type=str, nargs='+', default=[solver_backend.DEFAULT_SOLVER],
+                        choices=sorted(solver_backend.BACKENDS), help="Backends to solve every scenario with")
+    parser.add_argument("--no-default-costs", action="store_true", help="Only use the cost files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of parallel workers")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Write the scenarios and partitions to this JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.contract_source):
+        log.error("Error: The specified contract source file does not exist.")
+        sys.exit(1)
+
+    cost_models = [] if args.no_default_costs else [optimization_partition.DEFAULT_COSTS]
+    cost_models += [CostModel.from_file(path, optimization_partition.DEFAULT_COSTS) for path in args.costs]
+    if not cost_models:
+        log.error("Error: No cost tables to sweep over.")
+        sys.exit(1)
+
+    instance = load_instance(args.contract_source)
+    if instance is None:
+        log.error("Error: No contract definition found.")
+        sys.exit(1)
+    S, T, C, names = instance
+    group = optimization_partition.colocation_components(S, C, len(T))
+
+    scenarios = make_scenarios(args.N, cost_models, args.solvers)
+    log.info("Solving %d scenarios with %d workers", len(scenarios), args.jobs)
+    records, partitions, costs = sweep(S, T, C, scenarios, args.jobs)
+
+    print(f"{'scenario':<32} {'status':>11} {'objective':>14} {'gap':>8} {'time (s)':>9} {'partition':>9}")
+    for record in records:
+        if 'error' in record:
+            print(f"{record['scenario']:<32} {'error':>11} {record['error']}")
+            continue
+        objective = f"{record['objective']:.0f}" if record['objective'] is not None else '-'
+        gap = f"{record['gap']:.2%}" if record['gap'] is not None else '-'
+        partition = f"P{record['partition']}" if 'partition' in record else '-'
+        print(f"{record['scenario']:<32} {record['status']:>11} {objective:>14} {gap:>8} {record['runtime']:>9.3f} {partition:>9}")
+
+    if partitions:
+        # 每个划分在各场景下相对该场景最优成本的最大增幅，越小越稳健
+        costs = np.array(costs)
+        regret = (costs / costs.min(axis=0) - 1).max(axis=1)
+        print()
+        print(f"{'partition':>9} {'worst regret':>13}  sub-contracts")
+        for k, sub in enumerate(partitions):
+            print(f"{'P' + str(k):>9} {regret[k]:>13.2%}  {describe_partition(sub, group, names)}")
+        log.info("Most robust partition: P%d", int(np.argmin(regret)))
+
+    if args.output:
+        for record, scenario in zip(records, scenarios):
+            record.update(N=scenario['N'], costs=scenario['costs'].name, backend=scenario['backend'])
+        with open(args.output, 'w') as f:
+            json.dump({'scenarios': records,
+                       'partitions': [{'sub_of_group': sub, 'sub_contracts': describe_partition(sub, group, names),
+                                       'costs': [float(c) for c in costs[k]]} for k, sub in enumerate(partitions)]},
+                      f, indent=4)
+        log.info("Sweep written to %s", args.output)
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class BitMatrix(object):
+    """
+    0/1 matrix stored row-wise as packed bits (np.packbits), used for the
+    function x state usage matrix S and the state x state initializer
+    relation C. Indexing a row gives an unpacked uint8 array, so S[i][j]
+    reads like the old list of lists.
+    """
+
+    def __init__(self, packed, n_rows, n_cols):
+        self.packed = packed
+        self.shape = (n_rows, n_cols)
+
+    @classmethod
+    def from_dense(cls, dense):
+        dense = np.asarray(dense, dtype=bool)
+        if dense.ndim != 2:
+            dense = dense.reshape(len(dense), -1)
+        return cls(np.packbits(dense, axis=1), dense.shape[0], dense.shape[1])
+
+    @classmethod
+    def from_pairs(cls, rows, cols, n_rows, n_cols):
+        dense = np.zeros((n_rows, n_cols), dtype=bool)
+        dense[np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)] = True
+        return cls.from_dense(dense)
+
+    @classmethod
+    def from_sets(cls, sets, n_cols):
+        rows = [row for row, columns in enumerate(sets) for _ in columns]
+        cols = [col for columns in sets for col in columns]
+        return cls.from_pairs(rows, cols, len(sets), n_cols)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, row):
+        return np.unpackbits(self.packed[row], count=self.shape[1])
+
+    def dense(self):
+        return np.unpackbits(self.packed, axis=1, count=self.shape[1]).astype(bool)
+
+    def row_indices(self, row):
+        return np.flatnonzero(self[row]).tolist()
+
+    def pairs(self):
+        """
+        (row, col) of every set bit, 0-based, in row order.
+        """
+        # 只展开非零的字节
+        rows, byte_cols = np.nonzero(self.packed)
+        hit, bit = np.nonzero(np.unpackbits(self.packed[rows, byte_cols][:, None], axis=1))
+        return list(zip(rows[hit].tolist(), (byte_cols[hit] * 8 + bit).tolist()))
+
+    def tolist(self):
+        return self.dense().astype(int).tolist()
+
+    def sub_contract_sets(self, var_partition):
+        """
+        Map a state variable -> sub-contract assignment onto the rows: for each
+        row, the set of sub-contracts holding the columns it uses. Unassigned
+        columns are ignored.
+        """
+        n_rows, n_cols = self.shape
+        if not var_partition or n_rows == 0:
+            return [set() for _ in range(n_rows)]
+        var_idx = np.fromiter(var_partition.keys(), dtype=np.intp, count=len(var_partition))
+        sub_idx = np.fromiter(var_partition.values(), dtype=np.intp, count=len(var_partition))
+        placement = np.zeros((sub_idx.max() + 1, n_cols), dtype=bool)
+        placement[sub_idx, var_idx] = True
+        # 每个子合约的变量按行的格式打包，逐行与之按位与
+        masks = np.packbits(placement, axis=1)
+        return [set(np.flatnonzero(np.bitwise_and(masks, row).any(axis=1)).tolist()) for row in self.packed]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import json
+import time
+import logging
+import numpy as np
+import optimization_partition
+import solver_backend
+import contract_model
+import solidityVersion
+from smartupdater_batch import find_sources, DEFAULT_CORPUS
+from benchmark_model_build import random_instance
+
+
+# slither 导入时会给根 logger 加上 handler，需要 force 才能生效
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s', force=True)
+log = logging.getLogger()
+
+FORMULATIONS = ('quadratic', 'linear')
+
+
+def corpus_instances(corpus_dir, limit=None):
+    for source in find_sources(corpus_dir)[:limit]:
+        try:
+            with open(os.path.join(corpus_dir, source), 'r') as f:
+                content = f.read()
+            model = contract_model.build_contract_model(content, solidityVersion.resolve_solc_version(content))
+        except Exception as e:
+            log.warning("%s: %s", source, e)
+            continue
+        if model.contract_ast is None:
+            continue
+        S, T, C = optimization_partition.analyze_contract(model)
+        yield source, S, T, C
+
+
+def random_instances(count, max_states, density, seed):
+    rng = np.random.default_rng(seed)
+    for k in range(count):
+        n_states = int(rng.integers(1, max_states + 1))
+        n_funcs = int(rng.integers(1, max_states + 1))
+        yield f"random-{k}", *random_instance(n_states, n_funcs, density, int(rng.integers(0, 3)), rng)
+
+
+def solve_quadratic(S, T, C, N):
+    m, _, _ = optimization_partition.build_partition_model_matrix(S, T, C, N)
+    return solver_backend.GurobiBackend().solve_model(m)
+
+
+def compare(S, T, C, N, backend=None):
+    record = {'n_states': len(T), 'n_funcs': len(S)}
+    for name in FORMULATIONS:
+        start = time.perf_counter()
+        try:
+            if name == 'quadratic':
+                result = solve_quadratic(S, T, C, N)
+            else:
+                result = optimization_partition.solve_partition(S, T, C, N, backend)
+            record[name] = {'objective': result['objective'], 'status': result['status'],
+                            'solve_time': result['runtime']}
+        except solver_backend.SolverError as e:
+            record[name] = {'error': str(e)}
+        record[name]['time'] = time.perf_counter() - start
+    quadratic, linear = record['quadratic'], record['linear']
+    if 'error' in quadratic or 'error' in linear:
+        record['equal'] = None
+    elif quadratic['objective'] is None or linear['objective'] is None:
+        record['equal'] = quadratic['status'] == linear['status']
+    else:
+        record['equal'] = abs(quadratic['objective'] - linear['objective']) <= 1e-6 * max(1.0, abs(quadratic['objective']))
+    return record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that the linear partition model reaches the same optimum as the quadratic one")
+    parser.add_argument("corpus", type=str, nargs='?', default=DEFAULT_CORPUS,
+                        help="Directory of Solidity sources (default: data/contract-info)")
+    parser.add_argument("--random", type=int, default=0, help="Use N random contracts instead of the corpus")
+    parser.add_argument("--max-states", type=int, default=8, help="Largest random contract")
+    parser.add_argument("--density", type=float, default=0.2, help="Probability that a function uses a state variable")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=None, help="Only check the first N corpus sources")
+    parser.add_argument("-N", type=int, default=13, help="Expected number of keys per mapping")
+    parser.add_argument("--log", type=str, default=None, help="Write one JSON line per contract to this file")
+    parser.add_argument("--solver", type=str, default=None, choices=sorted(solver_backend.BACKENDS),
+                        help="Backend for the linear model (default: $SMARTUPDATER_SOLVER or gurobi)")
+    args = parser.parse_args()
+
+    if args.random:
+        instances = random_instances(args.random, args.max_states, args.density, args.seed)
+    else:
+        instances = corpus_instances(args.corpus, args.limit)
+
+    out = open(args.log, 'w') if args.log else None
+    counts = {'equal': 0, 'different': 0, 'error': 0}
+    totals = {name: 0.0 for name in FORMULATIONS}
+    for source, S, T, C in instances:
+        record = compare(S, T, C, args.N, args.solver)
+        record['source'] = source
+        if out:
+            out.write(json.dumps(record) + '\n')
+        if record['equal'] is None:
+            counts['error'] += 1
+            continue
+        if record['equal']:
+            counts['equal'] += 1
+            for name in FORMULATIONS:
+                totals[name] += record[name]['time']
+        else:
+            counts['different'] += 1
+            log.warning("%s: quadratic %s, linear %s", source, record['quadratic'], record['linear'])
+    if out:
+        out.close()
+
+    log.info("Objectives: %d equal, %d different, %d not compared (solver error)",
+             counts['equal'], counts['different'], counts['error'])
+    if counts['equal'] and totals['linear'] > 0:
+        log.info("Time over the equal ones: quadratic %.3fs, linear %.3fs, speedup %.2fx",
+                 totals['quadratic'], totals['linear'], totals['quadratic'] / totals['linear'])
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'SMARTUPDATER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'smartupdater'))
+DEFAULT_MAX_BYTES = int(os.environ.get('SMARTUPDATER_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+CACHE_ENABLED = os.environ.get('SMARTUPDATER_CACHE', '1') != '0'
+
+
+class DiskCache(object):
+    """
+    Content-addressed JSON store on disk, bounded by total size.
+
+    Entries are files named by their key; reading an entry refreshes its
+    mtime, so eviction (oldest mtime first) is least-recently-used. Writes go
+    through a temporary file and os.replace, so several processes may share
+    one directory.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, enabled=CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, (str, bytes)):
+                part = json.dumps(part, sort_keys=True)
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            digest.update(hashlib.sha256(part).digest())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def get_raw(self, key):
+        """
+        The stored JSON document as bytes, without parsing it.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path, None)
+        except OSError:
+            data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, value):
+        self.put_raw(key, json.dumps(value).encode('utf-8'))
+
+    def put_raw(self, key, data):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # 其他进程可能同时写入/淘汰，因此以磁盘上的实际大小为准
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'max_bytes': self.max_bytes,
+        }
+
+
+ast_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, 'ast'))
+
+
+def source_key(source, solc_version, options):
+    """
+    Cache key for a compiler output: (sha256 of source, solc version, output options).
+    """
+    return DiskCache.make_key(source, str(solc_version), options)
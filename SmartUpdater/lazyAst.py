@@ -0,0 +1,262 @@
+import json
+from collections.abc import Mapping
+import numpy as np
+
+WHITESPACE = b' \t\r\n'
+
+# RawNode 预先读取的标量字段，其余字段在首次访问时才解析
+HEADER_KEYS = ('nodeType', 'name', 'id', 'contractKind')
+
+
+class JSONBuffer(object):
+    """
+    Structural index over a JSON document held as bytes.
+
+    A vectorized pass, chunk by chunk, records the position and nesting
+    depth of every bracket, comma and colon outside strings; containers can
+    then be split into their members without building any Python objects,
+    and only the ranges that are asked for are handed to json.loads.
+    """
+
+    CHUNK = 1 << 20
+
+    def __init__(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.data = data
+        positions = []
+        depths = []
+        in_string = 0
+        depth = 0
+        for offset in range(0, len(data), self.CHUNK):
+            b = np.frombuffer(data, dtype=np.uint8, count=min(self.CHUNK, len(data) - offset), offset=offset)
+            quotes = b == ord('"')
+            # 前面有奇数个反斜杠的引号是转义的
+            after_backslash = np.empty(len(b), dtype=bool)
+            after_backslash[0] = offset > 0 and data[offset - 1] == ord('\\')
+            after_backslash[1:] = b[:-1] == ord('\\')
+            for i in np.flatnonzero(quotes & after_backslash):
+                j = offset + i - 1
+                while j >= 0 and data[j] == ord('\\'):
+                    j -= 1
+                if (offset + i - j - 1) % 2:
+                    quotes[i] = False
+            parity = np.bitwise_xor.accumulate(quotes.view(np.uint8)) ^ in_string
+            in_string = int(parity[-1])
+            structural = parity == 0
+
+            opens = ((b == ord('{')) | (b == ord('['))) & structural
+            closes = ((b == ord('}')) | (b == ord(']'))) & structural
+            tokens = np.flatnonzero(opens | closes | (((b == ord(',')) | (b == ord(':'))) & structural))
+            steps = opens[tokens].view(np.int8).astype(np.int32) - closes[tokens].view(np.int8)
+            token_depths = np.cumsum(steps) + depth
+            if len(tokens):
+                depth = int(token_depths[-1])
+            positions.append(tokens + offset)
+            depths.append(token_depths.astype(np.int16))
+
+        # 每个结构字符的位置及其所在深度（左括号计入自身，右括号不计入）
+        self.positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.intp)
+        self.depths = np.concatenate(depths) if depths else np.zeros(0, dtype=np.int16)
+        self.root = self.skip_whitespace(0)
+
+    def skip_whitespace(self, pos):
+        while pos < len(self.data) and self.data[pos] in WHITESPACE:
+            pos += 1
+        return pos
+
+    def _token(self, pos):
+        return int(np.searchsorted(self.positions, pos))
+
+    def end(self, start):
+        """
+        Index just past the container opened at start.
+        """
+        k = self._token(start)
+        if k >= len(self.positions) or self.positions[k] != start or self.data[start] not in b'{[':
+            raise ValueError(f"No JSON container at offset {start}")
+        level = self.depths[k]
+        chunk = 1 << 16
+        k += 1
+        while k < len(self.depths):
+            found = np.flatnonzero(self.depths[k:k + chunk] < level)
+            if len(found):
+                return int(self.positions[k + int(found[0])]) + 1
+            k += chunk
+        raise ValueError("Unterminated JSON container")
+
+    def _separators(self, start, end):
+        lo, hi = np.searchsorted(self.positions, [start, end])
+        level = self.depths[lo]
+        seps = self.positions[lo:hi][self.depths[lo:hi] == level].tolist()
+        return [sep for sep in seps if self.data[sep] in b',:']
+
+    def items(self, start):
+        """
+        Key -> (value start, value end) for the object at start.
+        """
+        end = self.end(start)
+        items = {}
+        key_start = start + 1
+        colon = None
+        for sep in self._separators(start, end) + [end - 1]:
+            if colon is None and sep != end - 1 and self.data[sep] == ord(':'):
+                colon = sep
+                continue
+            if colon is not None:
+                key = json.loads(self.data[key_start:colon])
+                items[key] = (self.skip_whitespace(colon + 1), sep)
+            key_start = sep + 1
+            colon = None
+        return items
+
+    def elements(self, start):
+        """
+        (start, end) of every element of the array at start.
+        """
+        end = self.end(start)
+        bounds = [start] + self._separators(start, end) + [end - 1]
+        elements = []
+        for lo, hi in zip(bounds, bounds[1:]):
+            lo = self.skip_whitespace(lo + 1)
+            if lo < hi:
+                elements.append((lo, hi))
+        return elements
+
+    def load(self, value_range):
+        start, end = value_range
+        return json.loads(self.data[start:end])
+
+    def header(self, start):
+        if self.data[start] != ord('{'):
+            return {}
+        return {key: self.load(value_range) for key, value_range in self.items(start).items() if key in HEADER_KEYS}
+
+
+class RawNode(Mapping):
+    """
+    An AST node kept as an unparsed byte range. nodeType, name and id are
+    read up front, so scans over a node list stay cheap; any other key
+    parses the node in full and keeps the result.
+    """
+
+    def __init__(self, data, start, end, header):
+        self._data = data
+        self._range = (start, end)
+        self._header = header
+        self._node = None
+
+    def load(self):
+        if self._node is None:
+            start, end = self._range
+            self._node = json.loads(self._data[start:end])
+            self._data = None
+        return self._node
+
+    def __getitem__(self, key):
+        if self._node is None and key in self._header:
+            return self._header[key]
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+    def __repr__(self):
+        return f"RawNode({self._header.get('nodeType')} {self._header.get('name', '')})"
+
+
+def load_ast(buffer, start, contract_name=None):
+    """
+    Materialize a SourceUnit AST except for its nodes: pragmas and the
+    selected ContractDefinition (contract_name, or the first one) are
+    parsed, everything else stays a RawNode.
+    """
+    ast = {}
+    for key, value_range in buffer.items(start).items():
+        if key != 'nodes':
+            ast[key] = buffer.load(value_range)
+            continue
+        nodes = []
+        selected = None
+        for element in buffer.elements(value_range[0]):
+            header = buffer.header(element[0])
+            node_type = header.get('nodeType')
+            if node_type == 'ContractDefinition' and selected is None and \
+                    (contract_name is None or header.get('name') == contract_name):
+                selected = header.get('name')
+                nodes.append(buffer.load(element))
+            elif node_type == 'PragmaDirective':
+                nodes.append(buffer.load(element))
+            else:
+                nodes.append(RawNode(buffer.data, element[0], element[1], header))
+        ast['nodes'] = nodes
+    return ast
+
+
+class LazyOutput(object):
+    """
+    solc --standard-json output read through a JSONBuffer.
+    """
+
+    def __init__(self, data):
+        self.buffer = JSONBuffer(data)
+        self._root = self.buffer.items(self.buffer.root)
+
+    @property
+    def data(self):
+        return self.buffer.data
+
+    def errors(self):
+        if 'errors' not in self._root:
+            return []
+        return self.buffer.load(self._root['errors'])
+
+    def ast_range(self, source_name):
+        if 'sources' not in self._root:
+            return None
+        sources = self.buffer.items(self._root['sources'][0])
+        if source_name not in sources:
+            return None
+        return self.buffer.items(sources[source_name][0]).get('ast')
+
+    def source_ast(self, source_name, contract_name=None):
+        ast_range = self.ast_range(source_name)
+        if ast_range is None:
+            return None
+        return load_ast(self.buffer, ast_range[0], contract_name)
+
+    def contract(self, source_name, contract_name):
+        if 'contracts' not in self._root:
+            return {}
+        contracts = self.buffer.items(self._root['contracts'][0])
+        if source_name not in contracts:
+            return {}
+        compiled = self.buffer.items(contracts[source_name][0])
+        if contract_name not in compiled:
+            return {}
+        return self.buffer.load(compiled[contract_name])
+
+    def to_output(self, source_name, contract_name=None):
+        """
+        A dict shaped like the standard-json output holding only the selected
+        source's AST and the selected contract's compiled outputs.
+        """
+        ast = self.source_ast(source_name, contract_name)
+        if ast is None:
+            return {'errors': self.errors(), 'sources': {}, 'contracts': {}}
+        if contract_name is None:
+            contract_name = next((node['name'] for node in ast['nodes']
+                                  if not isinstance(node, RawNode) and node['nodeType'] == 'ContractDefinition'), None)
+        return {
+            'errors': self.errors(),
+            'sources': {source_name: {'ast': ast}},
+            'contracts': {source_name: {contract_name: self.contract(source_name, contract_name)}},
+        }
+
+
+def load_ast_bytes(data, contract_name=None):
+    buffer = JSONBuffer(data)
+    return load_ast(buffer, buffer.root, contract_name)
@@ -2,10 +2,12 @@ import sys
 import os
 import re
 import json
-from solcx import compile_standard, install_solc,get_installed_solc_versions
 import solidityVersion
 from packaging import version
 import smartupdater_D
+import optimization_partition
+import key_counts
+import cost_model
 
 
 def load_sub_state_vars_info(contract_name):
@@ -21,10 +23,85 @@ def load_mappings(contract_name):
     return var_mapping, func_mapping
 
 
-def apply_requirements_to_sub_state_contracts(contract_name, requirements):
+def load_state_var_types(contract_name, sub_state_idxs):
+    # 部署时的类型描述（mapping 不区分键值类型），与划分模型的成本表一致；同时返回子合约的编译器版本
+    files = [f"{contract_name}State{idx}.sol" for idx in sub_state_idxs]
+    codes = []
+    for sub_contract_file in files:
+        with open(sub_contract_file, 'r') as f:
+            codes.append(f.read())
+    solidityVersion.prefetch_solidity_asts(codes)
+
+    var_types = {}
+    for content in codes:
+        ast = solidityVersion.parse_solidity_code_with_solc(content)
+        for node in ast['nodes']:
+            if node['nodeType'] != 'ContractDefinition':
+                continue
+            for sub_node in node['nodes']:
+                if sub_node['nodeType'] == 'VariableDeclaration':
+                    var_types[sub_node['name']] = optimization_partition.get_type_description(sub_node['typeName'])
+    return var_types, solidityVersion.resolve_solc_version(codes[0])
+
+
+def place_inserted_vars(contract_name, requirements, sub_state_vars_info, N=13, mapping_key_counts=None,
+                        cost_model_file=None):
+    """
+    Sub-state contract of every INSERTed variable, chosen by the partition
+    cost model with the deployed variables kept where they are (see
+    optimization_partition.place_new_states). Mappings have N keys unless
+    mapping_key_counts has an estimate; costs are calibrated from
+    cost_model_file, as in deployment, if given. Returns {} if no placement
+    was found, and the variables then go to the first sub-state contract.
+    """
+    inserted = [req for req in requirements if req['action'] == 'INSERT']
+    deleted = {req['name'] for req in requirements if req['action'] == 'DELETE'}
+    # 本批次中会被清空删除的子合约不再接收新变量
+    subs = sorted(int(idx) for idx, names in sub_state_vars_info.items() if set(names) - deleted)
+    if not inserted or not subs:
+        return {}
+
+    var_types, solc_version = load_state_var_types(contract_name, subs)
+    costs = None
+    if cost_model_file:
+        try:
+            costs = cost_model.CostModel.calibrated(cost_model_file, solc_version, optimization_partition.DEFAULT_COSTS)
+        except (OSError, ValueError) as e:
+            print(f"Error loading the cost model: {e}, inserting into the first sub-state contract.")
+            return {}
+    names, T, layout = [], [], []
+    for j, idx in enumerate(subs):
+        for var_name in sub_state_vars_info[str(idx)]:
+            if var_name not in deleted:
+                names.append(var_name)
+                T.append(var_types.get(var_name, 'unknown'))
+                layout.append(j)
+    for req in inserted:
+        names.append(req['name'])
+        T.append('mapping' if req['type'].startswith('mapping') else req['type'])
+        layout.append(-1)
+    N = key_counts.key_count_vector([{'name': name} for name in names], mapping_key_counts, N)
+
+    result = optimization_partition.place_new_states(T, layout, N, costs=costs)
+    if result is None:
+        return {}
+    print(f"Placed {len(inserted)} inserted variables ({result['status']}, migration {result['objective']:.0f}, "
+          f"{result['runtime']:.3f}s)")
+    return {req['name']: subs[j] for req, j in zip(inserted, result['sub_of_new'].tolist())}
+
+
+def apply_requirements_to_sub_state_contracts(contract_name, requirements, reoptimize=False, N=13,
+                                              mapping_key_counts=None, cost_model_file=None):
     sub_state_vars_info = load_sub_state_vars_info(contract_name)
     var_mapping, func_mapping = load_mappings(contract_name)
 
+    placement = {}
+    if reoptimize:
+        placement = place_inserted_vars(contract_name, requirements, sub_state_vars_info, N, mapping_key_counts,
+                                        cost_model_file)
+
+    prefetch_sub_contract_asts(contract_name, requirements, sub_state_vars_info, var_mapping, placement)
+
     sub_contracts_to_delete = set()
 
     # 对每个需求，应用更改到子状态和子逻辑合约
@@ -70,7 +147,7 @@ def apply_requirements_to_sub_state_contracts(contract_name, requirements):
             else:
                 print(f"Variable '{old_name}' not found in any sub-state contract.")
         elif req['action'] == 'INSERT':
-            first_sub_state_idx = min(int(idx) for idx in sub_state_vars_info.keys())
+            first_sub_state_idx = placement.get(req['name'], min(int(idx) for idx in sub_state_vars_info.keys()))
             sub_contract_name = f"{contract_name}State{first_sub_state_idx}"
             sub_logic_contract_name = f"{contract_name}Logic{first_sub_state_idx}"
             sub_contract_file = f"{sub_contract_name}.sol"
@@ -111,16 +188,34 @@ def apply_requirements_to_sub_state_contracts(contract_name, requirements):
     with open(f"{contract_name}_sub_state_vars.json", 'w') as f:
         json.dump(sub_state_vars_info, f)
 
+def prefetch_sub_contract_asts(contract_name, requirements, sub_state_vars_info, var_mapping, placement=None):
+    # 一次 solc 调用解析所有受影响的 State/Logic 合约
+    affected = set()
+    for req in requirements:
+        if req['action'] == 'DELETE' and req['name'] in var_mapping:
+            affected.add(f"{contract_name}State{var_mapping[req['name']]}.sol")
+        elif req['action'] == 'UPDATE' and req['old']['name'] in var_mapping:
+            sub_state_idx = var_mapping[req['old']['name']]
+            affected.add(f"{contract_name}State{sub_state_idx}.sol")
+            affected.add(f"{contract_name}Logic{sub_state_idx}.sol")
+        elif req['action'] == 'INSERT' and sub_state_vars_info:
+            first_sub_state_idx = (placement or {}).get(req['name'], min(int(idx) for idx in sub_state_vars_info.keys()))
+            affected.add(f"{contract_name}State{first_sub_state_idx}.sol")
+            affected.add(f"{contract_name}Logic{first_sub_state_idx}.sol")
+
+    codes = []
+    for sub_contract_file in sorted(affected):
+        if os.path.exists(sub_contract_file):
+            with open(sub_contract_file, 'r') as f:
+                codes.append(f.read())
+    if codes:
+        solidityVersion.prefetch_solidity_asts(codes)
+
 def modify_sub_state_contract_delete_var(sub_contract_file, var_name):
 
     with open(sub_contract_file, 'r') as f:
         content = f.read()
 
-    solc_version = extract_solidity_version(content)
-
-    install_solc_version(solc_version)
-
-
     ast = solidityVersion.parse_solidity_code_with_solc(content)
 
     contracts = {}
@@ -155,11 +250,6 @@ def modify_sub_logic_contract_delete_var(sub_logic_contract_file, var_name):
     with open(sub_logic_contract_file, 'r') as f:
         content = f.read()
 
-    solc_version = extract_solidity_version(content)
-    install_solc_version(solc_version)
-
-
-
     ast = solidityVersion.parse_solidity_code_with_solc(content)
 
 
@@ -285,10 +375,6 @@ def modify_sub_state_contract_update_var(sub_contract_file, old_var, new_var):
     with open(sub_contract_file, 'r') as f:
         content = f.read()
 
-    solc_version = extract_solidity_version(content)
-    install_solc_version(solc_version)
-
-
     ast = solidityVersion.parse_solidity_code_with_solc(content)
 
     contracts = {}
@@ -324,11 +410,6 @@ def modify_sub_logic_contract_update_var(sub_logic_contract_file, old_var, new_v
     with open(sub_logic_contract_file, 'r') as f:
         content = f.read()
 
-    solc_version = extract_solidity_version(content)
-    install_solc_version(solc_version)
-
-
-
     ast = solidityVersion.parse_solidity_code_with_solc(content)
 
     contracts = {}
@@ -385,10 +466,6 @@ def modify_sub_state_contract_insert_var(sub_contract_file, req):
     with open(sub_contract_file, 'r') as f:
         content = f.read()
 
-    solc_version = extract_solidity_version(content)
-    install_solc_version(solc_version)
-
-
     ast = solidityVersion.parse_solidity_code_with_solc(content)
 
     contracts = {}
@@ -424,9 +501,6 @@ def modify_sub_logic_contract_insert_var(sub_logic_contract_file, req):
     with open(sub_logic_contract_file, 'r') as f:
         content = f.read()
 
-    solc_version = extract_solidity_version(content)
-    install_solc_version(solc_version)
-
     ast = solidityVersion.parse_solidity_code_with_solc(content)
 
     contracts = {}
@@ -833,26 +907,8 @@ def get_block_code(block):
         return '{\n' + '\n'.join(statements) + '\n    }'
 
 
-def extract_solidity_version(code):
-
-    pragma_regex = r'pragma\s+solidity\s+[\^\s]?([0-9.]+);'
-    match = re.search(pragma_regex, code)
-    if match:
-        version_spec = match.group(1).strip()
-        version_number = version_spec.lstrip('^').split(' ')[0]
-        return version_number
-    else:
-        raise ValueError("Pragma statement not found in the Solidity code.")
-
-def install_solc_version(solc_version):
-    installed_versions = get_installed_solc_versions()
-    if solc_version not in installed_versions:
-        install_solc(solc_version)
-    else:
-        print(f"solc version {solc_version} is already installed.")
-
-
-def main(argv1,argv2):
+def main(argv1,argv2,reoptimize=False,N=13,key_counts_file=key_counts.DEFAULT_KEY_COUNTS_FILE,
+         cost_model_file=cost_model.DEFAULT_COST_MODEL_FILE):
 
     contract_name = argv1
     require_file = argv2
@@ -863,4 +919,7 @@ def main(argv1,argv2):
 
     requirements = parse_requirements(require_file)
 
-    apply_requirements_to_sub_state_contracts(contract_name, requirements)
+    mapping_key_counts = key_counts.load_key_counts(key_counts_file, contract_name) if key_counts_file else None
+
+    apply_requirements_to_sub_state_contracts(contract_name, requirements, reoptimize, N, mapping_key_counts,
+                                              cost_model_file)
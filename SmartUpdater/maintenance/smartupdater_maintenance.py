@@ -5,6 +5,9 @@ import os
 import logging
 import sys
 import smartupdater_M
+import key_counts
+import cost_model
+from diskCache import ast_cache
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 log = logging.getLogger()
@@ -13,6 +16,13 @@ log = logging.getLogger()
 parser = argparse.ArgumentParser(description="SmartUpdater Command Line Interface for Contract Maintenance")
 parser.add_argument("contract_name", type=str, help="Name of the Solidity contract source file")
 parser.add_argument("requirement_source", type=str, help="Path to the requirement source file")
+parser.add_argument("--reoptimize", action="store_true",
+                    help="Place inserted variables with the partition cost model instead of the first sub-state contract")
+parser.add_argument("-N", type=int, default=13, help="Expected number of keys per mapping")
+parser.add_argument("--key-counts", type=str, default=key_counts.DEFAULT_KEY_COUNTS_FILE,
+                    help="JSON file with the expected number of keys of each mapping (default: $SMARTUPDATER_KEY_COUNTS)")
+parser.add_argument("--cost-model", type=str, default=cost_model.DEFAULT_COST_MODEL_FILE,
+                    help="Calibration file used at deployment (default: $SMARTUPDATER_COST_MODEL)")
 args = parser.parse_args()
 
 if not os.path.exists(args.contract_name+".sol"):
@@ -26,8 +36,9 @@ if not os.path.exists(args.requirement_source):
 log.info("Contract name: %s", args.contract_name)
 log.info("Requirement Source: %s", args.requirement_source)
 
-smartupdater_M.main(args.contract_name,args.requirement_source)
+smartupdater_M.main(args.contract_name,args.requirement_source,args.reoptimize,args.N,args.key_counts,args.cost_model)
 
+log.info("AST cache: %d hits, %d misses", ast_cache.hits, ast_cache.misses)
 log.info("Accomplish！")
 log.info("Exit！")
 
@@ -2,88 +2,365 @@ import subprocess
 import json
 import re
 import os
-import tempfile
-from solcx import install_solc, set_solc_version, get_installed_solc_versions
+import sys
+import argparse
+import threading
+from packaging.version import Version
+from solcx import install_solc, get_installed_solc_versions, get_installable_solc_versions
 from solcx.install import get_executable
-from solcx.exceptions import SolcNotInstalled
+from solcx.exceptions import SolcNotInstalled, SolcError
+from diskCache import ast_cache, source_key
+from lazyAst import LazyOutput, load_ast_bytes
+
+AST_SELECTION = {"*": {"": ["ast"]}}
+
+PRAGMA_REGEX = re.compile(r'pragma\s+solidity\s+([^;]+);')
+COMPARATOR_REGEX = re.compile(r'(\^|~|>=|<=|>|<|=)?\s*v?(\d+(?:\.\d+){0,2})')
+
+# solcx 能够下载的最早版本
+MIN_INSTALLABLE_VERSION = Version('0.4.11')
+
+SOLC_STORE = os.environ.get('SMARTUPDATER_SOLC_STORE')
+SOLC_OFFLINE = os.environ.get('SMARTUPDATER_SOLC_OFFLINE', '0') == '1'
+
+# prefetch_solidity_asts 预先解析的 AST，取用一次后即移除
+_prefetched = {}
+
 
 def extract_solidity_version(code):
     """
-    提取 Solidity 版本号。
+    提取 Solidity 版本约束，例如 '^0.4.24' 或 '>=0.4.22 <0.6.0'。
     """
-    pragma_regex = r'pragma\s+solidity\s+[\^\s]?([0-9.]+);'
-    match = re.search(pragma_regex, code)
+    match = PRAGMA_REGEX.search(code)
     if match:
-        version = match.group(1).strip()
-        print(f"Detected Solidity version specification: {version}")
-        return version
+        spec = re.sub(r'\s*\.\s*', '.', match.group(1).strip())
+        spec = re.sub(r'(\^|~|>=|<=|>|<|=)\s+', r'\1', spec)
+        return ' '.join(spec.split())
     else:
         raise ValueError("Pragma statement not found in the Solidity code.")
 
-def parse_solidity_code_with_solc(code):
-    try:
-        solc_version = extract_solidity_version(code)
 
-        if solc_version not in get_installed_solc_versions():
-            # print(f"Installing solc version {solc_version}...")
-            install_solc(solc_version)
-        else:
-            print(f"solc version {solc_version} is already installed.")
+def _full_version(text):
+    parts = (text.split('.') + ['0', '0'])[:3]
+    return Version('.'.join(parts))
 
 
-        solc_executable = get_executable(solc_version)
-        if not os.path.exists(solc_executable):
-            print(f"Failed to locate the solc executable for version {solc_version}.")
-            return None
-        else:
-            print(f"Using solc executable at: {solc_executable}")
+def parse_version_spec(spec):
+    """
+    Turn a pragma constraint into a list of alternatives, each a list of
+    (operator, Version) bounds. Follows npm semver, which solc uses.
+    """
+    alternatives = []
+    for alternative in spec.split('||'):
+        bounds = []
+        for op, text in COMPARATOR_REGEX.findall(alternative):
+            v = _full_version(text)
+            if op == '^':
+                if v.major > 0:
+                    upper = Version(f'{v.major + 1}.0.0')
+                elif v.minor > 0:
+                    upper = Version(f'0.{v.minor + 1}.0')
+                else:
+                    upper = Version(f'0.0.{v.micro + 1}')
+                bounds += [('>=', v), ('<', upper)]
+            elif op == '~':
+                bounds += [('>=', v), ('<', Version(f'{v.major}.{v.minor + 1}.0'))]
+            else:
+                bounds.append((op or '=', v))
+        if bounds:
+            alternatives.append(bounds)
+    if not alternatives:
+        raise ValueError(f"Unsupported Solidity version constraint: {spec}")
+    return alternatives
 
 
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.sol', delete=False) as temp_file:
-            temp_file.write(code)
-            temp_filename = temp_file.name
+def version_satisfies(v, spec):
+    v = Version(str(v))
+    checks = {
+        '=': lambda a, b: a == b,
+        '>=': lambda a, b: a >= b,
+        '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b,
+        '<': lambda a, b: a < b,
+    }
+    for bounds in parse_version_spec(spec):
+        if all(checks[op](v, bound) for op, bound in bounds):
+            return True
+    return False
 
-        try:
-            # 调用 solc 生成 AST，使用 --ast-compact-json
-            result = subprocess.run(
-                [solc_executable, '--ast-compact-json', temp_filename],
-                capture_output=True,
-                text=True
-            )
 
+def lower_bound(spec):
+    """
+    Smallest version named by the constraint (the version the old code installed).
+    """
+    candidates = [bound for bounds in parse_version_spec(spec) for op, bound in bounds if op in ('=', '>=', '>')]
+    if not candidates:
+        raise ValueError(f"Solidity version constraint has no lower bound: {spec}")
+    return min(candidates)
 
-            if result.returncode != 0:
-                print(f"solc error: {result.stderr}")
-                return None
 
-            # 提取 JSON 部分
-            stdout = result.stdout
+class SolcResolver(object):
+    """
+    Process-wide pragma -> solc binary resolution.
 
-            # 使用正则表达式匹配 JSON 对象
-            match = re.search(r'=======.*=======\s*(\{.*\})', stdout, re.DOTALL)
-            if match:
-                json_content = match.group(1)
+    Resolved constraints are memoized, and the installed-version scan runs
+    once per store. A constraint is satisfied by the lowest installed binary
+    in range before anything is downloaded; in offline mode nothing is.
+    """
+
+    def __init__(self, store=SOLC_STORE, offline=SOLC_OFFLINE):
+        self.store = store
+        self.offline = offline
+        self._resolved = {}
+        self._installed = None
+        self._installable = None
+        self._lock = threading.RLock()
+
+    def installed_versions(self):
+        with self._lock:
+            if self._installed is None:
+                self._installed = sorted(Version(str(v)) for v in get_installed_solc_versions(solcx_binary_path=self.store))
+            return self._installed
+
+    def installable_versions(self):
+        with self._lock:
+            if self._installable is None:
+                try:
+                    self._installable = sorted(Version(str(v)) for v in get_installable_solc_versions())
+                except Exception as e:
+                    print(f"Could not fetch the list of installable solc versions: {e}")
+                    self._installable = []
+            return self._installable
+
+    def install(self, solc_version):
+        solc_version = Version(str(solc_version))
+        with self._lock:
+            if solc_version in self.installed_versions():
+                return solc_version
+            if self.offline:
+                raise SolcNotInstalled(f"solc {solc_version} is not in the local store and offline mode is enabled.")
+            install_solc(solc_version, solcx_binary_path=self.store)
+            self._installed = None
+            return solc_version
+
+    def resolve(self, spec):
+        with self._lock:
+            if spec in self._resolved:
+                return self._resolved[spec]
+
+            matching = [v for v in self.installed_versions() if version_satisfies(v, spec)]
+            if matching:
+                solc_version = matching[0]
+            elif self.offline:
+                raise SolcNotInstalled(f"No solc binary in the local store satisfies '{spec}'.")
             else:
-                print("Failed to extract JSON content from solc output.")
-                return None
+                solc_version = lower_bound(spec)
+                if solc_version < MIN_INSTALLABLE_VERSION or not version_satisfies(solc_version, spec):
+                    candidates = [v for v in self.installable_versions() if version_satisfies(v, spec)]
+                    if not candidates:
+                        raise SolcNotInstalled(f"No installable solc version satisfies '{spec}'.")
+                    solc_version = candidates[0]
+                self.install(solc_version)
 
-            # 解析 AST JSON 输出
-            ast_json = json.loads(json_content)
-            return ast_json
+            self._resolved[spec] = solc_version
+            return solc_version
 
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse AST JSON: {e}")
-            return None
+    def executable(self, solc_version):
+        return str(get_executable(solc_version, solcx_binary_path=self.store))
 
-        finally:
-            os.remove(temp_filename)
+    def prefetch(self, versions):
+        for v in versions:
+            try:
+                self.install(v)
+                print(f"solc {v} is available in the store.")
+            except Exception as e:
+                print(f"Failed to install solc {v}: {e}")
 
-    except ValueError as ve:
-        print(f"Error: {ve}")
-        return None
-    except SolcNotInstalled as sni:
-        print(f"Solc installation error: {sni}")
-        return None
+    def pin_versions(self, specs):
+        """
+        Pick a small set of versions such that every constraint is satisfied by one of them.
+        """
+        specs = set(specs)
+        candidates = set(self.installed_versions()) | set(self.installable_versions())
+        for spec in specs:
+            try:
+                v = lower_bound(spec)
+            except ValueError:
+                continue
+            if v >= MIN_INSTALLABLE_VERSION:
+                candidates.add(v)
+
+        coverage = {v: {s for s in specs if version_satisfies(v, s)} for v in candidates}
+        pins = []
+        uncovered = set(specs)
+        while uncovered:
+            # 优先覆盖最多约束的版本，相同时取较低版本
+            best = max(sorted(coverage), key=lambda v: len(coverage[v] & uncovered), default=None)
+            if best is None or not coverage[best] & uncovered:
+                break
+            pins.append(best)
+            uncovered -= coverage[best]
+        for spec in sorted(uncovered):
+            print(f"No known solc version satisfies '{spec}'.")
+        return sorted(pins)
+
+
+solc_resolver = SolcResolver()
+
+
+def resolve_solc_version(code):
+    """
+    Resolve the pragma of a source file to an installed solc version.
+    """
+    return solc_resolver.resolve(extract_solidity_version(code))
+
+
+def corpus_version_specs(corpus_dir):
+    specs = set()
+    for root, _, files in os.walk(corpus_dir):
+        for name in files:
+            if not name.endswith('.sol'):
+                continue
+            with open(os.path.join(root, name), 'r', errors='ignore') as f:
+                try:
+                    specs.add(extract_solidity_version(f.read()))
+                except ValueError:
+                    continue
+    return specs
+
+
+def compile_standard_json(sources, solc_version, output_selection=None, lazy=False):
+    """
+    Run solc --standard-json over stdin/stdout on several sources at once.
+
+    sources maps a source name to its content. Raises SolcError when solc
+    fails or reports an error. With lazy=True the output is returned as a
+    lazyAst.LazyOutput instead of being parsed in full.
+    """
+    input_json = {
+        "language": "Solidity",
+        "sources": {name: {"content": content} for name, content in sources.items()},
+        "settings": {
+            "outputSelection": output_selection or AST_SELECTION
+        }
+    }
+    command = [solc_resolver.executable(solc_version), '--standard-json']
+    result = subprocess.run(command, input=json.dumps(input_json), capture_output=True, text=True)
+
+    try:
+        output = LazyOutput(result.stdout) if lazy else json.loads(result.stdout)
+        errors = output.errors() if lazy else output.get('errors', [])
+    except ValueError:
+        raise SolcError("solc did not return standard-json output", command=command,
+                        return_code=result.returncode, stderr_data=result.stderr)
+
+    errors = [e for e in errors if e.get('severity') == 'error']
+    if result.returncode != 0 or errors:
+        message = '\n'.join(e.get('formattedMessage', e.get('message', '')) for e in errors) or result.stderr
+        raise SolcError(message, command=command, return_code=result.returncode,
+                        stderr_data=result.stderr, error_dict=errors[0] if errors else None)
+    return output
+
+
+def parse_solidity_sources(sources):
+    """
+    Parse many sources into compact-JSON ASTs with one solc process per
+    compiler version. Cached sources are not sent to solc at all.
+
+    Returns a dict mapping each source name to its AST (None on failure).
+    """
+    asts = {}
+    pending = {}
+    for name, code in sources.items():
+        try:
+            solc_version = resolve_solc_version(code)
+        except (ValueError, SolcNotInstalled) as e:
+            print(f"Error resolving solc for {name}: {e}")
+            asts[name] = None
+            continue
+        cache_key = source_key(code, solc_version, AST_SELECTION)
+        cached_ast = _prefetched.pop(cache_key, None)
+        if cached_ast is None:
+            data = ast_cache.get_raw(cache_key)
+            if data is not None:
+                try:
+                    cached_ast = load_ast_bytes(data)
+                except ValueError:
+                    cached_ast = None
+        if cached_ast is not None:
+            asts[name] = cached_ast
+        else:
+            pending.setdefault(solc_version, {})[name] = (code, cache_key)
+
+    for solc_version, group in pending.items():
+        try:
+            output = compile_standard_json({name: code for name, (code, _) in group.items()}, solc_version, lazy=True)
+        except SolcError as e:
+            if len(group) == 1:
+                print(f"solc error: {e}")
+                asts.update({name: None for name in group})
+                continue
+            # 批量编译失败时逐个编译，定位出错的文件
+            for name, (code, _) in group.items():
+                asts.update(parse_solidity_sources({name: code}))
+            continue
+
+        for name, (_, cache_key) in group.items():
+            # 只解析第一个合约定义及 pragma，其余节点保留为未解析的字节区间
+            ast_range = output.ast_range(name)
+            if ast_range is not None:
+                ast_cache.put_raw(cache_key, output.data[ast_range[0]:ast_range[1]])
+                asts[name] = output.source_ast(name)
+            else:
+                asts[name] = None
+
+    return asts
+
+
+def prefetch_solidity_asts(codes):
+    """
+    Parse a batch of sources ahead of time; later parse_solidity_code_with_solc
+    calls on the same contents are served without starting solc.
+    """
+    asts = parse_solidity_sources({f"Source{i}.sol": code for i, code in enumerate(codes)})
+    for i, code in enumerate(codes):
+        ast_json = asts.get(f"Source{i}.sol")
+        if ast_json is not None:
+            _prefetched[source_key(code, resolve_solc_version(code), AST_SELECTION)] = ast_json
+
+
+def parse_solidity_code_with_solc(code):
+    try:
+        return parse_solidity_sources({"Contract.sol": code})["Contract.sol"]
     except Exception as ex:
         print(f"An unexpected error occurred: {ex}")
         return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prefetch solc compilers into a local store for offline runs")
+    parser.add_argument("--store", type=str, default=SOLC_STORE, help="Directory of the solc binary store (default: ~/.solcx)")
+    parser.add_argument("--corpus", type=str, help="Directory of .sol files whose pragmas should all be satisfiable")
+    parser.add_argument("--versions", nargs='*', default=[], help="Additional solc versions to install")
+    parser.add_argument("--pins", type=str, help="File listing pinned versions; read if it exists, otherwise written")
+    args = parser.parse_args()
+
+    resolver = SolcResolver(store=args.store, offline=False)
+    versions = [Version(v) for v in args.versions]
+
+    if args.pins and os.path.exists(args.pins):
+        with open(args.pins, 'r') as f:
+            versions += [Version(line.strip()) for line in f if line.strip()]
+    elif args.corpus:
+        pins = resolver.pin_versions(corpus_version_specs(args.corpus))
+        versions += pins
+        if args.pins:
+            with open(args.pins, 'w') as f:
+                f.write('\n'.join(str(v) for v in pins) + '\n')
+            print(f"Pinned versions written to {args.pins}")
+
+    if not versions:
+        parser.print_help()
+        sys.exit(1)
+
+    resolver.prefetch(sorted(set(versions)))